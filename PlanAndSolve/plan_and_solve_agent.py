@@ -1,60 +1,137 @@
+import logging
 import sys
 import os
-from typing import List, Optional, Callable
+from typing import Dict, List, Optional, Callable, Union
 from dotenv import load_dotenv
 
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from common.context import ContextManager
 from common.search import serpapi_search_text
-from travel_agent.llm_client import OpenAICompatibleClient
+from common.answer_cache import AnswerCache
+from common.tracing import configure_tracing, span
+from travel_agent.llm_client import AsyncOpenAICompatibleClient, OpenAICompatibleClient, agenerate, create_client, require_sync_client
+from PlanAndSolve.plan_cache import PlanCache
 from PlanAndSolve.planner import Planner
 from PlanAndSolve.solver import Solver
 from PlanAndSolve.prompts import FINAL_ANSWER_PROMPT
+from PlanAndSolve.scheduler import PlanStep, ancestors, arun_plan, run_plan
+
+logger = logging.getLogger(__name__)
+
+FINAL_ANSWER_SYSTEM_PROMPT = "You are a helpful assistant."
 
 class PlanAndSolveAgent:
-    def __init__(self, llm: OpenAICompatibleClient, tools: List[Callable], planner: Optional[Planner] = None, solver: Optional[Solver] = None):
+    def __init__(self, llm: Union[OpenAICompatibleClient, AsyncOpenAICompatibleClient], tools: List[Callable], planner: Optional[Planner] = None, solver: Optional[Solver] = None, context_manager: Optional[ContextManager] = None, max_parallel_steps: int = 4, answer_cache: Optional[AnswerCache] = None):
         self.llm = llm
+        self.context_manager = context_manager if context_manager else ContextManager()
         self.planner = planner if planner else Planner(llm)
-        self.solver = solver if solver else Solver(llm, tools)
+        self.solver = solver if solver else Solver(llm, tools, context_manager=self.context_manager)
+        self.max_parallel_steps = max_parallel_steps
+        # Optional cache of final answers; a hit skips planning and solving
+        self.answer_cache = answer_cache
 
-    def run(self, question: str):
-        # 1. Plan
-        print(f"Original Question: {question}")
-        steps = self.planner.plan(question)
-        if not steps:
-            print("Failed to generate a plan.")
-            return
-
-        # 2. Solve
-        context = ""
-        results = []
-        
-        for i, step in enumerate(steps):
-            print(f"\n--- Executing Step {i+1}: {step} ---")
-            result = self.solver.solve_step(step, context)
-            print(f"Step Result: {result}")
-            
-            context += f"Step {i+1}: {step}\nResult: {result}\n\n"
-            results.append(f"Step {i+1}: {step}\nResult: {result}")
-
-        # 3. Synthesize Final Answer
-        final_prompt = FINAL_ANSWER_PROMPT.format(
+    def _step_context(self, steps: List[PlanStep], step: PlanStep, results: Dict[int, str]) -> str:
+        # A step only sees the results of the steps it (transitively) depends on
+        blocks = [self._format_result(steps[d], results[d]) for d in ancestors(steps, step)]
+        return self.context_manager.fit_blocks(blocks)
+
+    def _format_result(self, step: PlanStep, result: str) -> str:
+        return f"Step {step.index+1}: {step.description}\nResult: {result}\n"
+
+    def _solve(self, steps: List[PlanStep], step: PlanStep, results: Dict[int, str]) -> str:
+        logger.info("\n--- Executing Step %d: %s ---", step.index + 1, step.description)
+        with span("plan.step", index=step.index + 1, depends_on=str(step.depends_on)):
+            result = self.solver.solve_step(step.description, self._step_context(steps, step, results))
+        logger.info("Step %d Result: %s", step.index + 1, result)
+        return self.context_manager.truncate(result)
+
+    async def _asolve(self, steps: List[PlanStep], step: PlanStep, results: Dict[int, str]) -> str:
+        logger.info("\n--- Executing Step %d: %s ---", step.index + 1, step.description)
+        with span("plan.step", index=step.index + 1, depends_on=str(step.depends_on)):
+            result = await self.solver.asolve_step(step.description, self._step_context(steps, step, results))
+        logger.info("Step %d Result: %s", step.index + 1, result)
+        return self.context_manager.truncate(result)
+
+    def _final_prompt(self, question: str, steps: List[PlanStep], results: Dict[int, str]) -> str:
+        return FINAL_ANSWER_PROMPT.format(
             question=question,
-            execution_results="\n".join(results)
+            execution_results=self.context_manager.fit_blocks([self._format_result(step, results[step.index]) for step in steps])
         )
-        final_answer = self.llm.generate(final_prompt, system_prompt="You are a helpful assistant.")
-        return final_answer
+
+    def _cached_answer(self, question: str) -> Optional[str]:
+        if self.answer_cache is None:
+            return None
+        with span("plan_and_solve.answer_cache", question=question):
+            return self.answer_cache.get(question)
+
+    def _store_answer(self, question: str, answer: Optional[str]) -> None:
+        # Client errors come back as "错误:..." strings and must not be cached
+        if self.answer_cache is not None and answer and not answer.startswith("错误"):
+            self.answer_cache.set(question, answer)
+
+    def run(self, question: str):
+        # The async client only works with arun()
+        require_sync_client(self.llm, "PlanAndSolveAgent.run()")
+        cached = self._cached_answer(question)
+        if cached is not None:
+            return cached
+        with span("plan_and_solve.run", question=question) as run_span:
+            # 1. Plan
+            logger.info("Original Question: %s", question)
+            steps = self.planner.plan_graph(question)
+            if not steps:
+                logger.warning("Failed to generate a plan.")
+                run_span.record_error("Failed to generate a plan.")
+                return
+
+            # 2. Solve: independent steps run concurrently, dependents wait for their inputs
+            results = run_plan(steps, lambda step, finished: self._solve(steps, step, finished), self.max_parallel_steps)
+
+            # 3. Synthesize Final Answer
+            final_prompt = self._final_prompt(question, steps, results)
+            final_answer = self.llm.generate(final_prompt, system_prompt=FINAL_ANSWER_SYSTEM_PROMPT)
+            self._store_answer(question, final_answer)
+            return final_answer
+
+    async def arun(self, question: str):
+        # Same pipeline as run(), awaiting the LLM so many runs can share one event loop
+        cached = self._cached_answer(question)
+        if cached is not None:
+            return cached
+        with span("plan_and_solve.run", question=question) as run_span:
+            logger.info("Original Question: %s", question)
+            steps = await self.planner.aplan_graph(question)
+            if not steps:
+                logger.warning("Failed to generate a plan.")
+                run_span.record_error("Failed to generate a plan.")
+                return
+
+            results = await arun_plan(steps, lambda step, finished: self._asolve(steps, step, finished), self.max_parallel_steps)
+
+            final_answer = await agenerate(self.llm, self._final_prompt(question, steps, results), system_prompt=FINAL_ANSWER_SYSTEM_PROMPT)
+            self._store_answer(question, final_answer)
+            return final_answer
 
 if __name__ == "__main__":
     load_dotenv()
-    llm = OpenAICompatibleClient()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    configure_tracing()
+    # LLM_BACKEND=local runs the agent offline on the local transformers model
+    llm = create_client()
     
     def search(query: str):
         """Search the web for the given query."""
         return serpapi_search_text(query)
 
-    agent = PlanAndSolveAgent(llm=llm, tools=[search])
+    # Opt-in: PLAN_CACHE_PATH persists plans, so recurring question shapes skip the planning call
+    plan_cache_path = os.getenv("PLAN_CACHE_PATH")
+    planner = Planner(llm, plan_cache=PlanCache(plan_cache_path) if plan_cache_path else None)
+    # Opt-in: ANSWER_CACHE_PATH persists final answers, so a repeated question is answered instantly
+    answer_cache_path = os.getenv("ANSWER_CACHE_PATH")
+    answer_cache = AnswerCache(answer_cache_path) if answer_cache_path else None
+    agent = PlanAndSolveAgent(llm=llm, tools=[search], planner=planner, answer_cache=answer_cache)
     
     if len(sys.argv) > 1:
         question = sys.argv[1]
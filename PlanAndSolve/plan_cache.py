@@ -0,0 +1,229 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+
+from common.cache import SQLiteCache, make_cache_key
+from common.search import normalize_query
+from common.tracing import annotate
+from PlanAndSolve.scheduler import PlanStep
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single CJK characters; anything else is one token per character
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|[A-Za-z_]+|[\u4e00-\u9fff]|\S")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?？.。!！]+$")
+# A result the planner already computed, e.g. "15 × 2 = 30" or "得到 30"
+_RESULT_RE = re.compile(r"(?:[=＝→]|等于|得到|得出|结果[为是]|\bequals?(?: to)?\b|\bgives\b|\bresults? in\b)\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
+# References to other steps ("the result of step 1", "第1步"), which are not question numbers
+_STEP_REF_RE = re.compile(r"\bsteps?\s*(\d+)|步骤\s*(\d+)|第\s*(\d+)\s*步", re.IGNORECASE)
+
+
+def _grams(text: str, n: int = 3) -> Set[str]:
+    """Character n-grams of the normalized question with numbers masked, so "23*17" and "45*12" look alike."""
+    text = _NUMBER_RE.sub("0", normalize_query(text))
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _tokens(text: str) -> List[Tuple[str, int, int]]:
+    # Trailing punctuation is ignored, as in normalize_query
+    end = len(_TRAILING_PUNCT_RE.sub("", text))
+    return [(m.group().casefold(), m.start(), m.end()) for m in _TOKEN_RE.finditer(text, 0, end)]
+
+
+def _substitute(text: str, replacements: Dict[str, str]) -> str:
+    """Replaces all old spans at once (so swapped values do not clobber each other), case-insensitively."""
+    patterns = []
+    for old in sorted(replacements, key=len, reverse=True):
+        pattern = re.escape(old)
+        # Do not replace "12" inside "123" or "Python" inside "Pythonic" (CJK neighbours are fine)
+        if old[0].isascii() and old[0].isalnum():
+            pattern = r"(?<![A-Za-z0-9_.])" + pattern
+        if old[-1].isascii() and old[-1].isalnum():
+            pattern = pattern + r"(?![A-Za-z0-9_.])"
+        patterns.append(pattern)
+    lookup = {old.casefold(): new for old, new in replacements.items()}
+    return re.sub("|".join(patterns), lambda m: lookup[m.group().casefold()], text, flags=re.IGNORECASE)
+
+
+class _Entry:
+    def __init__(self, question: str, steps: List[Tuple[str, List[int]]], created_at: float):
+        self.question = question
+        self.steps = steps
+        self.created_at = created_at
+        self.grams = _grams(question)
+
+    def to_plan(self, replacements: Optional[Dict[str, str]] = None) -> List[PlanStep]:
+        return [
+            PlanStep(i, _substitute(description, replacements) if replacements else description, depends_on)
+            for i, (description, depends_on) in enumerate(self.steps)
+        ]
+
+
+class PlanCache:
+    """
+    Caches planner output so recurring questions skip the planning LLM call.
+
+    - An exact hit (same question after whitespace / case / trailing punctuation normalization)
+      reuses the plan as is.
+    - Otherwise the most similar cached question is found through a character-trigram index
+      (Jaccard similarity >= threshold, numbers masked). Its plan is used as a template: the
+      spans in which the two questions differ (at most max_substitutions) are substituted in the
+      step descriptions. Words that changed must appear in the plan, otherwise the plan cannot be
+      adapted safely and the planner is called; changed numbers are substituted by position, so
+      "Multiply 23 by 17, then add 5" becomes "Multiply 31 by 12, then add 8" for the new operands.
+      Questions that add or drop words never reuse a plan. Neither do plans that write down a
+      computed result ("15 × 2 = 30"), which would be stale for the new numbers, or whose step
+      references ("step 1") collide with a changed number.
+
+    With path the plans are also stored in SQLite and reloaded on start; ttl (seconds) bounds
+    how long a plan is reused.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 1000,
+        ttl: Optional[float] = None,
+        threshold: float = 0.6,
+        max_substitutions: int = 3,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_substitutions = max_substitutions
+        self.hits = 0
+        self.template_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._index: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.store = SQLiteCache(path, max_entries=max_entries, ttl=ttl, table="plans") if path else None
+        if self.store is not None:
+            for key, value in self.store.items():
+                self._add(key, _Entry(value["question"], [(d, deps) for d, deps in value["steps"]], value["created_at"]))
+
+    def _key(self, question: str) -> str:
+        return make_cache_key(normalize_query(question))
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl is not None and time.time() - entry.created_at > self.ttl
+
+    def _add(self, key: str, entry: _Entry) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        for gram in entry.grams:
+            self._index.setdefault(gram, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        for gram in entry.grams:
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[gram]
+
+    def _candidates(self, question: str) -> List[Tuple[float, str]]:
+        grams = _grams(question)
+        overlap: Counter = Counter()
+        for gram in grams:
+            overlap.update(self._index.get(gram, ()))
+        scored = []
+        for key, shared in overlap.items():
+            similarity = shared / (len(grams) + len(self._entries[key].grams) - shared)
+            if similarity >= self.threshold:
+                scored.append((similarity, key))
+        return sorted(scored, reverse=True)
+
+    def _replacements(self, cached: str, question: str, plan_text: str) -> Optional[Dict[str, str]]:
+        """The spans that differ between the two questions, or None when the plan cannot be adapted."""
+        old_tokens, new_tokens = _tokens(cached), _tokens(question)
+        # Align with numbers masked, so "23 by 17" vs "17 by 23" pairs the numbers by position
+        matcher = SequenceMatcher(
+            None,
+            [_NUMBER_RE.sub("0", t[0]) for t in old_tokens],
+            [_NUMBER_RE.sub("0", t[0]) for t in new_tokens],
+            autojunk=False,
+        )
+        pairs: List[Tuple[str, str]] = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                pairs.extend((old_tokens[i][0], new_tokens[j][0]) for i, j in zip(range(i1, i2), range(j1, j2)))
+            elif tag == "replace":
+                pairs.append((cached[old_tokens[i1][1]:old_tokens[i2 - 1][2]], question[new_tokens[j1][1]:new_tokens[j2 - 1][2]]))
+            else:
+                return None
+        # Results computed from the old inputs ("15 × 2 = 30") would stay wrong after substitution
+        cached_numbers = set(_NUMBER_RE.findall(cached))
+        if any(m.group(1) not in cached_numbers for m in _RESULT_RE.finditer(plan_text)):
+            return None
+        step_refs = {n for m in _STEP_REF_RE.finditer(plan_text) for n in m.groups() if n}
+        replacements: Dict[str, str] = {}
+        plan_folded = plan_text.casefold()
+        for old, new in pairs:
+            if old.casefold() == new.casefold():
+                continue
+            if _NUMBER_RE.fullmatch(old):
+                if old in step_refs:
+                    return None
+            elif old.casefold() not in plan_folded:
+                return None
+            if replacements.setdefault(old.casefold(), new) != new:
+                return None
+        if len(replacements) > self.max_substitutions:
+            return None
+        return replacements
+
+    def get(self, question: str) -> Optional[List[PlanStep]]:
+        """Returns a cached (possibly adapted) plan for question, or None."""
+        key = self._key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                annotate(plan_cache="hit")
+                return entry.to_plan()
+
+            for similarity, candidate in self._candidates(question):
+                entry = self._entries[candidate]
+                if self._expired(entry):
+                    continue
+                replacements = self._replacements(entry.question, question, "\n".join(d for d, _ in entry.steps))
+                if replacements is None:
+                    continue
+                self._entries.move_to_end(candidate)
+                self.template_hits += 1
+                annotate(plan_cache="template", plan_cache_similarity=round(similarity, 3))
+                logger.info("Reusing the cached plan of %r (similarity %.2f)", entry.question, similarity)
+                return entry.to_plan(replacements)
+
+            self.misses += 1
+            annotate(plan_cache="miss")
+            return None
+
+    def set(self, question: str, steps: List[PlanStep]) -> None:
+        if not steps:
+            return
+        key = self._key(question)
+        entry = _Entry(question, [(step.description, step.depends_on) for step in steps], time.time())
+        with self._lock:
+            self._add(key, entry)
+        if self.store is not None:
+            self.store.set(key, {"question": entry.question, "steps": entry.steps, "created_at": entry.created_at})
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,22 +1,88 @@
+import logging
 import re
-from typing import List
-from travel_agent.llm_client import OpenAICompatibleClient
+from typing import List, Optional, Union
+from common.tracing import span
+from travel_agent.llm_client import AsyncOpenAICompatibleClient, OpenAICompatibleClient, agenerate, require_sync_client
+from PlanAndSolve.plan_cache import PlanCache
 from PlanAndSolve.prompts import PLANNER_PROMPT
+from PlanAndSolve.scheduler import PlanStep
+
+logger = logging.getLogger(__name__)
+
+PLANNER_SYSTEM_PROMPT = "You are a strategic planner."
+
+STEP_RE = re.compile(r'\d+\.\s*(.*)')
+DEPENDS_RE = re.compile(r'\s*\(\s*(?:depends on|依赖)\s*[:：]\s*([^)]*)\)\s*$', re.IGNORECASE)
 
 class Planner:
-    def __init__(self, llm: OpenAICompatibleClient):
+    def __init__(self, llm: Union[OpenAICompatibleClient, AsyncOpenAICompatibleClient], plan_cache: Optional[PlanCache] = None):
         self.llm = llm
+        # Reuses plans of identical or same-shaped questions instead of calling the LLM
+        self.plan_cache = plan_cache
 
-    def plan(self, question: str) -> List[str]:
-        prompt = PLANNER_PROMPT.format(question=question)
-        response = self.llm.generate(prompt, system_prompt="You are a strategic planner.")
-        print(f"\n[Planner Output]\n{response}\n")
+    def _parse_plan(self, response: str) -> List[PlanStep]:
+        logger.info("\n[Planner Output]\n%s\n", response)
         
-        # Parse steps
-        steps = []
+        # Parse steps: "1. Step description (depends on: none)"
+        parsed = []
         for line in response.strip().split('\n'):
-            # Match "1. Step description"
-            match = re.match(r'\d+\.\s*(.*)', line)
-            if match:
-                steps.append(match.group(1))
+            match = STEP_RE.match(line)
+            if not match:
+                continue
+            description = match.group(1)
+            depends_match = DEPENDS_RE.search(description)
+            if depends_match:
+                description = description[:depends_match.start()].strip()
+                depends_on = [int(n) - 1 for n in re.findall(r'\d+', depends_match.group(1))]
+            else:
+                depends_on = None
+            parsed.append((description, depends_on))
+
+        # Steps without an annotation conservatively wait for the previous step,
+        # so a plan with no annotations at all runs sequentially as before
+        return [
+            PlanStep(i, description, depends_on if depends_on is not None else [i - 1])
+            for i, (description, depends_on) in enumerate(parsed)
+        ]
+
+    def _cached_plan(self, question: str) -> Optional[List[PlanStep]]:
+        if self.plan_cache is None:
+            return None
+        steps = self.plan_cache.get(question)
+        if steps is not None:
+            logger.info("\n[Cached Plan]\n%s\n", "\n".join(f"{step.index + 1}. {step.description}" for step in steps))
         return steps
+
+    def _store_plan(self, question: str, steps: List[PlanStep]) -> None:
+        if self.plan_cache is not None:
+            self.plan_cache.set(question, steps)
+
+    def plan_graph(self, question: str) -> List[PlanStep]:
+        require_sync_client(self.llm, "Planner.plan_graph()")
+        with span("planner.plan") as plan_span:
+            steps = self._cached_plan(question)
+            if steps is None:
+                prompt = PLANNER_PROMPT.format(question=question)
+                response = self.llm.generate(prompt, system_prompt=PLANNER_SYSTEM_PROMPT)
+                steps = self._parse_plan(response)
+                self._store_plan(question, steps)
+            plan_span.set_attribute("steps", len(steps))
+            return steps
+
+    async def aplan_graph(self, question: str) -> List[PlanStep]:
+        with span("planner.plan") as plan_span:
+            steps = self._cached_plan(question)
+            if steps is None:
+                prompt = PLANNER_PROMPT.format(question=question)
+                response = await agenerate(self.llm, prompt, system_prompt=PLANNER_SYSTEM_PROMPT)
+                steps = self._parse_plan(response)
+                self._store_plan(question, steps)
+            plan_span.set_attribute("steps", len(steps))
+            return steps
+
+    def plan(self, question: str) -> List[str]:
+        require_sync_client(self.llm, "Planner.plan()")
+        return [step.description for step in self.plan_graph(question)]
+
+    async def aplan(self, question: str) -> List[str]:
+        return [step.description for step in await self.aplan_graph(question)]
@@ -3,12 +3,15 @@ You are a planner for a helpful assistant.
 Your job is to break down a complex user question into a step-by-step plan.
 Each step should be a clear, executable instruction.
 Do not execute the steps, just list them.
+After each step, list the earlier steps whose results it needs, or "none" if it can run on its own.
+Independent steps (for example looking up two unrelated facts) should not depend on each other, so they can run in parallel.
 
 User Question: {question}
 
 Output format:
-1. [Step 1]
-2. [Step 2]
+1. [Step 1] (depends on: none)
+2. [Step 2] (depends on: none)
+3. [Step 3] (depends on: 1, 2)
 ...
 """
 
@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, List
+
+
+class PlanStep:
+    """One step of a plan. `depends_on` holds the 0-based indices of earlier steps it needs."""
+
+    def __init__(self, index: int, description: str, depends_on: List[int]):
+        self.index = index
+        self.description = description
+        # Only earlier steps can be dependencies, which keeps the plan acyclic
+        self.depends_on = sorted({d for d in depends_on if 0 <= d < index})
+
+    def __repr__(self) -> str:
+        return f"PlanStep({self.index}, {self.description!r}, depends_on={self.depends_on})"
+
+
+def ancestors(steps: List[PlanStep], step: PlanStep) -> List[int]:
+    """Indices of every step `step` transitively depends on, in plan order."""
+    seen = set()
+    stack = list(step.depends_on)
+    while stack:
+        index = stack.pop()
+        if index not in seen:
+            seen.add(index)
+            stack.extend(steps[index].depends_on)
+    return sorted(seen)
+
+
+def run_plan(steps: List[PlanStep], solve: Callable[[PlanStep, Dict[int, str]], str], max_workers: int = 4) -> Dict[int, str]:
+    """
+    Executes a plan as a DAG on a thread pool: every step whose dependencies are done is
+    submitted immediately, so independent steps run concurrently.
+    `solve(step, finished)` is called once per step after all of its dependencies have
+    finished; `finished` is a snapshot of the results available at that point.
+    Returns {step index: result}.
+    """
+    results: Dict[int, str] = {}
+    pending = {step.index: step for step in steps}
+    running: Dict[Future, PlanStep] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while pending or running:
+            for index, step in list(pending.items()):
+                if all(d in results for d in step.depends_on):
+                    del pending[index]
+                    # Copy the caller's context so tracing spans opened in `solve` nest under the plan
+                    running[executor.submit(contextvars.copy_context().run, solve, step, dict(results))] = step
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                results[step.index] = future.result()
+    return results
+
+
+async def arun_plan(steps: List[PlanStep], solve: Callable[[PlanStep, Dict[int, str]], Awaitable[str]], max_concurrency: int = 4) -> Dict[int, str]:
+    """Async counterpart of run_plan(); `solve` is a coroutine function."""
+    results: Dict[int, str] = {}
+    pending = {step.index: step for step in steps}
+    running: Dict[asyncio.Task, PlanStep] = {}
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def bounded(step: PlanStep, finished: Dict[int, str]) -> str:
+        async with semaphore:
+            return await solve(step, finished)
+
+    try:
+        while pending or running:
+            for index, step in list(pending.items()):
+                if all(d in results for d in step.depends_on):
+                    del pending[index]
+                    running[asyncio.create_task(bounded(step, dict(results)))] = step
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step = running.pop(task)
+                results[step.index] = task.result()
+    finally:
+        for task in running:
+            task.cancel()
+    return results
@@ -1,15 +1,36 @@
-import re
-from typing import List, Callable
-from common.available_tools import ToolExecutor
-from travel_agent.llm_client import OpenAICompatibleClient
+import logging
+from typing import Dict, List, Callable, Optional, Union
+from common.action_parser import ActionParser, ParsedResponse
+from common.available_tools import ToolCall, ToolExecutor, ToolResult
+from common.context import ContextManager
+from common.react_stream import areact_completion, react_completion
+from common.tracing import span
+from common.transcript import Transcript
+from travel_agent.llm_client import AsyncOpenAICompatibleClient, OpenAICompatibleClient, require_sync_client
 from PlanAndSolve.prompts import SOLVER_PROMPT
 
+logger = logging.getLogger(__name__)
+
+SOLVER_SYSTEM_PROMPT = "You are a capable solver."
+
 class Solver:
-    def __init__(self, llm: OpenAICompatibleClient, tools: List[Callable]):
+    def __init__(
+        self,
+        llm: Union[OpenAICompatibleClient, AsyncOpenAICompatibleClient],
+        tools: List[Callable],
+        context_manager: Optional[ContextManager] = None,
+        stream: bool = False,
+    ):
         self.llm = llm
+        self.context_manager = context_manager if context_manager else ContextManager()
+        self.stream = stream
         self.tools = tools
         tool_dict = {tool.__name__: tool for tool in tools}
         self.tool_executor = ToolExecutor(tool_dict)
+        self.action_parser = ActionParser(tool_dict)
+        # Simple ReAct-like loop for a single step
+        # For simplicity, we'll allow a few turns per step
+        self.max_turns = 3
 
     def _get_tool_descriptions(self) -> str:
         return "\n".join([f"{tool.__name__}: {tool.__doc__}" for tool in self.tools])
@@ -17,66 +38,149 @@ class Solver:
     def _get_tool_names(self) -> str:
         return ", ".join([tool.__name__ for tool in self.tools])
 
-    def solve_step(self, step: str, context: str) -> str:
-        tool_descriptions = self._get_tool_descriptions()
-        tool_names = self._get_tool_names()
-        
-        prompt = SOLVER_PROMPT.format(
-            tool_descriptions=tool_descriptions,
-            tool_names=tool_names,
+    def _start_transcript(self, step: str, context: str) -> Transcript:
+        transcript = Transcript(SOLVER_SYSTEM_PROMPT)
+        transcript.add_user(SOLVER_PROMPT.format(
+            tool_descriptions=self._get_tool_descriptions(),
+            tool_names=self._get_tool_names(),
             current_step=step,
             previous_context=context
-        )
+        ))
+        return transcript
+
+    def _build_messages(self, transcript: Transcript, turn: int) -> List[Dict[str, str]]:
+        self.context_manager.fit(transcript)
+        # Force a wrap-up in the last turn (sent once, not kept in the transcript)
+        if turn == self.max_turns - 1:
+            return transcript.to_messages(extra_user="\nObservation: You have reached the maximum number of turns. Please provide the Final Answer now based on what you have found so far.\n")
+        return transcript.to_messages()
+
+    def _parse_response(self, response: str) -> tuple[str, ParsedResponse]:
+        """
+        Truncates and parses one solver turn.
+        Returns a tuple: (response, parsed)
+        """
+        if "Observation:" in response:
+            response = response.split("Observation:")[0].strip()
+            
+        logger.info("  [Solver Output]\n%s", response)
         
-        # Simple ReAct-like loop for a single step
-        # For simplicity, we'll allow a few turns per step
-        max_turns = 3
-        history = ""
+        with span("solver.parse") as parse_span:
+            parsed = self.action_parser.parse(response)
+            if parsed.final_answer is not None:
+                parse_span.set_attribute("final", True)
+            elif parsed.calls:
+                parse_span.set_attribute("action", ",".join(call.name for call in parsed.calls))
+            elif parsed.error:
+                parse_span.set_attribute("parse_error", parsed.error)
+            return response, parsed
+
+    def _execute_action(self, calls: List[ToolCall]) -> str:
+        for call in calls:
+            logger.info("  [Executing Tool] %s with input: %s", call.name, call.kwargs)
+        if len(calls) > 1:
+            # Independent calls issued in one turn run concurrently
+            obs_str = self._format_results(self.tool_executor.execute_many(calls))
+        elif self.tool_executor.has(calls[0].name):
+            try:
+                observation = self.tool_executor.execute(calls[0].name, **calls[0].kwargs)
+                obs_str = f"Observation: {self.context_manager.truncate(str(observation))}\n"
+            except Exception as e:
+                obs_str = f"Observation: Error: {e}\n"
+        else:
+            obs_str = f"Observation: Tool not found.\n"
         
-        for i in range(max_turns):
-            current_input = prompt + history
-            
-            # Force a wrap-up in the last turn
-            if i == max_turns - 1:
-                current_input += "\nObservation: You have reached the maximum number of turns. Please provide the Final Answer now based on what you have found so far.\n"
-
-            response = self.llm.generate(
-                current_input, 
-                system_prompt="You are a capable solver.",
-                stop=["Observation:"]
-            )
+        logger.info("  %s", obs_str.strip())
+        return obs_str
+
+    async def _aexecute_action(self, calls: List[ToolCall]) -> str:
+        """Async counterpart of _execute_action; sync tools run in the executor's thread pool."""
+        for call in calls:
+            logger.info("  [Executing Tool] %s with input: %s", call.name, call.kwargs)
+        if len(calls) > 1:
+            obs_str = self._format_results(await self.tool_executor.aexecute_many(calls))
+        elif self.tool_executor.has(calls[0].name):
+            try:
+                observation = await self.tool_executor.aexecute(calls[0].name, **calls[0].kwargs)
+                obs_str = f"Observation: {self.context_manager.truncate(str(observation))}\n"
+            except Exception as e:
+                obs_str = f"Observation: Error: {e}\n"
+        else:
+            obs_str = f"Observation: Tool not found.\n"
+
+        logger.info("  %s", obs_str.strip())
+        return obs_str
+
+    def _format_results(self, results: List[ToolResult]) -> str:
+        lines = []
+        for i, result in enumerate(results, start=1):
+            if result.ok:
+                text = self.context_manager.truncate(str(result.value))
+            elif not self.tool_executor.has(result.name):
+                text = "Tool not found."
+            else:
+                text = f"Error: {result.error}"
+            lines.append(f"[{i}] {result.name}: {text}")
+        return "Observation:\n" + "\n".join(lines) + "\n"
+
+    def _record_turn(self, response: str, transcript: Transcript) -> ParsedResponse:
+        response, parsed = self._parse_response(response)
+        transcript.add_assistant(response)
+        if parsed.final_answer is None and not parsed.calls:
+            if parsed.error:
+                transcript.add_user(f"Observation: Invalid format: {parsed.error} Provide Action and Action Input, or the Final Answer.\n")
+            elif "Thought:" not in response:
+                transcript.add_user("Observation: Please provide Thought, Action, and Action Input, or Final Answer.\n")
+            else:
+                transcript.add_user("Observation: No action was taken. Provide Action and Action Input, or the Final Answer.\n")
+        return parsed
+
+    def solve_step(self, step: str, context: str) -> str:
+        # The async client only works with asolve_step()
+        require_sync_client(self.llm, "Solver.solve_step()")
+        with span("solver.solve_step", step=step) as step_span:
+            transcript = self._start_transcript(step, context)
             
-            if "Observation:" in response:
-                response = response.split("Observation:")[0].strip()
+            for i in range(self.max_turns):
+                step_span.set_attribute("turns", i + 1)
+                response = react_completion(
+                    self.llm,
+                    self._build_messages(transcript, i),
+                    stream=self.stream,
+                    stop=["Observation:"]
+                )
                 
-            print(f"  [Solver Output]\n{response}")
-            history += response + "\n"
-            
-            if "Final Answer:" in response:
-                return response.split("Final Answer:")[-1].strip()
-            
-            # Parse Action
-            action_match = re.search(r"Action:\s*(.*?)\n", response)
-            action_input_match = re.search(r"Action Input:\s*(.*?)(?:\n|$)", response)
+                parsed = self._record_turn(response, transcript)
+                
+                if parsed.final_answer is not None:
+                    return parsed.final_answer
+                
+                if parsed.calls:
+                    transcript.add_user(self._execute_action(parsed.calls))
+
+            step_span.record_error("Step execution failed or incomplete.")
+            return "Step execution failed or incomplete."
+
+    async def asolve_step(self, step: str, context: str) -> str:
+        with span("solver.solve_step", step=step) as step_span:
+            transcript = self._start_transcript(step, context)
             
-            if action_match and action_input_match:
-                action = action_match.group(1).strip()
-                action_input = action_input_match.group(1).strip()
+            for i in range(self.max_turns):
+                step_span.set_attribute("turns", i + 1)
+                response = await areact_completion(
+                    self.llm,
+                    self._build_messages(transcript, i),
+                    stream=self.stream,
+                    stop=["Observation:"]
+                )
                 
-                print(f"  [Executing Tool] {action} with input: {action_input}")
-                if self.tool_executor.has(action):
-                    try:
-                        observation = self.tool_executor.execute(action, query=action_input)
-                        obs_str = f"Observation: {observation}\n"
-                    except Exception as e:
-                        obs_str = f"Observation: Error: {e}\n"
-                else:
-                    obs_str = f"Observation: Tool not found.\n"
+                parsed = self._record_turn(response, transcript)
                 
-                print(f"  {obs_str.strip()}")
-                history += obs_str
-            else:
-                if "Thought:" not in response:
-                     history += "Observation: Please provide Thought, Action, and Action Input, or Final Answer.\n"
+                if parsed.final_answer is not None:
+                    return parsed.final_answer
+                
+                if parsed.calls:
+                    transcript.add_user(await self._aexecute_action(parsed.calls))
 
-        return "Step execution failed or incomplete."
+            step_span.record_error("Step execution failed or incomplete.")
+            return "Step execution failed or incomplete."
@@ -1,13 +1,25 @@
-import re
+import logging
 import sys
 import os
+import threading
+from concurrent.futures import CancelledError
+from contextlib import nullcontext
 
 # Add the project root to sys.path to allow importing from common and travel_agent
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from typing import List, Optional, Callable
-from common.available_tools import ToolExecutor
-from travel_agent.llm_client import OpenAICompatibleClient
+from typing import List, Optional, Callable, Union
+from common.action_parser import ActionParser, ParsedResponse
+from common.available_tools import ToolCall, ToolExecutor, ToolResult
+from common.context import ContextManager
+from common.prefetch import PrefetchRule, PrefetchSession, ToolPrefetcher
+from common.react_stream import areact_completion, react_completion
+from common.answer_cache import AnswerCache
+from common.tracing import span
+from common.transcript import Transcript
+from travel_agent.llm_client import AsyncOpenAICompatibleClient, OpenAICompatibleClient, create_client, require_sync_client
+
+logger = logging.getLogger(__name__)
 
 REACT_PROMPT_TEMPLATE = """
 Answer the following questions as best you can. You have access to the following tools:
@@ -35,12 +47,32 @@ Begin!
 Question: {question}
 """
 
+REACT_SYSTEM_PROMPT = "You are a helpful assistant that follows the ReAct pattern."
+
 class ReActAgent:
-    def __init__(self, llm: OpenAICompatibleClient, tools: List[Callable]):
+    def __init__(
+        self,
+        llm: Union[OpenAICompatibleClient, AsyncOpenAICompatibleClient],
+        tools: List[Callable],
+        context_manager: Optional[ContextManager] = None,
+        stream: bool = False,
+        prefetch_rules: Optional[List[PrefetchRule]] = None,
+        answer_cache: Optional[AnswerCache] = None,
+    ):
         self.llm = llm
+        # Keeps each LLM call within a token budget (truncated observations, summarized old turns)
+        self.context_manager = context_manager if context_manager else ContextManager()
+        # Stream each turn and cancel generation as soon as a complete Action is parsed
+        self.stream = stream
         # Create a dictionary of tools for the executor
         tool_dict = {tool.__name__: tool for tool in tools}
         self.tool_executor = ToolExecutor(tool_dict)
+        # Precompiled single-pass parser; binds Action Input / call arguments to tool parameters
+        self.action_parser = ActionParser(tool_dict)
+        # Optional speculative tool calls (e.g. question_as_query("search")) that overlap tool latency with generation
+        self.prefetcher = ToolPrefetcher(self.tool_executor, prefetch_rules) if prefetch_rules else None
+        # Optional cache of final answers; a hit skips the whole loop
+        self.answer_cache = answer_cache
         self.tools = tools
 
     def _get_tool_descriptions(self) -> str:
@@ -54,108 +86,256 @@ class ReActAgent:
     def _get_tool_names(self) -> str:
         return ", ".join([tool.__name__ for tool in self.tools])
 
-    def _parse_response(self, response: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    def _parse_response(self, response: str) -> ParsedResponse:
         """
-        Parses the LLM response to extract Final Answer or Action/Action Input.
-        Returns a tuple: (final_answer, action, action_input)
+        Parses the LLM response to extract the Final Answer or the tool calls.
+        Accepts "Action:" + "Action Input:" (plain text or a JSON object of arguments)
+        as well as call syntax such as `Action: search(query="...")`.
         """
-        # Check for Final Answer
-        if "Final Answer:" in response:
-            final_answer = response.split("Final Answer:")[-1].strip()
-            return final_answer, None, None
-        
-        # Parse Action
-        action_match = re.search(r"Action:\s*(.*?)\n", response)
-        action_input_match = re.search(r"Action Input:\s*(.*?)(?:\n|$)", response)
-        
-        if action_match and action_input_match:
-            action = action_match.group(1).strip()
-            action_input = action_input_match.group(1).strip()
-            return None, action, action_input
-            
-        return None, None, None
+        return self.action_parser.parse(response)
+
+    def _missing_tool(self, name: str) -> str:
+        return f"Tool '{name}' not found. Available tools: {self._get_tool_names()}"
 
-    def _execute_action(self, action: str, action_input: str) -> str:
+    def _format_results(self, results: List[ToolResult]) -> str:
+        """Formats the results of several tool calls issued in one turn as a single observation."""
+        lines = []
+        for i, result in enumerate(results, start=1):
+            if result.ok:
+                text = self.context_manager.truncate(str(result.value))
+            elif not self.tool_executor.has(result.name):
+                text = self._missing_tool(result.name)
+            else:
+                text = f"Error executing tool: {result.error}"
+            lines.append(f"[{i}] {result.name}: {text}")
+        return "Observation:\n" + "\n".join(lines) + "\n"
+
+    def _prefetch(self, question: str):
+        return self.prefetcher.start(question) if self.prefetcher else nullcontext()
+
+    def _execute_action(self, calls: List[ToolCall], prefetch: Optional[PrefetchSession] = None) -> str:
         """
-        Executes the parsed action.
+        Executes the parsed tool calls; several calls in one turn run concurrently.
+        A single call is served from the prefetch session when it was speculated.
         """
-        if self.tool_executor.has(action):
+        if len(calls) > 1:
+            results = self.tool_executor.execute_many(calls)
+            if prefetch is not None:
+                prefetch.observe(calls)
+            return self._format_results(results)
+        call = calls[0]
+        if self.tool_executor.has(call.name):
             try:
-                # Currently assuming tool takes 'query' argument, primarily for search
-                # TODO: Improve argument parsing for more complex tools
-                observation = self.tool_executor.execute(action, query=action_input)
-                return f"Observation: {observation}\n"
+                if prefetch is not None:
+                    observation = prefetch.execute(call)
+                else:
+                    observation = self.tool_executor.execute(call.name, **call.kwargs)
+                return f"Observation: {self.context_manager.truncate(str(observation))}\n"
             except Exception as e:
                 return f"Observation: Error executing tool: {e}\n"
         else:
-            return f"Observation: Tool '{action}' not found. Available tools: {self._get_tool_names()}\n"
+            return f"Observation: {self._missing_tool(call.name)}\n"
 
-    def run(self, question: str, max_turns: int = 5) -> str:
-        tool_descriptions = self._get_tool_descriptions()
-        tool_names = self._get_tool_names()
-        
-        prompt = REACT_PROMPT_TEMPLATE.format(
-            tool_descriptions=tool_descriptions,
-            tool_names=tool_names,
+    async def _aexecute_action(self, calls: List[ToolCall], prefetch: Optional[PrefetchSession] = None) -> str:
+        """
+        Async counterpart of _execute_action: async tools are awaited on the event loop,
+        sync ones run in the executor's bounded thread pool.
+        """
+        if len(calls) > 1:
+            results = await self.tool_executor.aexecute_many(calls)
+            if prefetch is not None:
+                prefetch.observe(calls)
+            return self._format_results(results)
+        call = calls[0]
+        if self.tool_executor.has(call.name):
+            try:
+                if prefetch is not None:
+                    observation = await prefetch.aexecute(call)
+                else:
+                    observation = await self.tool_executor.aexecute(call.name, **call.kwargs)
+                return f"Observation: {self.context_manager.truncate(str(observation))}\n"
+            except Exception as e:
+                return f"Observation: Error executing tool: {e}\n"
+        else:
+            return f"Observation: {self._missing_tool(call.name)}\n"
+
+    def _start_transcript(self, question: str) -> Transcript:
+        transcript = Transcript(REACT_SYSTEM_PROMPT)
+        transcript.add_user(REACT_PROMPT_TEMPLATE.format(
+            tool_descriptions=self._get_tool_descriptions(),
+            tool_names=self._get_tool_names(),
             question=question
-        )
+        ))
+        return transcript
+
+    def _handle_response(self, response: str, transcript: Transcript) -> ParsedResponse:
+        """
+        Records one LLM turn in the transcript and parses it.
+        """
+        # Manual truncation
+        if "Observation:" in response:
+            response = response.split("Observation:")[0].strip()
         
-        history = []
+        logger.info("LLM Output:\n%s", response)
+        transcript.add_assistant(response)
         
-        print(f"Question: {question}")
-
-        for i in range(max_turns):
-            print(f"\n--- Turn {i+1} ---")
-            
-            # Construct the full input for the LLM
-            current_input = prompt + "".join(history)
-            
-            # Call LLM
-            response = self.llm.generate(
-                current_input, 
-                system_prompt="You are a helpful assistant that follows the ReAct pattern.",
-                stream=False,
-                stop=["Observation:"]
+        # Parse response
+        with span("react.parse") as parse_span:
+            parsed = self._parse_response(response)
+            parse_span.set_attributes(
+                final=parsed.final_answer is not None,
+                action=",".join(call.name for call in parsed.calls) or None,
+                parse_error=parsed.error,
             )
+        
+        if parsed.final_answer:
+            return parsed
+        
+        if parsed.calls:
+            for call in parsed.calls:
+                logger.info("Parsed Action: %s", call.name)
+                logger.info("Parsed Input: %s", call.kwargs)
+        elif parsed.error:
+            logger.info("Could not parse action: %s", parsed.error)
+            transcript.add_user(f"Observation: Invalid format: {parsed.error} Please provide 'Action:' and 'Action Input:', or the 'Final Answer:'.\n")
+        else:
+            logger.info("No action parsed.")
+            if "Thought:" not in response:
+                transcript.add_user("Observation: Invalid format. Please provide 'Thought:', 'Action:', and 'Action Input:'.\n")
+            else:
+                # Keep user/assistant turns alternating so the next call is a fresh completion
+                transcript.add_user("Observation: No action was taken. Continue with 'Action:' and 'Action Input:', or give the 'Final Answer:'.\n")
+        return parsed
+
+    def _sampling_kwargs(self, temperature: Optional[float]) -> dict:
+        return {"temperature": temperature} if temperature is not None else {}
+
+    def _use_cache(self, temperature: Optional[float]) -> bool:
+        # Sampled runs (e.g. reflection self-consistency) must stay independent
+        return self.answer_cache is not None and temperature is None
+
+    def _cached_answer(self, question: str, temperature: Optional[float]) -> Optional[str]:
+        if not self._use_cache(temperature):
+            return None
+        with span("react.answer_cache", question=question):
+            return self.answer_cache.get(question)
+
+    def _store_answer(self, question: str, answer: str, temperature: Optional[float]) -> None:
+        if self._use_cache(temperature):
+            self.answer_cache.set(question, answer)
+
+    def run(
+        self,
+        question: str,
+        max_turns: int = 5,
+        cancel_event: Optional[threading.Event] = None,
+        temperature: Optional[float] = None,
+    ) -> str:
+        """
+        Runs the ReAct loop; needs a sync client (use arun() with AsyncOpenAICompatibleClient).
+        When cancel_event is set (e.g. another sample already won),
+        generation stops at the next stream chunk or turn boundary and CancelledError is raised.
+        temperature is passed to every LLM call, so that concurrent samples differ.
+        """
+        require_sync_client(self.llm, "ReActAgent.run()")
+        cached = self._cached_answer(question, temperature)
+        if cached is not None:
+            return cached
+        with span("react.run", question=question) as run_span, self._prefetch(question) as prefetch:
+            transcript = self._start_transcript(question)
             
-            # Manual truncation
-            if "Observation:" in response:
-                response = response.split("Observation:")[0].strip()
-            
-            print(f"LLM Output:\n{response}")
-            history.append(response + "\n")
-            
-            # Parse response
-            final_answer, action, action_input = self._parse_response(response)
-            
-            if final_answer:
-                return final_answer
+            logger.info("Question: %s", question)
+
+            for i in range(max_turns):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError()
+                self.context_manager.fit(transcript)
+                logger.info("\n--- Turn %d (context: %d tokens) ---", i + 1, transcript.token_count)
+                run_span.set_attributes(turns=i + 1, context_tokens=transcript.token_count)
+                
+                # Call LLM with the incrementally built message list
+                response = react_completion(
+                    self.llm,
+                    transcript.to_messages(),
+                    stream=self.stream,
+                    cancel_event=cancel_event,
+                    stop=["Observation:"],
+                    **self._sampling_kwargs(temperature)
+                )
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError()
+                
+                parsed = self._handle_response(response, transcript)
+                
+                if parsed.final_answer:
+                    self._store_answer(question, parsed.final_answer, temperature)
+                    return parsed.final_answer
+                
+                if parsed.calls:
+                    observation_str = self._execute_action(parsed.calls, prefetch)
+                    logger.info("%s", observation_str.strip())
+                    transcript.add_user(observation_str)
+
+            run_span.set_attribute("max_turns_reached", True)
+            return f"Agent stopped due to max turns ({max_turns}) without finding a final answer."
+
+    async def arun(self, question: str, max_turns: int = 5, temperature: Optional[float] = None) -> str:
+        """
+        Async counterpart of run(). Works with both the sync and the async LLM client,
+        so many sessions can share one event loop; sync tools run in worker threads.
+        Cancel the task to stop it; the in-flight LLM or tool call is cancelled with it.
+        """
+        cached = self._cached_answer(question, temperature)
+        if cached is not None:
+            return cached
+        with span("react.run", question=question) as run_span, self._prefetch(question) as prefetch:
+            transcript = self._start_transcript(question)
             
-            if action and action_input:
-                print(f"Parsed Action: {action}")
-                print(f"Parsed Input: {action_input}")
+            logger.info("Question: %s", question)
+
+            for i in range(max_turns):
+                self.context_manager.fit(transcript)
+                logger.info("\n--- Turn %d (context: %d tokens) ---", i + 1, transcript.token_count)
+                run_span.set_attributes(turns=i + 1, context_tokens=transcript.token_count)
                 
-                observation_str = self._execute_action(action, action_input)
-                print(observation_str.strip())
-                history.append(observation_str)
-            else:
-                print("No action parsed.")
-                if "Thought:" not in response:
-                     history.append("Observation: Invalid format. Please provide 'Thought:', 'Action:', and 'Action Input:'.\n")
+                response = await areact_completion(
+                    self.llm,
+                    transcript.to_messages(),
+                    stream=self.stream,
+                    stop=["Observation:"],
+                    **self._sampling_kwargs(temperature)
+                )
+                
+                parsed = self._handle_response(response, transcript)
+                
+                if parsed.final_answer:
+                    self._store_answer(question, parsed.final_answer, temperature)
+                    return parsed.final_answer
+                
+                if parsed.calls:
+                    observation_str = await self._aexecute_action(parsed.calls, prefetch)
+                    logger.info("%s", observation_str.strip())
+                    transcript.add_user(observation_str)
 
-        return f"Agent stopped due to max turns ({max_turns}) without finding a final answer."
+            run_span.set_attribute("max_turns_reached", True)
+            return f"Agent stopped due to max turns ({max_turns}) without finding a final answer."
 
 if __name__ == "__main__":
     import os
     import sys
     from dotenv import load_dotenv
     from common.search import serpapi_search_text
+    from common.tracing import configure_tracing
 
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Export spans when AGENT_TRACE_FILE or OTEL_EXPORTER_OTLP_ENDPOINT is set
+    configure_tracing()
     
     # Initialize LLM
     # Ensure you have SILICONFLOW_API_KEY and SERPAPI_API_KEY in .env
-    llm = OpenAICompatibleClient()
+    # LLM_BACKEND=local runs the agent offline on the local transformers model
+    llm = create_client()
     
     # Define tools
     # We wrap search to have a nice name and docstring if needed, 
@@ -165,7 +345,10 @@ if __name__ == "__main__":
         """Search the web for the given query."""
         return serpapi_search_text(query)
 
-    agent = ReActAgent(llm=llm, tools=[search])
+    # Opt-in: ANSWER_CACHE_PATH persists final answers, so a repeated question is answered instantly
+    answer_cache_path = os.getenv("ANSWER_CACHE_PATH")
+    answer_cache = AnswerCache(answer_cache_path) if answer_cache_path else None
+    agent = ReActAgent(llm=llm, tools=[search], answer_cache=answer_cache)
     
     # Use command line argument if provided, otherwise default
     if len(sys.argv) > 1:
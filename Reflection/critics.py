@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+import re
+from typing import List, Optional, Sequence
+
+from common.tracing import span
+from travel_agent.llm_client import agenerate
+
+logger = logging.getLogger(__name__)
+
+REFLECTION_PROMPT = """
+You are a strict critic.
+Review the following User Question and the Agent's Answer.
+Check for correctness, completeness, and clarity.
+If the answer is incorrect or incomplete, provide specific feedback and suggestions for improvement.
+If the answer is satisfactory, simply output "SATISFACTORY".
+
+User Question: {question}
+Agent Answer: {answer}
+
+Critique:
+"""
+
+REFLECTION_SYSTEM_PROMPT = "You are a helpful critic."
+
+SCREEN_PROMPT = """Question: {question}
+Answer: {answer}
+
+Does the answer correctly and completely answer the question? Reply with YES or NO only."""
+
+SCREEN_SYSTEM_PROMPT = "You are a careful grader."
+
+# "UNSATISFACTORY" must not count as a pass
+_SATISFACTORY_RE = re.compile(r"(?<!UN)SATISFACTORY")
+
+# Answers that give up instead of answering
+_REFUSAL_RE = re.compile(
+    r"\b(i (do not|don't) know|(could not|couldn't|cannot|can't|unable to) (find|answer))\b|(没有找到|未找到|无法回答)",
+    re.IGNORECASE,
+)
+# Apologies and subjects that may precede the refusal phrase at the start of an answer
+_REFUSAL_PREFIX_RE = re.compile(r"^(sorry[,.!]?\s*|i'm sorry[,.!]?\s*|i am sorry[,.!]?\s*|(对不起|抱歉|很抱歉)[，,。！!]?\s*|我|i\s+)*", re.IGNORECASE)
+# Longer answers that mention a refusal phrase usually still answer (e.g. "名单中没有找到X，但Y是…")
+_MAX_REFUSAL_CHARS = 40
+
+# Error strings returned by the LLM clients and tools instead of raising
+_ERROR_MARKERS = ("[Error:", "错误:调用", "Error executing tool")
+
+
+def is_satisfactory(critique: str) -> bool:
+    return bool(_SATISFACTORY_RE.search(critique.upper()))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold().rstrip("?？.。!！")
+
+
+class CriticVerdict:
+    """
+    One critic's decision on an answer:
+    - satisfactory: True / False, or None when this tier is not confident enough and the next one should decide;
+    - critique: feedback for the next attempt ("SATISFACTORY" on a pass);
+    - confidence: the tier's confidence in its decision (0-1);
+    - tier: the name of the critic that produced the verdict.
+    """
+
+    def __init__(self, critique: str, satisfactory: Optional[bool], confidence: float = 1.0, tier: str = ""):
+        self.critique = critique
+        self.satisfactory = satisfactory
+        self.confidence = confidence
+        self.tier = tier
+
+    @property
+    def decided(self) -> bool:
+        return self.satisfactory is not None
+
+    def __repr__(self) -> str:
+        return f"CriticVerdict({self.tier!r}, satisfactory={self.satisfactory}, confidence={self.confidence:.2f})"
+
+
+class HeuristicCritic:
+    """
+    Rule-based first tier. Costs no tokens and only ever rejects: empty answers, run-out-of-turns
+    messages, leaked error strings, refusals (short answers, or ones that open with the refusal)
+    and answers that merely repeat the question.
+    Everything else is left to the next tier.
+    """
+
+    name = "heuristic"
+
+    def critique(self, question: str, answer: str) -> CriticVerdict:
+        feedback = self._check(question, answer.strip())
+        if feedback is None:
+            return CriticVerdict("", None, confidence=0.0, tier=self.name)
+        return CriticVerdict(feedback, False, tier=self.name)
+
+    async def acritique(self, question: str, answer: str) -> CriticVerdict:
+        return self.critique(question, answer)
+
+    def _check(self, question: str, answer: str) -> Optional[str]:
+        if not answer:
+            return "The answer is empty. Provide a Final Answer that addresses the question."
+        if answer.startswith("Agent stopped due to max turns"):
+            return "The agent ran out of turns before answering. Use fewer, more targeted searches and give the Final Answer as soon as the facts are found."
+        if any(marker in answer for marker in _ERROR_MARKERS):
+            return "The answer contains an error message instead of an answer. Retry the failed step or use another search."
+        if self._is_refusal(answer):
+            return "The answer gives up without answering. Rephrase the search (e.g. try other keywords or languages) and answer the question directly."
+        if _normalize(answer) == _normalize(question):
+            return "The answer only repeats the question. Answer it with the facts found."
+        return None
+
+    def _is_refusal(self, answer: str) -> bool:
+        """Only short answers, or answers that open with the refusal, count; others go to the next tier."""
+        if len(answer) <= _MAX_REFUSAL_CHARS:
+            return bool(_REFUSAL_RE.search(answer))
+        rest = answer[_REFUSAL_PREFIX_RE.match(answer).end():]
+        return bool(_REFUSAL_RE.match(rest))
+
+
+class LocalModelCritic:
+    """
+    Screens answers with a small local model (e.g. the Qwen checkpoint saved by download_model.py).
+    One forward pass scores YES against NO; the answer passes early only when P(YES) >= threshold.
+    Rejections are escalated, because the main critic writes the feedback for the next attempt.
+    client must provide choice_probabilities (travel_agent.local_llm.LocalLLMClient does).
+    """
+
+    name = "local"
+
+    def __init__(self, client, threshold: float = 0.85):
+        self.client = client
+        self.threshold = threshold
+
+    def critique(self, question: str, answer: str) -> CriticVerdict:
+        messages = [
+            {"role": "system", "content": SCREEN_SYSTEM_PROMPT},
+            {"role": "user", "content": SCREEN_PROMPT.format(question=question, answer=answer)},
+        ]
+        try:
+            p_yes = self.client.choice_probabilities(messages, ["YES", "NO"])["YES"]
+        except Exception as e:
+            logger.warning("Local critic failed, escalating: %s", e)
+            return CriticVerdict("", None, confidence=0.0, tier=self.name)
+        if p_yes >= self.threshold:
+            return CriticVerdict("SATISFACTORY", True, confidence=p_yes, tier=self.name)
+        return CriticVerdict("", None, confidence=p_yes, tier=self.name)
+
+    async def acritique(self, question: str, answer: str) -> CriticVerdict:
+        # The local model runs under its own lock; keep the event loop free meanwhile
+        return await asyncio.to_thread(self.critique, question, answer)
+
+
+class LLMCritic:
+    """The original critic: asks the main model for a critique. Always decides."""
+
+    name = "llm"
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def critique(self, question: str, answer: str) -> CriticVerdict:
+        prompt = REFLECTION_PROMPT.format(question=question, answer=answer)
+        response = self.llm.generate(prompt, system_prompt=REFLECTION_SYSTEM_PROMPT)
+        return CriticVerdict(response, is_satisfactory(response), tier=self.name)
+
+    async def acritique(self, question: str, answer: str) -> CriticVerdict:
+        prompt = REFLECTION_PROMPT.format(question=question, answer=answer)
+        response = await agenerate(self.llm, prompt, system_prompt=REFLECTION_SYSTEM_PROMPT)
+        return CriticVerdict(response, is_satisfactory(response), tier=self.name)
+
+
+class TieredCritic:
+    """
+    Runs the critics in order (cheapest first) and returns the first decided verdict,
+    so only uncertain answers reach the expensive tiers. The last tier should always decide;
+    if none does, the answer counts as unsatisfactory.
+    The deciding tier and its confidence are recorded on a "reflection.critic" span.
+    """
+
+    def __init__(self, tiers: Sequence):
+        if not tiers:
+            raise ValueError("TieredCritic needs at least one tier")
+        self.tiers = list(tiers)
+
+    def critique(self, question: str, answer: str) -> CriticVerdict:
+        with span("reflection.critic") as critic_span:
+            verdict = None
+            for tier in self.tiers:
+                verdict = tier.critique(question, answer)
+                if verdict.decided:
+                    break
+            return self._finish(verdict, critic_span)
+
+    async def acritique(self, question: str, answer: str) -> CriticVerdict:
+        with span("reflection.critic") as critic_span:
+            verdict = None
+            for tier in self.tiers:
+                verdict = await tier.acritique(question, answer)
+                if verdict.decided:
+                    break
+            return self._finish(verdict, critic_span)
+
+    def _finish(self, verdict: CriticVerdict, critic_span) -> CriticVerdict:
+        if not verdict.decided:
+            verdict = CriticVerdict(verdict.critique or "The answer could not be verified. Check it against the sources and answer more precisely.", False, verdict.confidence, verdict.tier)
+        critic_span.set_attributes(tier=verdict.tier, satisfactory=verdict.satisfactory, confidence=round(verdict.confidence, 3))
+        return verdict
+
+
+def create_critic(llm, local_model: Optional[str] = None, threshold: float = 0.85) -> TieredCritic:
+    """
+    Builds the default tiers: heuristic -> (optional) local model -> main LLM.
+    local_model is a model path, or "default" for the download_model.py checkpoint;
+    when omitted, the REFLECTION_LOCAL_CRITIC environment variable is used. The local tier is
+    skipped when neither is set.
+    """
+    tiers: List = [HeuristicCritic()]
+    local_model = local_model or os.getenv("REFLECTION_LOCAL_CRITIC")
+    if local_model:
+        from travel_agent.local_llm import LocalLLMClient
+
+        client = LocalLLMClient(model_path=None if local_model == "default" else local_model)
+        tiers.append(LocalModelCritic(client, threshold))
+    tiers.append(LLMCritic(llm))
+    return TieredCritic(tiers)
@@ -1,73 +1,248 @@
+import asyncio
+import contextvars
+import logging
 import sys
 import os
-from typing import List, Callable, Optional
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Callable, Optional, Tuple, Union
 
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from common.tracing import span
 from ReAct.ReAct_agent import ReActAgent
-from travel_agent.llm_client import OpenAICompatibleClient
+from Reflection.critics import CriticVerdict, HeuristicCritic, LLMCritic, TieredCritic, create_critic
+from travel_agent.llm_client import AsyncOpenAICompatibleClient, OpenAICompatibleClient, create_client, require_sync_client
 
-REFLECTION_PROMPT = """
-You are a strict critic.
-Review the following User Question and the Agent's Answer.
-Check for correctness, completeness, and clarity.
-If the answer is incorrect or incomplete, provide specific feedback and suggestions for improvement.
-If the answer is satisfactory, simply output "SATISFACTORY".
-
-User Question: {question}
-Agent Answer: {answer}
-
-Critique:
-"""
+logger = logging.getLogger(__name__)
 
 class ReflectionAgent:
-    def __init__(self, llm: OpenAICompatibleClient, react_agent: ReActAgent):
+    def __init__(
+        self,
+        llm: Union[OpenAICompatibleClient, AsyncOpenAICompatibleClient],
+        react_agent: ReActAgent,
+        num_samples: int = 1,
+        sample_temperature: float = 0.7,
+        critic: Optional[TieredCritic] = None,
+    ):
+        """
+        num_samples > 1 enables parallel self-consistency: every round launches that many
+        independent ReAct attempts (sampled at sample_temperature) and critiques them
+        concurrently; the first SATISFACTORY answer wins and the other attempts are cancelled.
+        critic screens answers with cheap tiers before asking llm (see Reflection.critics);
+        defaults to the heuristic tier followed by llm.
+        """
         self.llm = llm
         self.react_agent = react_agent
+        self.num_samples = max(1, num_samples)
+        self.sample_temperature = sample_temperature
+        self.critic = critic if critic else TieredCritic([HeuristicCritic(), LLMCritic(llm)])
+
+    def critique(self, question: str, answer: str) -> CriticVerdict:
+        return self.critic.critique(question, answer)
+
+    async def acritique(self, question: str, answer: str) -> CriticVerdict:
+        return await self.critic.acritique(question, answer)
 
     def reflect(self, question: str, answer: str) -> str:
-        prompt = REFLECTION_PROMPT.format(question=question, answer=answer)
-        response = self.llm.generate(prompt, system_prompt="You are a helpful critic.")
-        return response
+        return self.critique(question, answer).critique
+
+    async def areflect(self, question: str, answer: str) -> str:
+        return (await self.acritique(question, answer)).critique
+
+    def _build_agent_input(self, question: str, history: str, attempt: int) -> str:
+        # If we have history (previous attempts and critiques), append it to the question
+        # or treat it as context. Here we append it to the question for the ReAct agent
+        # to be aware of previous failures.
+        if attempt > 0:
+            return f"{question}\n\nPrevious Attempts and Critiques:\n{history}\n\nPlease try again, addressing the critiques."
+        return question
+
+    def _majority_answer(self, answers: List[str]) -> str:
+        """Self-consistency fallback: the most frequent answer (ties go to the earliest one)."""
+        normalized = [" ".join(answer.split()).casefold() for answer in answers]
+        counts = Counter(normalized)
+        best = max(counts.values())
+        return next(answer for answer, key in zip(answers, normalized) if counts[key] == best)
+
+    def _sample(self, question: str, agent_input: str, attempt: int, sample: int, cancel_event: threading.Event) -> Tuple[str, str, bool]:
+        with span("reflection.sample", attempt=attempt, sample=sample) as sample_span:
+            answer = self.react_agent.run(agent_input, cancel_event=cancel_event, temperature=self.sample_temperature)
+            verdict = self.critique(question, answer)
+            sample_span.set_attributes(satisfactory=verdict.satisfactory, critic=verdict.tier)
+            return answer, verdict.critique, verdict.satisfactory
+
+    async def _asample(self, question: str, agent_input: str, attempt: int, sample: int) -> Tuple[str, str, bool]:
+        with span("reflection.sample", attempt=attempt, sample=sample) as sample_span:
+            answer = await self.react_agent.arun(agent_input, temperature=self.sample_temperature)
+            verdict = await self.acritique(question, answer)
+            sample_span.set_attributes(satisfactory=verdict.satisfactory, critic=verdict.tier)
+            return answer, verdict.critique, verdict.satisfactory
+
+    def _record_round(self, history: str, attempt: int, results: List[Tuple[str, str]]) -> str:
+        for j, (answer, critique) in enumerate(results, start=1):
+            history += f"Attempt {attempt}.{j} Answer: {answer}\nCritique: {critique}\n\n"
+        return history
+
+    def _run_parallel(self, question: str, max_retries: int) -> str:
+        with span("reflection.run", question=question, samples=self.num_samples):
+            history = ""
+            answers: List[str] = []
+
+            for i in range(max_retries):
+                logger.info("\n=== Attempt %d (%d samples) ===", i + 1, self.num_samples)
+
+                with span("reflection.round", attempt=i + 1) as round_span:
+                    agent_input = self._build_agent_input(question, history, i)
+                    cancel_event = threading.Event()
+                    pool = ThreadPoolExecutor(max_workers=self.num_samples, thread_name_prefix="reflection-sample")
+                    # Copy the context so each sample's spans nest under this round
+                    futures = [
+                        pool.submit(contextvars.copy_context().run, self._sample, question, agent_input, i + 1, k + 1, cancel_event)
+                        for k in range(self.num_samples)
+                    ]
+                    results: List[Tuple[str, str]] = []
+                    error: Optional[BaseException] = None
+                    try:
+                        for future in as_completed(futures):
+                            try:
+                                answer, critique, satisfactory = future.result()
+                            except Exception as e:
+                                logger.warning("Sample failed: %s", e)
+                                error = e
+                                continue
+                            logger.info("\n[Agent Answer]\n%s\n[Critique]\n%s", answer, critique)
+                            if satisfactory:
+                                round_span.set_attributes(satisfactory=True, samples_finished=len(results) + 1)
+                                logger.info("\nAnswer deemed satisfactory.")
+                                return answer
+                            results.append((answer, critique))
+                    finally:
+                        # Stop the remaining samples at their next turn or stream chunk
+                        cancel_event.set()
+                        pool.shutdown(wait=False, cancel_futures=True)
+                    round_span.set_attribute("satisfactory", False)
+
+                if not results:
+                    raise error
+                answers.extend(answer for answer, _ in results)
+                history = self._record_round(history, i + 1, results)
+
+            return f"Final Answer (after {max_retries} retries): {self._majority_answer(answers)}"
+
+    async def _arun_parallel(self, question: str, max_retries: int) -> str:
+        with span("reflection.run", question=question, samples=self.num_samples):
+            history = ""
+            answers: List[str] = []
+
+            for i in range(max_retries):
+                logger.info("\n=== Attempt %d (%d samples) ===", i + 1, self.num_samples)
+
+                with span("reflection.round", attempt=i + 1) as round_span:
+                    agent_input = self._build_agent_input(question, history, i)
+                    tasks = [
+                        asyncio.ensure_future(self._asample(question, agent_input, i + 1, k + 1))
+                        for k in range(self.num_samples)
+                    ]
+                    results: List[Tuple[str, str]] = []
+                    error: Optional[BaseException] = None
+                    try:
+                        for next_done in asyncio.as_completed(tasks):
+                            try:
+                                answer, critique, satisfactory = await next_done
+                            except Exception as e:
+                                logger.warning("Sample failed: %s", e)
+                                error = e
+                                continue
+                            logger.info("\n[Agent Answer]\n%s\n[Critique]\n%s", answer, critique)
+                            if satisfactory:
+                                round_span.set_attributes(satisfactory=True, samples_finished=len(results) + 1)
+                                logger.info("\nAnswer deemed satisfactory.")
+                                return answer
+                            results.append((answer, critique))
+                    finally:
+                        # Cancelling a task cancels its in-flight LLM request or async tool call
+                        for task in tasks:
+                            task.cancel()
+                    round_span.set_attribute("satisfactory", False)
+
+                if not results:
+                    raise error
+                answers.extend(answer for answer, _ in results)
+                history = self._record_round(history, i + 1, results)
+
+            return f"Final Answer (after {max_retries} retries): {self._majority_answer(answers)}"
 
     def run(self, question: str, max_retries: int = 3) -> str:
-        current_question = question
-        history = ""
+        # The async client only works with arun()
+        require_sync_client(self.llm, "ReflectionAgent.run()")
+        if self.num_samples > 1:
+            return self._run_parallel(question, max_retries)
+        with span("reflection.run", question=question):
+            current_question = question
+            history = ""
+
+            for i in range(max_retries):
+                logger.info("\n=== Attempt %d ===", i + 1)
+            
+                with span("reflection.round", attempt=i + 1) as round_span:
+                    input_to_agent = self._build_agent_input(question, history, i)
+                    answer = self.react_agent.run(input_to_agent)
+                    logger.info("\n[Agent Answer]\n%s", answer)
 
-        for i in range(max_retries):
-            print(f"\n=== Attempt {i+1} ===")
+                    # Reflect
+                    verdict = self.critique(question, answer)
+                    critique, satisfactory = verdict.critique, verdict.satisfactory
+                    logger.info("\n[Critique (%s)]\n%s", verdict.tier, critique)
+                    round_span.set_attributes(satisfactory=satisfactory, critic=verdict.tier)
+
+                if satisfactory:
+                    logger.info("\nAnswer deemed satisfactory.")
+                    return answer
             
-            # If we have history (previous attempts and critiques), append it to the question
-            # or treat it as context. Here we append it to the question for the ReAct agent
-            # to be aware of previous failures.
-            if i > 0:
-                input_to_agent = f"{question}\n\nPrevious Attempts and Critiques:\n{history}\n\nPlease try again, addressing the critiques."
-            else:
-                input_to_agent = question
-
-            answer = self.react_agent.run(input_to_agent)
-            print(f"\n[Agent Answer]\n{answer}")
-
-            # Reflect
-            critique = self.reflect(question, answer)
-            print(f"\n[Critique]\n{critique}")
-
-            if "SATISFACTORY" in critique.upper():
-                print("\nAnswer deemed satisfactory.")
-                return answer
+                # Append to history
+                history += f"Attempt {i+1} Answer: {answer}\nCritique: {critique}\n\n"
+
+            return f"Final Answer (after {max_retries} retries): {answer}"
+
+    async def arun(self, question: str, max_retries: int = 3) -> str:
+        if self.num_samples > 1:
+            return await self._arun_parallel(question, max_retries)
+        with span("reflection.run", question=question):
+            history = ""
+
+            for i in range(max_retries):
+                logger.info("\n=== Attempt %d ===", i + 1)
+            
+                with span("reflection.round", attempt=i + 1) as round_span:
+                    answer = await self.react_agent.arun(self._build_agent_input(question, history, i))
+                    logger.info("\n[Agent Answer]\n%s", answer)
+
+                    verdict = await self.acritique(question, answer)
+                    critique, satisfactory = verdict.critique, verdict.satisfactory
+                    logger.info("\n[Critique (%s)]\n%s", verdict.tier, critique)
+                    round_span.set_attributes(satisfactory=satisfactory, critic=verdict.tier)
+
+                if satisfactory:
+                    logger.info("\nAnswer deemed satisfactory.")
+                    return answer
             
-            # Append to history
-            history += f"Attempt {i+1} Answer: {answer}\nCritique: {critique}\n\n"
+                history += f"Attempt {i+1} Answer: {answer}\nCritique: {critique}\n\n"
 
-        return f"Final Answer (after {max_retries} retries): {answer}"
+            return f"Final Answer (after {max_retries} retries): {answer}"
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
     from common.search import serpapi_search_text
+    from common.tracing import configure_tracing
 
     load_dotenv()
-    llm = OpenAICompatibleClient()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    configure_tracing()
+    # LLM_BACKEND=local runs the agent offline on the local transformers model
+    llm = create_client()
 
     def search(query: str):
         """Search the web for the given query."""
@@ -77,7 +252,8 @@ if __name__ == "__main__":
     react_agent = ReActAgent(llm=llm, tools=[search])
     
     # Initialize Reflection Agent
-    reflection_agent = ReflectionAgent(llm=llm, react_agent=react_agent)
+    # REFLECTION_LOCAL_CRITIC=default (or a model path) screens answers with the local Qwen model first
+    reflection_agent = ReflectionAgent(llm=llm, react_agent=react_agent, critic=create_critic(llm))
 
     if len(sys.argv) > 1:
         question = sys.argv[1]
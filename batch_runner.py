@@ -0,0 +1,318 @@
+"""
+批量运行智能体: 从 JSONL 文件流式读取问题，在线程 / 进程 / asyncio 工作池中并发执行，
+每完成一个问题就把结果追加写入输出 JSONL。进程崩溃或被中断后用相同参数重新运行，
+会跳过输出文件中已成功完成的 id，从中断处继续。
+
+    python batch_runner.py questions.jsonl results.jsonl --agent react --workers 16
+    python batch_runner.py questions.jsonl results.jsonl --agent plan_and_solve --mode async --workers 64
+    python batch_runner.py requests.jsonl results.jsonl --id-field request_id --question-field body
+
+输入每行一个 JSON 对象，问题取自 --question-field (默认 question)，id 取自 --id-field
+(默认 id，缺失时使用行号)。输出每行包含 id、question、answer、error、elapsed_s。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from common.tracing import configure_tracing, get_tracer
+from travel_agent.llm_client import AsyncOpenAICompatibleClient, create_client
+
+logger = logging.getLogger(__name__)
+
+AGENTS = ["react", "plan_and_solve", "reflection", "travel"]
+
+
+def make_llm(backend: str, local_batch_size: int = 1) -> Any:
+    """创建同步客户端；本地后端下多个并发会话共享模型，并按 local_batch_size 合并成批次生成。"""
+    if backend in ("local", "server"):
+        return create_client(backend, max_batch_size=local_batch_size)
+    return create_client(backend)
+
+
+def search(query: str):
+    """Search the web for the given query."""
+    from common.search import serpapi_search_text
+
+    return serpapi_search_text(query)
+
+
+async def asearch(query: str):
+    """Search the web for the given query."""
+    from common.search import aserpapi_search_text
+
+    return await aserpapi_search_text(query)
+
+
+def build_runner(agent: str, llm: Any, stream: bool = False, asynchronous: bool = False) -> Tuple[Callable[[str], Any], Optional[Callable[[str], Any]]]:
+    """
+    返回所选智能体的 (同步运行函数, 异步运行函数)；旅行智能体没有异步入口，异步函数为 None。
+    asynchronous=True 时搜索工具使用异步实现，供异步模式在事件循环中直接调用。
+    """
+    tool = asearch if asynchronous else search
+    if agent == "react":
+        from ReAct.ReAct_agent import ReActAgent
+
+        react = ReActAgent(llm, [tool], stream=stream)
+        return react.run, react.arun
+    if agent == "plan_and_solve":
+        from PlanAndSolve.plan_and_solve_agent import PlanAndSolveAgent
+        from PlanAndSolve.solver import Solver
+
+        solver = Solver(llm, [tool], stream=stream)
+        plan_and_solve = PlanAndSolveAgent(llm, [tool], solver=solver)
+        return plan_and_solve.run, plan_and_solve.arun
+    if agent == "reflection":
+        from ReAct.ReAct_agent import ReActAgent
+        from Reflection.reflection_agent import ReflectionAgent
+
+        reflection = ReflectionAgent(llm, ReActAgent(llm, [tool], stream=stream))
+        return reflection.run, reflection.arun
+    if agent == "travel":
+        from run_travel_agent import run_travel_agent
+
+        return (lambda question: run_travel_agent(llm, question)), None
+    raise ValueError(f"未知的智能体: {agent}")
+
+
+def iter_questions(path: str, id_field: str = "id", question_field: str = "question") -> Iterator[Tuple[str, str]]:
+    """逐行读取输入 JSONL，产生 (id, question)；不会把整个文件读入内存。"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning("跳过第 %d 行: 无法解析 JSON (%s)", line_no, e)
+                continue
+            question = row.get(question_field)
+            if not question:
+                logger.warning("跳过第 %d 行: 缺少字段 '%s'", line_no, question_field)
+                continue
+            yield str(row.get(id_field, f"line-{line_no}")), question
+
+
+def load_completed(path: str) -> Set[str]:
+    """读取已有输出中成功完成的 id。失败的记录会在续跑时重试；崩溃时写了一半的最后一行被忽略。"""
+    completed: Set[str] = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("error") is None:
+                completed.add(str(record["id"]))
+            else:
+                completed.discard(str(record["id"]))
+    return completed
+
+
+class ResultWriter:
+    """以追加方式逐条写入结果，每条写完立即 flush，崩溃时最多丢失正在写的一行。"""
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = open(path, "a+b")
+        # 上次崩溃可能留下没有换行的半行，先补一个换行，避免与新记录粘在一起
+        if self._file.tell() > 0:
+            self._file.seek(-1, os.SEEK_END)
+            if self._file.read(1) != b"\n":
+                self._file.write(b"\n")
+        self.written = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.written += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _record(agent: str, qid: str, question: str, answer: Any, error: Optional[BaseException], started: float) -> Dict[str, Any]:
+    return {
+        "id": qid,
+        "agent": agent,
+        "question": question,
+        "answer": answer,
+        "error": f"{type(error).__name__}: {error}" if error is not None else None,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_one(agent: str, run: Callable[[str], Any], item: Tuple[str, str]) -> Dict[str, Any]:
+    qid, question = item
+    started = time.perf_counter()
+    try:
+        return _record(agent, qid, question, run(question), None, started)
+    except Exception as e:
+        return _record(agent, qid, question, None, e, started)
+
+
+# 进程模式下每个工作进程只构建一次智能体 (以及 LLM 客户端和连接池)
+_worker_agent: Optional[str] = None
+_worker_run: Optional[Callable[[str], Any]] = None
+
+
+def _init_worker(agent: str, backend: str, local_batch_size: int, stream: bool, log_level: str) -> None:
+    global _worker_agent, _worker_run
+    load_dotenv()
+    logging.basicConfig(level=log_level, format="%(message)s")
+    configure_tracing()
+    _worker_agent = agent
+    _worker_run, _ = build_runner(agent, make_llm(backend, local_batch_size), stream)
+
+
+def _run_in_worker(item: Tuple[str, str]) -> Dict[str, Any]:
+    return run_one(_worker_agent, _worker_run, item)
+
+
+class Progress:
+    def __init__(self, every: int = 50):
+        self.every = every
+        self.done = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def update(self, record: Dict[str, Any]) -> None:
+        self.done += 1
+        if record["error"] is not None:
+            self.failed += 1
+            logger.warning("问题 %s 执行失败: %s", record["id"], record["error"])
+        if self.done % self.every == 0:
+            elapsed = time.perf_counter() - self.started
+            logger.warning("已完成 %d 个问题 (失败 %d)，%.2f 个/秒", self.done, self.failed, self.done / elapsed)
+
+
+def run_pool(executor: Executor, task: Callable[..., Dict[str, Any]], items: Iterable[Tuple[str, str]], max_in_flight: int, on_result: Callable[[Dict[str, Any]], None]) -> None:
+    """把 items 提交给线程池或进程池执行，在途任务数不超过 max_in_flight，避免一次性读入全部问题。"""
+    items = iter(items)
+    running = set()
+    try:
+        while True:
+            for item in items:
+                running.add(executor.submit(task, item))
+                if len(running) >= max_in_flight:
+                    break
+            if not running:
+                return
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                on_result(future.result())
+    finally:
+        for future in running:
+            future.cancel()
+
+
+async def arun_pool(agent: str, arun: Callable[[str], Any], items: Iterable[Tuple[str, str]], workers: int, on_result: Callable[[Dict[str, Any]], None]) -> None:
+    """workers 个协程共同从同一个迭代器取问题，单个事件循环即可承载大量并发会话。"""
+    items = iter(items)
+
+    async def worker() -> None:
+        for qid, question in items:
+            started = time.perf_counter()
+            try:
+                on_result(_record(agent, qid, question, await arun(question), None, started))
+            except Exception as e:
+                on_result(_record(agent, qid, question, None, e, started))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        await AsyncOpenAICompatibleClient.aclose_shared()
+
+
+def run_batch(args) -> Progress:
+    completed = load_completed(args.output)
+    if completed:
+        logger.warning("续跑: 跳过输出文件中已完成的 %d 个问题", len(completed))
+
+    def pending() -> Iterator[Tuple[str, str]]:
+        count = 0
+        for qid, question in iter_questions(args.input, args.id_field, args.question_field):
+            if args.limit is not None and count >= args.limit:
+                return
+            count += 1
+            if qid not in completed:
+                yield qid, question
+
+    writer = ResultWriter(args.output, fsync=args.fsync)
+    progress = Progress(args.progress_every)
+
+    def on_result(record: Dict[str, Any]) -> None:
+        writer.write(record)
+        progress.update(record)
+
+    try:
+        if args.mode == "async":
+            # 本地模型只有同步客户端，智能体的 arun 会把它的调用放到线程中执行
+            llm = make_llm(args.backend, args.local_batch_size) if args.agent == "travel" or args.backend != "api" else AsyncOpenAICompatibleClient()
+            run, arun = build_runner(args.agent, llm, args.stream, asynchronous=True)
+            if arun is None:
+                # 旅行智能体只有同步入口，放到线程中执行
+                arun = lambda question: asyncio.to_thread(run, question)
+            asyncio.run(arun_pool(args.agent, arun, pending(), args.workers, on_result))
+        elif args.mode == "process":
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.agent, args.backend, args.local_batch_size, args.stream, args.log_level.upper())) as executor:
+                run_pool(executor, _run_in_worker, pending(), args.workers * 2, on_result)
+        else:
+            # 线程模式共享同一个智能体实例，各次 run 之间没有共享的可变状态
+            run, _ = build_runner(args.agent, make_llm(args.backend, args.local_batch_size), args.stream)
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                run_pool(executor, lambda item: run_one(args.agent, run, item), pending(), args.workers * 2, on_result)
+    finally:
+        writer.close()
+    return progress
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="输入问题 JSONL 文件")
+    parser.add_argument("output", help="输出结果 JSONL 文件 (追加写入，同时作为续跑的检查点)")
+    parser.add_argument("--agent", choices=AGENTS, default="react")
+    parser.add_argument("--mode", choices=["thread", "process", "async"], default="thread")
+    parser.add_argument("--backend", choices=["api", "local", "server"], default=os.getenv("LLM_BACKEND", "api"), help="local 使用本地 transformers 模型 (进程模式下每个进程各加载一份)；server 连接共享的常驻模型服务")
+    parser.add_argument("--local-batch-size", type=int, default=8, help="本地后端把并发请求合并成批次的最大行数，1 表示不合并")
+    parser.add_argument("--workers", type=int, default=8, help="并发的智能体会话数")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--limit", type=int, help="只处理输入中的前 N 个问题")
+    parser.add_argument("--stream", action="store_true", help="ReAct 循环使用流式输出并提前结束生成")
+    parser.add_argument("--fsync", action="store_true", help="每条结果写入后 fsync，断电也不丢失")
+    parser.add_argument("--progress-every", type=int, default=50)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+    # 设置了 AGENT_TRACE_FILE 或 OTEL_EXPORTER_OTLP_ENDPOINT 时导出追踪数据
+    configure_tracing()
+
+    try:
+        progress = run_batch(args)
+    finally:
+        get_tracer().shutdown()
+    elapsed = time.perf_counter() - progress.started
+    print(f"完成 {progress.done} 个问题，失败 {progress.failed} 个，用时 {elapsed:.1f} 秒。结果已写入 {args.output}")
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
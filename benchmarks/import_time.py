@@ -0,0 +1,133 @@
+"""
+Measures start-up import time of the agent entry points with `python -X importtime`,
+so one-shot CLI runs stay fast as dependencies are added.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --json imports.json
+    python benchmarks/import_time.py --baseline imports.json --max-regression 0.2
+
+Each module is imported in a fresh interpreter (--repeat times, the fastest run is
+reported). The run fails (exit code 1) when an entry point eagerly imports one of the
+--forbid SDKs, which must only be loaded when a tool or client is first used, when an
+import exceeds --max-ms, or when it regresses by more than --max-regression against
+--baseline.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_MODULES = [
+    "ReAct.ReAct_agent",
+    "PlanAndSolve.plan_and_solve_agent",
+    "Reflection.reflection_agent",
+    "run_travel_agent",
+    "batch_runner",
+]
+# Heavy SDKs that are only needed once a client or tool is actually used
+DEFAULT_FORBID = ["openai", "httpx", "serpapi", "tavily", "requests", "numpy", "torch", "transformers"]
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Parses `-X importtime` output into {"module", "self_us", "cumulative_us", "depth"} rows."""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({
+                "module": module,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": (len(indent) - 1) // 2,
+            })
+    return rows
+
+
+def measure_import(module: str, python: str = sys.executable) -> List[Dict[str, Any]]:
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def profile_module(module: str, repeat: int, forbid: List[str], top: int) -> Dict[str, Any]:
+    best: Optional[List[Dict[str, Any]]] = None
+    best_us = 0
+    for _ in range(repeat):
+        rows = measure_import(module)
+        total_us = next((r["cumulative_us"] for r in reversed(rows) if r["module"] == module), 0)
+        if best is None or total_us < best_us:
+            best, best_us = rows, total_us
+    imported = {r["module"] for r in best}
+    # Ranked by self time so that nested imports are not counted twice
+    heaviest = sorted((r for r in best if r["depth"] >= 1), key=lambda r: r["self_us"], reverse=True)[:top]
+    return {
+        "module": module,
+        "import_ms": round(best_us / 1000, 1),
+        "modules_imported": len(imported),
+        "forbidden": sorted(name for name in forbid if name in imported),
+        "heaviest": [{"module": r["module"], "self_ms": round(r["self_us"] / 1000, 1)} for r in heaviest],
+    }
+
+
+def check(report: Dict[str, Any], max_ms: Optional[float], baseline: Optional[Dict[str, Any]], max_regression: float) -> List[str]:
+    failures = []
+    previous = {entry["module"]: entry for entry in (baseline or {}).get("modules", [])}
+    for entry in report["modules"]:
+        module = entry["module"]
+        if entry["forbidden"]:
+            failures.append(f"{module} eagerly imports {', '.join(entry['forbidden'])}")
+        if max_ms is not None and entry["import_ms"] > max_ms:
+            failures.append(f"{module} imports in {entry['import_ms']} ms (budget {max_ms} ms)")
+        old = previous.get(module)
+        if old and old["import_ms"] > 0 and entry["import_ms"] > old["import_ms"] * (1 + max_regression):
+            failures.append(f"{module} import time {old['import_ms']} -> {entry['import_ms']} ms")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="modules to import")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per module; the fastest is reported")
+    parser.add_argument("--forbid", nargs="*", default=DEFAULT_FORBID, help="top-level packages that must not be imported eagerly")
+    parser.add_argument("--top", type=int, default=5, help="heaviest imports to list per module")
+    parser.add_argument("--max-ms", type=float, help="fail when a module takes longer than this to import")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "modules": [profile_module(module, args.repeat, args.forbid, args.top) for module in args.modules],
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    failures = check(report, args.max_ms, baseline, args.max_regression)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+"""
+Measures aggregate generation throughput (tokens/sec) of the local transformers backend
+for N concurrent sessions, with and without the dynamic batching scheduler.
+
+    python benchmarks/local_throughput.py --sessions 8 --batch-sizes 1 8 --max-tokens 64
+
+Requires torch/transformers and the model from download_model.py (or network access to
+the Hugging Face hub).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.tracing import get_tracer
+from travel_agent.local_llm import BatchScheduler, LocalLLMClient
+
+PROMPTS = [
+    "Briefly explain what a hash table is.",
+    "List three tips for writing readable code.",
+    "What is the capital of France? Answer in one sentence.",
+    "Describe the ReAct prompting pattern in two sentences.",
+]
+
+
+class _TokenCounter:
+    """Sums completion tokens from the llm.call spans emitted by the client."""
+
+    def __init__(self) -> None:
+        self.completion_tokens = 0
+
+    def export(self, span) -> None:
+        if span.name == "llm.call":
+            self.completion_tokens += span.attributes.get("completion_tokens", 0)
+
+
+def measure(args, batch_size: int) -> Dict[str, Any]:
+    # Prefix caching is disabled so that only the effect of batching is measured
+    llm = LocalLLMClient(model_path=args.model_path, device=args.device, prefix_cache_mb=0)
+    if batch_size > 1:
+        # A private scheduler per configuration instead of the one shared per loaded model
+        llm.scheduler = BatchScheduler(llm.local_model, batch_size, args.batch_window)
+    counter = _TokenCounter()
+    tracer = get_tracer()
+    tracer.add_exporter(counter)
+
+    def session(i: int) -> None:
+        for turn in range(args.turns):
+            llm.generate(PROMPTS[(i + turn) % len(PROMPTS)], "You are a helpful assistant.", max_tokens=args.max_tokens)
+
+    try:
+        # Warm-up so the first-call overhead is not measured
+        llm.generate(PROMPTS[0], "You are a helpful assistant.", max_tokens=4)
+        counter.completion_tokens = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            list(pool.map(session, range(args.sessions)))
+        elapsed = time.perf_counter() - started
+    finally:
+        tracer.exporters.remove(counter)
+
+    report = {
+        "batch_size": batch_size,
+        "sessions": args.sessions,
+        "requests": args.sessions * args.turns,
+        "completion_tokens": counter.completion_tokens,
+        "wall_time_s": round(elapsed, 3),
+        "tokens_per_second": round(counter.completion_tokens / elapsed, 1),
+    }
+    if llm.scheduler is not None:
+        report["average_batch_size"] = round(llm.scheduler.average_batch_size, 2)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path")
+    parser.add_argument("--device")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=2, help="sequential requests per session")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--batch-window", type=float, default=0.005)
+    args = parser.parse_args()
+
+    reports = [measure(args, batch_size) for batch_size in args.batch_sizes]
+    print(json.dumps(reports, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
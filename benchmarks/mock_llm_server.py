@@ -0,0 +1,250 @@
+"""
+A local, OpenAI-compatible chat completions server for benchmarks.
+
+It answers POST /v1/chat/completions (streaming and non-streaming) with scripted
+responses that drive the repo's agents through a realistic number of turns, and
+simulates model latency (time to first token + per-token delay).
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.transcript import count_tokens
+
+QUESTION_RE = re.compile(r"(?:Question|Current Step):\s*(.*)")
+CITY_RE = re.compile(r"(北京|上海|广州|深圳|杭州|成都|西安|南京)")
+
+
+def _last_user(messages: List[Dict[str, str]]) -> str:
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return message["content"]
+    return ""
+
+
+class ScriptedResponder:
+    """
+    Produces deterministic replies for each agent in the repo, keyed on its system prompt.
+
+    Replay rules (loaded from a JSONL file of {"match": "...", "response": "..."} lines)
+    take precedence: the first rule whose `match` substring occurs in the last user
+    message wins. Use them to replay recorded transcripts.
+    """
+
+    def __init__(self, tool_turns: int = 1, replay: Optional[List[Dict[str, str]]] = None):
+        self.tool_turns = tool_turns
+        self.replay = replay or []
+
+    @classmethod
+    def from_jsonl(cls, path: str, tool_turns: int = 1) -> "ScriptedResponder":
+        with open(path, encoding="utf-8") as f:
+            rules = [json.loads(line) for line in f if line.strip()]
+        return cls(tool_turns=tool_turns, replay=rules)
+
+    def _react(self, messages: List[Dict[str, str]], tool: str) -> str:
+        # messages[1] is the prompt template, which itself mentions "Observation:"
+        observations = sum(m["content"].count("Observation:") for m in messages[2:] if m["role"] == "user")
+        if observations < self.tool_turns:
+            # The last match is the actual question; the ReAct template's format section also has a "Question:" line
+            matches = QUESTION_RE.findall(messages[1]["content"]) if len(messages) > 1 else []
+            query = matches[-1].strip() if matches else "the current step"
+            # Like real models, the first search restates the question; later ones refine it
+            if observations:
+                query = f"{query} #{observations + 1}"
+            return f"Thought: I need to look this up.\nAction: {tool}\nAction Input: {query}\n"
+        return "Thought: I now know the final answer\nFinal Answer: This is a mock answer based on the observations."
+
+    def _travel(self, prompt: str) -> str:
+        city_match = CITY_RE.search(prompt)
+        city = city_match.group(1) if city_match else "北京"
+        if "当前天气" in prompt:
+            return f'Thought: 已获得天气，接下来查询景点。\nAction: get_attraction(city="{city}", weather="晴")'
+        if "景点" in prompt and prompt.startswith("这是上次工具调用的结果"):
+            return 'Thought: 信息已足够。\nAction: finish(answer="推荐游览故宫和颐和园。")'
+        return f'Thought: 先查询天气。\nAction: get_weather(city="{city}")'
+
+    def respond(self, messages: List[Dict[str, str]]) -> str:
+        last_user = _last_user(messages)
+        for rule in self.replay:
+            if rule.get("match", "") in last_user:
+                return rule["response"]
+
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        if "ReAct pattern" in system:
+            return self._react(messages, "search")
+        if "solver" in system:
+            return self._react(messages, "search")
+        if "planner" in system:
+            return "1. Look up the first fact (depends on: none)\n2. Look up the second fact (depends on: none)\n3. Combine both facts (depends on: 1, 2)"
+        if "critic" in system:
+            return "SATISFACTORY"
+        if "summarizer" in system:
+            return "- Earlier steps looked up the required facts."
+        if "旅行助手" in system:
+            return self._travel(last_user)
+        return "This is a mock final answer."
+
+
+class MockLLMServer:
+    """
+    Runs the mock server on a background thread.
+
+        with MockLLMServer(latency=0.2) as server:
+            llm = OpenAICompatibleClient(api_key="mock", base_url=server.base_url)
+    """
+
+    def __init__(
+        self,
+        responder: Optional[ScriptedResponder] = None,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.responder = responder or ScriptedResponder()
+        self.latency = latency
+        self.token_latency = token_latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without TCP_NODELAY every reply pays a delayed-ACK stall
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                except ValueError:
+                    # The client was cancelled before sending the whole request
+                    self.close_connection = True
+                    return
+                with server._lock:
+                    server.requests += 1
+                messages = body.get("messages", [])
+                content = server.responder.respond(messages)
+                stop = body.get("stop") or []
+                for s in [stop] if isinstance(stop, str) else stop:
+                    if s in content:
+                        content = content[:content.index(s)]
+                prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+                completion_tokens = count_tokens(content)
+                time.sleep(server.latency)
+                if body.get("stream"):
+                    self._stream(body, content)
+                else:
+                    self._complete(body, content, prompt_tokens, completion_tokens)
+
+            def _complete(self, body, content, prompt_tokens, completion_tokens):
+                time.sleep(server.token_latency * completion_tokens)
+                payload = json.dumps({
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }).encode("utf-8")
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the request while it was being served
+                    self.close_connection = True
+
+            def _stream(self, body, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    # Roughly one token per 4 characters, like the offline token estimate
+                    for i in range(0, len(content), 4):
+                        time.sleep(server.token_latency)
+                        chunk = {
+                            "id": "mock",
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": body.get("model", "mock"),
+                            "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}}],
+                        }
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                    self._write_chunk("data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the generation early
+                    self.close_connection = True
+
+            def _write_chunk(self, data: str):
+                raw = data.encode("utf-8")
+                self.wfile.write(f"{len(raw):X}\r\n".encode("ascii") + raw + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock OpenAI-compatible server in the foreground.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--replay", help="JSONL file of {\"match\", \"response\"} replay rules")
+    args = parser.parse_args()
+
+    responder = ScriptedResponder.from_jsonl(args.replay) if args.replay else None
+    server = MockLLMServer(responder, latency=args.latency, token_latency=args.token_latency, port=args.port)
+    print(f"Mock LLM server listening on {server.base_url}")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
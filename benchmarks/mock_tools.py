@@ -0,0 +1,29 @@
+"""
+Scripted stand-ins for the SerpApi, wttr.in and Tavily tools with configurable latency.
+"""
+import time
+from typing import Callable, Dict
+
+from common.available_tools import ToolExecutor
+
+
+def make_mock_tools(latency: float = 0.0) -> Dict[str, Callable[..., str]]:
+    def search(query: str):
+        """Search the web for the given query."""
+        time.sleep(latency)
+        return f"1. Mock result for '{query}'\nhttps://example.com/\nA short snippet that answers '{query}'."
+
+    def get_weather(city: str) -> str:
+        time.sleep(latency)
+        return f"{city}当前天气:晴，气温22摄氏度"
+
+    def get_attraction(city: str, weather: str = "") -> str:
+        time.sleep(latency)
+        return f"根据搜索，为您找到以下信息:\n- {city}的景点A: 适合{weather}天气游览\n- {city}的景点B: 室内外皆宜"
+
+    return {"search": search, "get_weather": get_weather, "get_attraction": get_attraction}
+
+
+def make_mock_travel_executor(latency: float = 0.0) -> ToolExecutor:
+    tools = make_mock_tools(latency)
+    return ToolExecutor({"get_weather": tools["get_weather"], "get_attraction": tools["get_attraction"]})
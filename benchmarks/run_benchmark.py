@@ -0,0 +1,329 @@
+"""
+Benchmarks the agent loops end-to-end against the local mock LLM server and mock tools,
+so throughput and latency can be measured without SiliconFlow, SerpApi, Tavily or wttr.in.
+
+    python benchmarks/run_benchmark.py --agent react --sessions 16 --questions 64
+    python benchmarks/run_benchmark.py --agent plan_and_solve --mode async --json bench.json
+    python benchmarks/run_benchmark.py --agent react --baseline bench.json --max-regression 0.2
+
+Reports LLM-call, tool-call and per-question latency percentiles, turns (LLM calls) per
+question, token counts and throughput. With --baseline the run fails (exit code 1) when
+p50 question latency or throughput regress by more than --max-regression.
+Start-up import time is checked separately by benchmarks/import_time.py.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.mock_llm_server import MockLLMServer, ScriptedResponder
+from benchmarks.mock_tools import make_mock_tools
+from common.available_tools import ToolExecutor
+from common.tracing import configure_tracing, get_tracer
+from common.transcript import count_tokens
+from travel_agent.llm_client import AsyncOpenAICompatibleClient, OpenAICompatibleClient, achat
+
+AGENTS = ["react", "plan_and_solve", "reflection", "travel"]
+TRAVEL_CITIES = ["北京", "上海", "广州", "深圳", "杭州", "成都", "西安", "南京"]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "mean": 0.0, "count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "p50": round(pick(0.50), 2),
+        "p90": round(pick(0.90), 2),
+        "p99": round(pick(0.99), 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "count": len(ordered),
+    }
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.llm_latencies: List[float] = []
+        self.tool_latencies: List[float] = []
+        self.question_latencies: List[float] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def llm_call(self, messages: List[Dict[str, str]], content: str, elapsed: float) -> None:
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        completion_tokens = count_tokens(content)
+        with self._lock:
+            self.llm_latencies.append(elapsed)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def add(self, samples: List[float], value: float) -> None:
+        with self._lock:
+            samples.append(value)
+
+
+class InstrumentedLLM:
+    """Wraps a sync or async client and records latency and tokens for every call."""
+
+    def __init__(self, llm: Any, recorder: Recorder):
+        self.llm = llm
+        self.recorder = recorder
+
+    def _wrap_stream(self, messages, chunks, start):
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self.recorder.llm_call(messages, "".join(parts), time.perf_counter() - start)
+
+    async def _awrap_stream(self, messages, chunks, start):
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            await chunks.aclose()
+            self.recorder.llm_call(messages, "".join(parts), time.perf_counter() - start)
+
+    def chat(self, messages, stream=False, **kwargs):
+        start = time.perf_counter()
+        result = self.llm.chat(messages, stream=stream, **kwargs)
+        if stream:
+            return self._wrap_stream(messages, result, start)
+        self.recorder.llm_call(messages, result, time.perf_counter() - start)
+        return result
+
+    def generate(self, prompt, system_prompt, stream=False, **kwargs):
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+        return self.chat(messages, stream=stream, **kwargs)
+
+    async def achat(self, messages, stream=False, **kwargs):
+        start = time.perf_counter()
+        result = await achat(self.llm, messages, stream=stream, **kwargs)
+        if stream:
+            if hasattr(result, "__aiter__"):
+                return self._awrap_stream(messages, result, start)
+            return self._wrap_stream(messages, result, start)
+        self.recorder.llm_call(messages, result, time.perf_counter() - start)
+        return result
+
+    async def agenerate(self, prompt, system_prompt, stream=False, **kwargs):
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+        return await self.achat(messages, stream=stream, **kwargs)
+
+
+def timed_tools(latency: float, recorder: Recorder) -> Dict[str, Callable[..., str]]:
+    def wrap(func):
+        def timed(**kwargs):
+            start = time.perf_counter()
+            try:
+                return func(**kwargs)
+            finally:
+                recorder.add(recorder.tool_latencies, time.perf_counter() - start)
+        timed.__name__ = func.__name__
+        timed.__doc__ = func.__doc__
+        return timed
+
+    return {name: wrap(func) for name, func in make_mock_tools(latency).items()}
+
+
+def build_runner(agent: str, llm: Any, tools: Dict[str, Callable[..., str]], stream: bool, prefetch: bool = False, samples: int = 1, plan_cache: bool = False, answer_cache: bool = False):
+    """Returns (sync run function, async run function or None) for the chosen agent."""
+    from common.answer_cache import AnswerCache
+
+    cache = AnswerCache() if answer_cache else None
+    if agent == "react":
+        from common.prefetch import question_as_query
+        from ReAct.ReAct_agent import ReActAgent
+
+        react = ReActAgent(llm, [tools["search"]], stream=stream, prefetch_rules=[question_as_query("search")] if prefetch else None, answer_cache=cache)
+        return react.run, react.arun
+    if agent == "plan_and_solve":
+        from PlanAndSolve.plan_and_solve_agent import PlanAndSolveAgent
+        from PlanAndSolve.plan_cache import PlanCache
+        from PlanAndSolve.planner import Planner
+        from PlanAndSolve.solver import Solver
+
+        solver = Solver(llm, [tools["search"]], stream=stream)
+        planner = Planner(llm, plan_cache=PlanCache() if plan_cache else None)
+        pas = PlanAndSolveAgent(llm, [tools["search"]], planner=planner, solver=solver, answer_cache=cache)
+        return pas.run, pas.arun
+    if agent == "reflection":
+        from ReAct.ReAct_agent import ReActAgent
+        from Reflection.reflection_agent import ReflectionAgent
+
+        reflection = ReflectionAgent(llm, ReActAgent(llm, [tools["search"]], stream=stream), num_samples=samples)
+        return reflection.run, reflection.arun
+    if agent == "travel":
+        from run_travel_agent import run_travel_agent
+        from travel_agent.tools import create_travel_prefetcher
+
+        executor = ToolExecutor({"get_weather": tools["get_weather"], "get_attraction": tools["get_attraction"]})
+        prefetcher = create_travel_prefetcher(executor) if prefetch else None
+        return (lambda question: run_travel_agent(llm, question, executor, prefetcher=prefetcher)), None
+    raise ValueError(f"Unknown agent: {agent}")
+
+
+def load_questions(args) -> List[str]:
+    if args.questions_file:
+        with open(args.questions_file, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        questions = [row.get("question") or row.get("body") or row.get("title") for row in rows]
+        return [q for q in questions if q][: args.questions]
+    if args.agent == "travel":
+        return [f"我下周想去{TRAVEL_CITIES[i % len(TRAVEL_CITIES)]}玩，请帮我推荐一些适合的景点" for i in range(args.questions)]
+    return [f"Benchmark question #{i}: what happened to topic {i}?" for i in range(args.questions)]
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    recorder = Recorder()
+    responder = ScriptedResponder.from_jsonl(args.replay, tool_turns=args.tool_turns) if args.replay else ScriptedResponder(tool_turns=args.tool_turns)
+    questions = load_questions(args)
+    tools = timed_tools(args.tool_latency, recorder)
+
+    with MockLLMServer(responder, latency=args.llm_latency, token_latency=args.token_latency) as server:
+        if args.mode == "async":
+            base_llm = AsyncOpenAICompatibleClient(model="mock", api_key="mock", base_url=server.base_url)
+        else:
+            base_llm = OpenAICompatibleClient(model="mock", api_key="mock", base_url=server.base_url)
+        llm = InstrumentedLLM(base_llm, recorder)
+        run, arun = build_runner(args.agent, llm, tools, args.stream, args.prefetch, args.samples, args.plan_cache, args.answer_cache)
+
+        def one(question: str) -> None:
+            start = time.perf_counter()
+            try:
+                run(question)
+            except Exception:
+                recorder.error()
+            recorder.add(recorder.question_latencies, time.perf_counter() - start)
+
+        async def aone(question: str, semaphore: asyncio.Semaphore) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await arun(question)
+                except Exception:
+                    recorder.error()
+                recorder.add(recorder.question_latencies, time.perf_counter() - start)
+
+        async def amain() -> None:
+            semaphore = asyncio.Semaphore(args.sessions)
+            await asyncio.gather(*(aone(q, semaphore) for q in questions))
+            await AsyncOpenAICompatibleClient.aclose_shared()
+
+        started = time.perf_counter()
+        if args.mode == "async":
+            if arun is None:
+                raise SystemExit(f"The {args.agent} agent has no async entry point; use --mode thread.")
+            asyncio.run(amain())
+        else:
+            with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+                list(pool.map(one, questions))
+        wall_time = time.perf_counter() - started
+
+    total_tokens = recorder.prompt_tokens + recorder.completion_tokens
+    return {
+        "agent": args.agent,
+        "mode": args.mode,
+        "stream": args.stream,
+        "prefetch": args.prefetch,
+        "samples": args.samples,
+        "plan_cache": args.plan_cache,
+        "answer_cache": args.answer_cache,
+        "sessions": args.sessions,
+        "questions": len(questions),
+        "errors": recorder.errors,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_qps": round(len(questions) / wall_time, 3) if wall_time else 0.0,
+        "turns_per_question": round(len(recorder.llm_latencies) / max(len(questions), 1), 2),
+        "prompt_tokens": recorder.prompt_tokens,
+        "completion_tokens": recorder.completion_tokens,
+        "tokens_per_second": round(total_tokens / wall_time, 1) if wall_time else 0.0,
+        "llm_call_latency_ms": percentiles(recorder.llm_latencies),
+        "tool_latency_ms": percentiles(recorder.tool_latencies),
+        "question_latency_ms": percentiles(recorder.question_latencies),
+    }
+
+
+def check_regression(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    failures = []
+    p50, base_p50 = report["question_latency_ms"]["p50"], baseline["question_latency_ms"]["p50"]
+    if base_p50 and p50 > base_p50 * (1 + max_regression):
+        failures.append(f"p50 question latency {p50}ms vs baseline {base_p50}ms")
+    qps, base_qps = report["throughput_qps"], baseline["throughput_qps"]
+    if base_qps and qps < base_qps * (1 - max_regression):
+        failures.append(f"throughput {qps} q/s vs baseline {base_qps} q/s")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent", choices=AGENTS, default="react")
+    parser.add_argument("--mode", choices=["thread", "async"], default="thread")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent agent sessions")
+    parser.add_argument("--questions", type=int, default=32)
+    parser.add_argument("--questions-file", help="JSONL file with a 'question' field per line")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="mock time to first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="mock per-token latency (s)")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="mock tool latency (s)")
+    parser.add_argument("--tool-turns", type=int, default=1, help="tool calls per ReAct loop before answering")
+    parser.add_argument("--stream", action="store_true", help="use the streaming ReAct loop")
+    parser.add_argument("--prefetch", action="store_true", help="speculatively prefetch likely tool calls (react and travel agents)")
+    parser.add_argument("--samples", type=int, default=1, help="parallel self-consistency samples per reflection round")
+    parser.add_argument("--plan-cache", action="store_true", help="reuse cached plans for same-shaped questions (plan_and_solve agent)")
+    parser.add_argument("--answer-cache", action="store_true", help="cache of final answers (react and plan_and_solve agents)")
+    parser.add_argument("--replay", help="JSONL replay rules for the mock LLM ({\"match\", \"response\"})")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--trace", help="export tracing spans to this JSONL file")
+    parser.add_argument("--log-level", default="WARNING", help="agent log level; progress logs are I/O inside the measurement")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+    if args.trace:
+        configure_tracing(jsonl_path=args.trace)
+    try:
+        report = run_benchmark(args)
+    finally:
+        get_tracer().shutdown()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = check_regression(report, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
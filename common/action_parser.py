@@ -0,0 +1,257 @@
+import ast
+import inspect
+import json
+import re
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from common.available_tools import ToolCall
+
+# 一次扫描找出所有段落标记；"Action Input" 必须排在 "Action" 之前
+_MARKER_RE = re.compile(r"(?<![\w])(Final Answer|Action Input|Action|Observation|Thought)[ \t]*[:：][ \t]*")
+_CALL_RE = re.compile(r"([A-Za-z_]\w*)[ \t]*\(")
+_NAME_RE = re.compile(r"[`'\"\[]?([A-Za-z_][\w.-]*)[`'\"\]]?")
+# ast 解析失败时的宽松匹配: 字符串值一直延伸到 `, 参数名=` 或结尾，允许值中出现未转义的引号与换行
+_LENIENT_ARG_RE = re.compile(r"""(\w+)\s*=\s*(["'])(.*?)\2\s*(?=,\s*\w+\s*=|$)""", re.DOTALL)
+
+
+class ParsedResponse:
+    """
+    一轮模型回复的解析结果:
+    - final_answer: 模型给出的最终答案 (Final Answer: ... 或 finish(answer="..."))；
+    - calls: 按出现顺序排列的工具调用 (ToolCall，参数已按工具签名绑定为关键字参数)；
+    - error: 回复里有行动但无法解析时的原因，可直接作为 Observation 反馈给模型；
+    - end: 最后一个完整行动在原文中的结束位置，之后的内容可以丢弃。
+    """
+
+    def __init__(
+        self,
+        final_answer: Optional[str] = None,
+        calls: Optional[List[ToolCall]] = None,
+        error: Optional[str] = None,
+        end: int = 0,
+    ):
+        self.final_answer = final_answer
+        self.calls = calls or []
+        self.error = error
+        self.end = end
+
+    @property
+    def call(self) -> Optional[ToolCall]:
+        return self.calls[0] if self.calls else None
+
+    def __repr__(self) -> str:
+        return f"ParsedResponse(final_answer={self.final_answer!r}, calls={self.calls!r}, error={self.error!r})"
+
+
+class ActionParser:
+    """
+    预编译的单遍行动解析器，同时支持两种写法:
+    - ReAct: "Action: search" + "Action Input: ..."；Action Input 是 JSON 对象时按参数名展开，
+      否则整行作为工具第一个参数的值；
+    - 函数调用: "Action: get_weather(city="北京", days=3)"，参数按 Python 字面量解析
+      (字符串、数字、布尔值、列表等)，位置参数按工具签名绑定到参数名。
+    finish_tool 指定的调用 (如 finish(answer="...")) 视为最终答案。
+    一条回复中可以包含多个行动，按顺序全部返回。
+    """
+
+    def __init__(
+        self,
+        tools: Optional[Mapping[str, Callable[..., Any]]] = None,
+        default_arg: str = "query",
+        finish_tool: Optional[str] = None,
+    ):
+        self.default_arg = default_arg
+        self.finish_tool = finish_tool
+        # 工具名 -> 参数名列表，初始化时读取一次签名
+        self._params: Dict[str, List[str]] = {name: _param_names(func) for name, func in (tools or {}).items()}
+
+    def parse(self, text: str, final: bool = True) -> ParsedResponse:
+        """
+        解析一轮回复。final=False 用于流式输出的中途: 尚未换行的 Action Input 与
+        尚不完整的 JSON 视为未结束，不会被当作工具调用返回。
+        """
+        result = ParsedResponse()
+        markers = list(_MARKER_RE.finditer(text))
+        pending_action: Optional[str] = None
+        for i, marker in enumerate(markers):
+            kind = marker.group(1)
+            if kind == "Observation":
+                # 模型开始编造观察结果，之后的内容都不可信
+                break
+            if kind == "Final Answer":
+                stop = next((m.start() for m in markers[i + 1:] if m.group(1) == "Observation"), len(text))
+                result.final_answer = text[marker.end():stop].strip()
+                result.end = stop
+                break
+            if kind == "Thought":
+                continue
+            segment = text[marker.end():markers[i + 1].start() if i + 1 < len(markers) else len(text)]
+            if kind == "Action":
+                call_match = _CALL_RE.match(segment)
+                if call_match:
+                    pending_action = None
+                    if not self._add_call(result, call_match, text, marker.end(), final):
+                        break
+                    continue
+                first_line = segment.split("\n", 1)[0].strip()
+                name_match = _NAME_RE.fullmatch(first_line)
+                if name_match:
+                    pending_action = name_match.group(1)
+                else:
+                    result.error = f"Cannot parse action {first_line!r}." if first_line else "Empty 'Action:'."
+            elif kind == "Action Input":
+                if pending_action is None:
+                    continue
+                action_input, end = _read_input(segment, final)
+                if action_input is None:
+                    # Action Input 尚未结束 (流式输出中途)
+                    break
+                name, pending_action = pending_action, None
+                kwargs = self._bind_input(name, action_input)
+                result.end = marker.end() + end
+                if self.finish_tool is not None and name == self.finish_tool:
+                    result.final_answer = str(next(iter(kwargs.values()), ""))
+                    break
+                result.calls.append(ToolCall(name, kwargs))
+        if result.final_answer is not None:
+            result.calls = []
+            result.error = None
+        elif result.calls:
+            result.error = None
+        elif pending_action is not None and result.error is None:
+            result.error = f"Missing 'Action Input:' for action '{pending_action}'."
+        return result
+
+    def _add_call(self, result: ParsedResponse, call_match: "re.Match", text: str, offset: int, final: bool) -> bool:
+        """解析函数调用写法的行动并加入 result；调用不完整或是 finish 时返回 False，停止继续解析。"""
+        name = call_match.group(1)
+        args_start = offset + call_match.end()
+        close = _find_call_end(text, args_start, lenient=final)
+        if close == -1:
+            result.error = f"Unterminated call to '{name}': missing ')'."
+            return False
+        try:
+            args, kwargs = _parse_arguments(text[args_start:close])
+            kwargs = self._bind(name, args, kwargs)
+        except ValueError as e:
+            result.error = f"Invalid arguments for '{name}': {e}"
+            result.end = close + 1
+            return True
+        result.end = close + 1
+        if self.finish_tool is not None and name == self.finish_tool:
+            result.final_answer = str(kwargs.get("answer", next(iter(kwargs.values()), "")))
+            return False
+        result.calls.append(ToolCall(name, kwargs))
+        return True
+
+    def _bind_input(self, name: str, action_input: str) -> Dict[str, Any]:
+        if action_input.startswith("{"):
+            try:
+                value = json.loads(action_input)
+            except ValueError:
+                value = None
+            if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+                params = self._params.get(name)
+                if params is None or all(k in params for k in value):
+                    return value
+        params = self._params.get(name)
+        return {params[0] if params else self.default_arg: action_input}
+
+    def _bind(self, name: str, args: List[Any], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if not args:
+            return kwargs
+        params = self._params.get(name)
+        if params is None:
+            if len(args) > 1:
+                raise ValueError(f"unknown tool '{name}' called with {len(args)} positional arguments")
+            params = [self.default_arg]
+        if len(args) > len(params):
+            raise ValueError(f"takes {len(params)} arguments but {len(args)} were given")
+        bound = dict(zip(params, args))
+        duplicated = set(bound) & set(kwargs)
+        if duplicated:
+            raise ValueError(f"got multiple values for {', '.join(sorted(duplicated))}")
+        bound.update(kwargs)
+        return bound
+
+
+def _param_names(func: Callable[..., Any]) -> List[str]:
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return []
+    return [p.name for p in parameters if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)]
+
+
+def _read_input(segment: str, final: bool = True) -> Tuple[Optional[str], int]:
+    """
+    读取 Action Input 的值，返回 (值, 在 segment 中的结束位置)；值尚未结束时返回 (None, 0)。
+    JSON 对象可以跨多行，其余输入只取第一行。
+    """
+    stripped = segment.lstrip()
+    if stripped.startswith("{"):
+        start = len(segment) - len(stripped)
+        try:
+            _, end = json.JSONDecoder().raw_decode(stripped)
+            return stripped[:end], start + end
+        except ValueError:
+            if not final:
+                return None, 0
+    newline = segment.find("\n")
+    if newline == -1:
+        if not final or not segment.strip():
+            return None, 0
+        return segment.strip(), len(segment)
+    return segment[:newline].strip(), newline + 1
+
+
+def _find_call_end(text: str, start: int, lenient: bool = True) -> int:
+    """
+    找到与调用左括号匹配的右括号位置 (跳过字符串中的括号)；找不到时返回 -1。
+    lenient=True 时，若字符串里出现未转义的引号导致无法配对，退回到最后一个 ")"。
+    """
+    depth = 0
+    quote: Optional[str] = None
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            if depth == 0:
+                if ch == ")":
+                    return i
+                break
+            depth -= 1
+        i += 1
+    return text.rfind(")", start) if lenient else -1
+
+
+def _parse_arguments(arg_str: str) -> Tuple[List[Any], Dict[str, Any]]:
+    """把调用括号内的参数解析为 (位置参数, 关键字参数)，值按 Python 字面量解析。"""
+    if not arg_str.strip():
+        return [], {}
+    try:
+        node = ast.parse(f"f({arg_str})", mode="eval").body
+        if isinstance(node, ast.Call) and all(kw.arg is not None for kw in node.keywords):
+            args = [ast.literal_eval(arg) for arg in node.args]
+            kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in node.keywords}
+            return args, kwargs
+    except (SyntaxError, ValueError):
+        pass
+    lenient = _LENIENT_ARG_RE.findall(arg_str.strip())
+    if lenient:
+        return [], {name: value for name, _, value in lenient}
+    raise ValueError(f"cannot parse {arg_str.strip()!r}")
+
+
+def parse_actions(text: str, tools: Optional[Mapping[str, Callable[..., Any]]] = None, **kwargs: Any) -> ParsedResponse:
+    """便捷函数: 用一次性的 ActionParser 解析文本。频繁调用时请复用 ActionParser 实例。"""
+    return ActionParser(tools, **kwargs).parse(text)
@@ -0,0 +1,101 @@
+import logging
+import re
+from typing import Dict, List, Optional, Union
+
+from common.cache import SQLiteCache, TTLCache, make_cache_key
+from common.search import normalize_query
+from common.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+# 同义词统一为第一个写法；只做同位置替换，不改变词序
+DEFAULT_SYNONYMS: Dict[str, List[str]] = {
+    "得主": ["获得者", "获奖者", "获奖人", "winner", "recipient"],
+    "谁": ["哪位", "who"],
+    "最新": ["latest", "newest"],
+    "版本": ["version"],
+    "天气": ["weather"],
+}
+# 增删这些虚词不改变问题的含义
+FILLER_TOKENS = frozenset({
+    "的", "了", "吗", "呢", "啊", "呀", "请", "问", "是",
+    "the", "a", "an", "please", "is", "are", "was", "of", "s", "'", "’",
+})
+# 英文单词/数字 (年份后的 "年" 一并吞掉)、单个汉字、其他符号 (运算符等)；空白与标点不计
+_TOKEN_RE = re.compile(r"(\d{4})年|[a-z0-9_]+|[\u4e00-\u9fff]|[^\s\w?？.。!！,，、]")
+
+
+class AnswerCache:
+    """
+    答案缓存: 规范化后相同的问题直接返回以前的最终答案，跳过整个智能体流程。
+
+    规范化 (canonical_question): normalize_query 之后去掉虚词 (的、了、请问、是、the、is 等)、
+    年份后的 "年"，并把同义词统一写法 (得主/获得者/获奖者/winner、谁/who 等，可通过 synonyms 扩充)。
+    词序保持不变，所以 "2024年图灵奖得主是谁？"、"请问2024年的图灵奖得主是谁"、"2024图灵奖获得者是谁"
+    命中同一条缓存；换了句式的问题 (例如 "谁获得了2024年的图灵奖") 不会命中。
+    只要有一个实词、数字或比较词不同 (北京/南京、明天/后天、最高/最低) 就是不同的问题，
+    词序不同也不合并 ("A是B的父亲" 与 "B是A的父亲")，宁可多跑一次智能体也不返回错误答案。
+
+    不提供 path 时缓存在内存中 (TTLCache)；提供 path 时存入 SQLite，进程重启后依然有效。
+    超过 ttl 秒的答案不再返回，条目数超过 max_entries 后淘汰最久未用的条目。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_entries: int = 5000,
+        synonyms: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.store: Union[TTLCache, SQLiteCache] = (
+            SQLiteCache(path, max_entries=max_entries, ttl=ttl, table="answers") if path else TTLCache(max_entries=max_entries, ttl=ttl)
+        )
+        self._synonyms: Dict[str, str] = {}
+        for canonical, variants in {**DEFAULT_SYNONYMS, **(synonyms or {})}.items():
+            for variant in variants:
+                self._synonyms[normalize_query(variant)] = canonical
+        # 多字同义词优先匹配，英文同义词只匹配整词
+        patterns = []
+        for variant in sorted(self._synonyms, key=len, reverse=True):
+            pattern = re.escape(variant)
+            if variant[0].isascii():
+                pattern = r"(?<![a-z0-9_])" + pattern + r"(?![a-z0-9_])"
+            patterns.append(pattern)
+        self._synonym_re = re.compile("|".join(patterns)) if patterns else None
+
+    def canonical_question(self, question: str) -> str:
+        """问题的规范形式，规范形式相同的问题共用一条缓存。"""
+        text = normalize_query(question)
+        if self._synonym_re is not None:
+            text = self._synonym_re.sub(lambda m: " " + self._synonyms[m.group()] + " ", text)
+        tokens = []
+        for m in _TOKEN_RE.finditer(text):
+            token = m.group(1) or m.group()
+            if token not in FILLER_TOKENS:
+                tokens.append(token)
+        return " ".join(tokens)
+
+    def _key(self, question: str) -> str:
+        return make_cache_key("answer", self.canonical_question(question))
+
+    def get(self, question: str) -> Optional[str]:
+        """返回同一问题的缓存答案，没有命中时返回 None。"""
+        record = self.store.get(self._key(question))
+        if record is None:
+            self.misses += 1
+            annotate(answer_cache="miss")
+            return None
+        self.hits += 1
+        annotate(answer_cache="hit")
+        logger.info("答案缓存命中: %s", record["question"])
+        return record["answer"]
+
+    def set(self, question: str, answer: str) -> None:
+        """缓存问题的最终答案；同一问题的旧答案被覆盖。"""
+        self.store.set(self._key(question), {"question": question, "answer": answer})
+
+    def __len__(self) -> int:
+        return len(self.store)
@@ -1,33 +1,334 @@
-from typing import Any, Callable, Dict, Iterable, Optional
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+import weakref
+from concurrent.futures import CancelledError, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from common.tracing import span
+
+
+class ToolCall:
+    def __init__(self, name: str, kwargs: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None):
+        self.name = name
+        self.kwargs = dict(kwargs or {})
+        self.timeout = timeout
+
+    def __repr__(self) -> str:
+        return f"ToolCall({self.name!r}, {self.kwargs!r})"
+
+
+class ToolResult:
+    def __init__(self, call: ToolCall, value: Any = None, error: Optional[BaseException] = None, elapsed: float = 0.0):
+        self.call = call
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def name(self) -> str:
+        return self.call.name
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"ToolResult({self.name!r}, {status}, elapsed={self.elapsed:.3f}s)"
 
 
 class ToolExecutor:
-    def __init__(self, tools: Optional[Dict[str, Callable[..., Any]]] = None):
+    """
+    按名称执行工具。工具既可以是普通函数，也可以是协程函数 (async def)；
+    同一个工具还可以通过 async_tools 额外提供异步实现:
+    - execute / execute_many 优先使用同步实现，只有异步实现的工具在调用线程中用 asyncio.run 执行；
+    - aexecute / aexecute_many 优先使用异步实现，直接在事件循环中等待，
+      只有同步实现的工具自动交给有界线程池 (max_workers) 执行，不会阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        tools: Optional[Dict[str, Callable[..., Any]]] = None,
+        max_workers: int = 8,
+        concurrency_limits: Optional[Dict[str, int]] = None,
+        default_timeout: Optional[float] = None,
+        async_tools: Optional[Dict[str, Callable[..., Awaitable[Any]]]] = None,
+    ):
         self._tools: Dict[str, Callable[..., Any]] = dict(tools or {})
+        self._async_tools: Dict[str, Callable[..., Awaitable[Any]]] = dict(async_tools or {})
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self._limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._limit_values: Dict[str, int] = {}
+        # 事件循环 -> {工具名: asyncio.Semaphore}；asyncio 信号量绑定在创建它的事件循环上
+        self._async_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+        for name, limit in (concurrency_limits or {}).items():
+            self.set_concurrency_limit(name, limit)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
 
-    def register(self, name: str, func: Callable[..., Any]) -> None:
+    def register(self, name: str, func: Callable[..., Any], async_func: Optional[Callable[..., Awaitable[Any]]] = None) -> None:
+        """注册工具；async_func 为可选的异步实现，供 aexecute 使用。"""
         if not name or not isinstance(name, str):
             raise ValueError("工具名称必须是非空字符串。")
-        if not callable(func):
+        if not callable(func) or (async_func is not None and not callable(async_func)):
             raise ValueError("工具必须是可调用对象。")
-        if name in self._tools:
+        if name in self._tools or name in self._async_tools:
             raise KeyError(f"工具已存在，禁止重复注册: {name}")
         self._tools[name] = func
+        if async_func is not None:
+            self._async_tools[name] = async_func
 
     def unregister(self, name: str) -> None:
         self._tools.pop(name, None)
+        self._async_tools.pop(name, None)
 
     def has(self, name: str) -> bool:
-        return name in self._tools
+        return name in self._tools or name in self._async_tools
 
     def list(self) -> Iterable[str]:
-        return self._tools.keys()
+        return list(dict.fromkeys([*self._tools, *self._async_tools]))
 
     def get(self, name: str) -> Optional[Callable[..., Any]]:
-        return self._tools.get(name)
+        return self._tools.get(name) or self._async_tools.get(name)
+
+    def _get_async(self, name: str) -> Optional[Callable[..., Awaitable[Any]]]:
+        func = self._async_tools.get(name)
+        if func is None and inspect.iscoroutinefunction(self._tools.get(name)):
+            func = self._tools[name]
+        return func
 
     def execute(self, name: str, **kwargs: Any) -> Any:
         func = self._tools.get(name)
-        if not func:
+        if func is None or inspect.iscoroutinefunction(func):
+            afunc = self._get_async(name)
+            if afunc is None:
+                raise KeyError(f"工具不存在: {name}")
+            # 只有异步实现的工具: 在当前线程中运行一个事件循环 (请勿在事件循环线程中调用，改用 aexecute)
+            func = lambda **kw: asyncio.run(afunc(**kw))
+        with span("tool.execute", tool=name):
+            return func(**kwargs)
+
+    async def aexecute(self, name: str, **kwargs: Any) -> Any:
+        """
+        在事件循环中执行工具: 异步实现直接等待 (受 concurrency_limits 限制)，
+        同步实现交给有界线程池，避免阻塞事件循环。
+        """
+        afunc = self._get_async(name)
+        if afunc is None:
+            if name not in self._tools:
+                raise KeyError(f"工具不存在: {name}")
+            value, _ = await self._arun_in_pool(ToolCall(name, kwargs), threading.Event())
+            return value
+        semaphore = self._get_async_limit(name)
+        with span("tool.execute", tool=name):
+            if semaphore is None:
+                return await afunc(**kwargs)
+            async with semaphore:
+                return await afunc(**kwargs)
+
+    def set_concurrency_limit(self, name: str, limit: int) -> None:
+        """限制同名工具的最大并发调用数 (例如对有速率限制的外部 API)。"""
+        if limit <= 0:
+            raise ValueError("并发上限必须为正整数。")
+        self._limits[name] = threading.BoundedSemaphore(limit)
+        self._limit_values[name] = limit
+        for semaphores in self._async_limits.values():
+            semaphores.pop(name, None)
+
+    def _get_async_limit(self, name: str) -> Optional[asyncio.Semaphore]:
+        limit = self._limit_values.get(name)
+        if limit is None:
+            return None
+        semaphores = self._async_limits.setdefault(asyncio.get_running_loop(), {})
+        if name not in semaphores:
+            semaphores[name] = asyncio.Semaphore(limit)
+        return semaphores[name]
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+            return self._pool
+
+    def _run_call(self, call: ToolCall, abandoned: threading.Event) -> Tuple[Any, float]:
+        limit = self._limits.get(call.name)
+        if limit is not None:
+            # 等待名额期间若调用已超时或被取消，则不再执行
+            while not limit.acquire(timeout=0.05):
+                if abandoned.is_set():
+                    raise CancelledError()
+        try:
+            if abandoned.is_set():
+                raise CancelledError()
+            start = time.perf_counter()
+            value = self.execute(call.name, **call.kwargs)
+            return value, time.perf_counter() - start
+        finally:
+            if limit is not None:
+                limit.release()
+
+    def submit(self, name: str, **kwargs: Any) -> Future:
+        """在有界线程池中执行一个工具调用而不等待结果，返回 Future (结果为工具的返回值)。"""
+        if not self.has(name):
             raise KeyError(f"工具不存在: {name}")
-        return func(**kwargs)
+        call = ToolCall(name, kwargs)
+
+        def run() -> Any:
+            return self._run_call(call, threading.Event())[0]
+
+        # 复制当前上下文，使工具 span 挂在调用方的 span 之下
+        return self._get_pool().submit(contextvars.copy_context().run, run)
+
+    def execute_many(
+        self,
+        calls: Iterable[Union[ToolCall, Tuple[str, Dict[str, Any]]]],
+        timeout: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> List[ToolResult]:
+        """
+        在有界线程池中并发执行多个工具调用，按输入顺序返回 ToolResult 列表。
+
+        - 每个调用的超时为 ToolCall.timeout，其次为 timeout，最后为 default_timeout；
+          超时的调用以 TimeoutError 结束 (线程无法被强制终止，其结果会被丢弃)。
+        - cancel_event 被设置后，所有尚未完成的调用以 CancelledError 结束。
+        - 单个调用失败不会影响其他调用，异常记录在 ToolResult.error 中。
+        """
+        calls = [c if isinstance(c, ToolCall) else ToolCall(c[0], c[1]) for c in calls]
+        results: List[Optional[ToolResult]] = [None] * len(calls)
+        pool = self._get_pool()
+        start = time.monotonic()
+
+        futures: Dict[Future, int] = {}
+        deadlines: Dict[Future, Optional[float]] = {}
+        abandoned: Dict[Future, threading.Event] = {}
+        for i, call in enumerate(calls):
+            if not self.has(call.name):
+                results[i] = ToolResult(call, error=KeyError(f"工具不存在: {call.name}"))
+                continue
+            flag = threading.Event()
+            # 复制当前上下文，使工具 span 挂在调用方的 span 之下
+            future = pool.submit(contextvars.copy_context().run, self._run_call, call, flag)
+            call_timeout = call.timeout if call.timeout is not None else (timeout if timeout is not None else self.default_timeout)
+            futures[future] = i
+            deadlines[future] = start + call_timeout if call_timeout is not None else None
+            abandoned[future] = flag
+
+        def finish(future: Future, error: BaseException) -> None:
+            future.cancel()
+            abandoned[future].set()
+            results[futures[future]] = ToolResult(calls[futures[future]], error=error, elapsed=time.monotonic() - start)
+
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[f] is not None and deadlines[f] <= now]:
+                pending.discard(future)
+                finish(future, TimeoutError(f"工具执行超时: {calls[futures[future]].name}"))
+            if cancel_event is not None and cancel_event.is_set():
+                for future in pending:
+                    finish(future, CancelledError())
+                pending.clear()
+            if not pending:
+                break
+
+            upcoming = [deadlines[f] - now for f in pending if deadlines[f] is not None]
+            wait_for = min(upcoming) if upcoming else None
+            if cancel_event is not None:
+                wait_for = 0.05 if wait_for is None else min(wait_for, 0.05)
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                call = calls[futures[future]]
+                try:
+                    value, elapsed = future.result()
+                    results[futures[future]] = ToolResult(call, value=value, elapsed=elapsed)
+                except BaseException as e:
+                    results[futures[future]] = ToolResult(call, error=e, elapsed=time.monotonic() - start)
+        return results
+
+    async def _arun_in_pool(self, call: ToolCall, abandoned: threading.Event) -> Tuple[Any, float]:
+        loop = asyncio.get_running_loop()
+        # 复制当前上下文，使工具 span 挂在调用方的 span 之下
+        run = functools.partial(contextvars.copy_context().run, self._run_call, call, abandoned)
+        return await loop.run_in_executor(self._get_pool(), run)
+
+    async def _arun_call(self, call: ToolCall, abandoned: threading.Event) -> Tuple[Any, float]:
+        if self._get_async(call.name) is None:
+            return await self._arun_in_pool(call, abandoned)
+        start = time.perf_counter()
+        value = await self.aexecute(call.name, **call.kwargs)
+        return value, time.perf_counter() - start
+
+    async def aexecute_many(
+        self,
+        calls: Iterable[Union[ToolCall, Tuple[str, Dict[str, Any]]]],
+        timeout: Optional[float] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+    ) -> List[ToolResult]:
+        """
+        execute_many 的异步版本: 在当前事件循环中并发执行多个工具调用，按输入顺序返回 ToolResult 列表。
+        超时、取消与错误处理的语义与 execute_many 相同；异步工具超时或取消时会被真正取消。
+        """
+        calls = [c if isinstance(c, ToolCall) else ToolCall(c[0], c[1]) for c in calls]
+        results: List[Optional[ToolResult]] = [None] * len(calls)
+        start = time.monotonic()
+        tasks: Dict["asyncio.Task", int] = {}
+        abandoned: Dict["asyncio.Task", threading.Event] = {}
+
+        async def run_one(call: ToolCall, flag: threading.Event) -> Tuple[Any, float]:
+            call_timeout = call.timeout if call.timeout is not None else (timeout if timeout is not None else self.default_timeout)
+            try:
+                return await asyncio.wait_for(self._arun_call(call, flag), call_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"工具执行超时: {call.name}") from None
+            finally:
+                # 线程池中尚未开始的同步调用不再执行
+                flag.set()
+
+        for i, call in enumerate(calls):
+            if not self.has(call.name):
+                results[i] = ToolResult(call, error=KeyError(f"工具不存在: {call.name}"))
+                continue
+            flag = threading.Event()
+            task = asyncio.ensure_future(run_one(call, flag))
+            tasks[task] = i
+            abandoned[task] = flag
+
+        pending = set(tasks)
+        waiter = asyncio.ensure_future(cancel_event.wait()) if cancel_event is not None else None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending | ({waiter} if waiter else set()), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is waiter:
+                        continue
+                    pending.discard(task)
+                    call = calls[tasks[task]]
+                    try:
+                        value, elapsed = task.result()
+                        results[tasks[task]] = ToolResult(call, value=value, elapsed=elapsed)
+                    except BaseException as e:
+                        results[tasks[task]] = ToolResult(call, error=e, elapsed=time.monotonic() - start)
+                if waiter is not None and waiter.done():
+                    for task in pending:
+                        task.cancel()
+                        abandoned[task].set()
+                        results[tasks[task]] = ToolResult(calls[tasks[task]], error=CancelledError(), elapsed=time.monotonic() - start)
+                    pending.clear()
+        finally:
+            if waiter is not None:
+                waiter.cancel()
+            for task in pending:
+                task.cancel()
+        return results
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,150 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from common.transcript import Transcript, count_tokens
+
+SUMMARY_PROMPT = """
+Summarize the following agent progress in a few short bullet points.
+Keep every fact, number, name and source that may be needed to answer the task; drop reasoning chatter.
+
+{content}
+
+Summary:
+"""
+
+# 抽取式摘要中保留的行前缀 (ReAct / 计划执行的关键信息)
+_KEEP_PREFIXES = ("Thought:", "Action:", "Action Input:", "Final Answer:", "Step ", "Result:", "- ")
+
+
+class ContextMetrics:
+    def __init__(self) -> None:
+        self.observations_truncated = 0
+        self.compactions = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, saved: int, truncated: bool = False, compacted: bool = False) -> None:
+        with self._lock:
+            self.tokens_saved += max(saved, 0)
+            self.observations_truncated += int(truncated)
+            self.compactions += int(compacted)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "observations_truncated": self.observations_truncated,
+            "compactions": self.compactions,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+def llm_summarizer(llm: Any) -> Callable[[str], str]:
+    """用任意带 generate 接口的 LLM 客户端构造摘要函数，供 ContextManager(summarizer=...) 使用。"""
+
+    def summarize(content: str) -> str:
+        return llm.generate(SUMMARY_PROMPT.format(content=content), system_prompt="You are a concise summarizer.")
+
+    return summarize
+
+
+class ContextManager:
+    """
+    按 token 预算管理智能体上下文:
+
+    - truncate(): 截断超长的工具观察结果，保留开头与结尾；
+    - fit(): 每次调用 LLM 前检查 Transcript，超出 max_tokens 时把较早的轮次折叠成一段滚动摘要，
+      只保留系统提示词、任务描述和最近 keep_recent_messages 条消息；
+    - fit_blocks(): 对 Plan-and-Solve 的步骤结果列表做同样的处理。
+
+    摘要默认为抽取式 (保留 Thought/Action/结果等关键行)，也可以传入 llm_summarizer(llm)。
+    所有节省的 token 记录在 metrics 中，便于压测时调参。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 8000,
+        max_observation_tokens: int = 1500,
+        keep_recent_messages: int = 4,
+        max_summary_tokens: int = 800,
+        summarizer: Optional[Callable[[str], str]] = None,
+        encoding_name: str = "cl100k_base",
+    ):
+        if max_observation_tokens >= max_tokens:
+            raise ValueError("max_observation_tokens 必须小于 max_tokens。")
+        self.max_tokens = max_tokens
+        self.max_observation_tokens = max_observation_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.max_summary_tokens = max_summary_tokens
+        self.summarizer = summarizer
+        self.encoding_name = encoding_name
+        self.metrics = ContextMetrics()
+
+    def _count(self, text: str) -> int:
+        return count_tokens(text, self.encoding_name)
+
+    def _clip(self, text: str, max_tokens: int, total: int) -> str:
+        # 按字符比例估计保留长度，保留前 2/3 与后 1/3 (结尾常含结论或来源)
+        keep_chars = max(int(len(text) * max_tokens / total), 1)
+        head = text[: keep_chars * 2 // 3].rstrip()
+        tail = text[len(text) - keep_chars // 3:].lstrip() if keep_chars // 3 else ""
+        return f"{head}\n[... about {total - max_tokens} tokens omitted ...]\n{tail}".rstrip()
+
+    def truncate(self, text: str, max_tokens: Optional[int] = None) -> str:
+        """把文本截断到 max_tokens (默认 max_observation_tokens) 以内。"""
+        max_tokens = max_tokens or self.max_observation_tokens
+        total = self._count(text)
+        if total <= max_tokens:
+            return text
+        clipped = self._clip(text, max_tokens, total)
+        self.metrics.record(total - self._count(clipped), truncated=True)
+        return clipped
+
+    def summarize(self, content: str) -> str:
+        if self.summarizer is not None:
+            summary = self.summarizer(content)
+        else:
+            lines = []
+            for line in content.splitlines():
+                line = line.strip()
+                if line.startswith("Observation:"):
+                    tokens = self._count(line)
+                    lines.append(self._clip(line, 60, tokens) if tokens > 60 else line)
+                elif line.startswith(_KEEP_PREFIXES):
+                    lines.append(line)
+            summary = "\n".join(lines)
+        total = self._count(summary)
+        if total > self.max_summary_tokens:
+            summary = self._clip(summary, self.max_summary_tokens, total)
+        return summary
+
+    def fit(self, transcript: Transcript) -> None:
+        """在调用 LLM 前原地压缩 transcript，使其尽量不超过 max_tokens。"""
+        if transcript.token_count <= self.max_tokens:
+            return
+        messages = transcript.messages
+        # messages[0] 为系统提示词，messages[1] 为任务描述，之后 assistant/user 交替
+        head = 2
+        recent_start = len(messages) - self.keep_recent_messages
+        # 折叠区间以 assistant 消息结尾，使保留部分从 user 消息开始，角色依然交替
+        if recent_start % 2 == 0:
+            recent_start -= 1
+        if recent_start - head < 2:
+            return
+        span = "\n".join(m["content"] for m in messages[head:recent_start])
+        summary = self.summarize(span)
+        saved = transcript.replace_range(head, recent_start, "assistant", f"Summary of my earlier progress:\n{summary}")
+        self.metrics.record(saved, compacted=True)
+
+    def fit_blocks(self, blocks: List[str], max_tokens: Optional[int] = None, keep_recent: int = 2) -> str:
+        """
+        把多个文本块 (例如 Plan-and-Solve 每一步的结果) 拼接为不超过 max_tokens 的上下文，
+        超出时较早的块被折叠为摘要，最近 keep_recent 块原样保留。
+        """
+        max_tokens = max_tokens or self.max_tokens - self.max_observation_tokens
+        context = "\n".join(blocks)
+        total = self._count(context)
+        if total <= max_tokens or len(blocks) <= keep_recent:
+            return context
+        summary = self.summarize("\n".join(blocks[:-keep_recent]))
+        compacted = "Summary of earlier steps:\n" + summary + "\n\n" + "\n".join(blocks[-keep_recent:])
+        self.metrics.record(total - self._count(compacted), compacted=True)
+        return compacted
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+
+# (连接超时, 读取超时)，单位秒；没有超时的请求在网络异常时会让整个智能体会话一直挂起
+DEFAULT_TIMEOUT: Tuple[float, float] = (5.0, 15.0)
+
+# 与 create_session 的重试策略保持一致
+RETRY_STATUSES: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+_session: Optional[Any] = None
+_session_lock = threading.Lock()
+# 事件循环 -> httpx.AsyncClient；异步连接池绑定在创建它的事件循环上
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def create_session(
+    pool_maxsize: int = 32,
+    retries: int = 3,
+    backoff_factor: float = 0.5,
+    status_forcelist: Tuple[int, ...] = RETRY_STATUSES,
+) -> Any:
+    """
+    创建带连接池与自动重试的 requests.Session:
+    - 同一主机的 TCP/TLS 连接以 keep-alive 方式复用，并发会话最多保留 pool_maxsize 条连接；
+    - 连接失败、读取失败以及 status_forcelist 中的状态码按指数退避重试
+      (backoff_factor * 2^(n-1) 秒)，并遵守 429/503 的 Retry-After。
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> Any:
+    """返回进程内共享的 requests.Session (首次调用时创建)，供各个工具复用连接。"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def close_session() -> None:
+    """关闭共享的 Session 并释放其连接池，下次 get_session 时重新创建。"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """
+    返回当前事件循环共享的 httpx.AsyncClient (首次调用时创建)，连接以 keep-alive 方式复用，
+    建立连接失败时由传输层自动重试。状态码重试见 aget。
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        transport = httpx.AsyncHTTPTransport(
+            retries=3,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=32),
+        )
+        client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT[1], connect=DEFAULT_TIMEOUT[0]),
+            follow_redirects=True,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def aget(url: str, params: Optional[Dict[str, Any]] = None, retries: int = 3, backoff_factor: float = 0.5) -> "httpx.Response":
+    """
+    使用共享的异步客户端发起 GET 请求；遇到 RETRY_STATUSES 中的状态码时按指数退避重试
+    (优先遵守 Retry-After)，重试耗尽后返回最后一次的响应，由调用方决定如何处理。
+    """
+    client = get_async_client()
+    for attempt in range(retries + 1):
+        response = await client.get(url, params=params)
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        retry_after = response.headers.get("Retry-After")
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff_factor * (2 ** attempt)
+        await response.aclose()
+        await asyncio.sleep(delay)
+    return response
+
+
+async def aclose_async_client() -> None:
+    """关闭当前事件循环共享的异步客户端，一般在事件循环退出前调用。"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
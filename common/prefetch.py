@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from common.available_tools import ToolCall, ToolExecutor
+from common.cache import make_cache_key
+from common.search import normalize_query
+from common.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+# 预取规则: 根据问题与本次会话已提交的工具调用 (按顺序)，返回可能马上会用到的调用
+PrefetchRule = Callable[[str, List[ToolCall]], Iterable[ToolCall]]
+
+
+def question_as_query(tool: str, arg: str = "query") -> PrefetchRule:
+    """第一轮之前用问题原文预取 tool(arg=问题)，模型的第一次搜索往往就是复述问题。"""
+
+    def rule(question: str, history: List[ToolCall]) -> List[ToolCall]:
+        return [ToolCall(tool, {arg: question})] if not history else []
+
+    return rule
+
+
+def follow_up(after: str, then: str, args: Dict[str, str]) -> PrefetchRule:
+    """
+    调用 after 之后预取 then；args 为 {then 的参数名: after 的参数名}，
+    例如 follow_up("get_weather", "get_attraction", {"city": "city"})。
+    """
+
+    def rule(question: str, history: List[ToolCall]) -> List[ToolCall]:
+        if not history or history[-1].name != after:
+            return []
+        last = history[-1]
+        if not all(source in last.kwargs for source in args.values()):
+            return []
+        return [ToolCall(then, {target: last.kwargs[source] for target, source in args.items()})]
+
+    return rule
+
+
+class ToolPrefetcher:
+    """
+    推测式工具预取: 在模型还在生成时按 rules 提前发起可能的工具调用，
+    模型真正提交相同的调用时直接使用 (或等待) 预取的结果，把工具延迟与生成延迟重叠起来。
+
+    - 调用按工具名与参数匹配；match_args 可以指定某个工具只比较哪些参数
+      (例如景点搜索只看 city，weather 只影响搜索措辞)，字符串参数比较前会规范化；
+    - 每个会话最多同时预取 max_inflight 个调用，预取在 executor 的有界线程池中执行；
+    - 没有用上的预取结果在会话结束时丢弃，尚未开始的预取会被取消。
+    预取会产生额外的工具调用 (以及外部 API 配额)，因此默认不启用，由调用方传入规则。
+    """
+
+    def __init__(
+        self,
+        executor: ToolExecutor,
+        rules: Sequence[PrefetchRule],
+        match_args: Optional[Dict[str, Sequence[str]]] = None,
+        max_inflight: int = 2,
+    ):
+        self.executor = executor
+        self.rules = list(rules)
+        self.match_args = {name: tuple(names) for name, names in (match_args or {}).items()}
+        self.max_inflight = max_inflight
+
+    def start(self, question: str) -> "PrefetchSession":
+        """为一次智能体运行创建预取会话，并立即按规则发起第一批预取。"""
+        return PrefetchSession(self, question)
+
+    def key(self, call: ToolCall) -> str:
+        names = self.match_args.get(call.name)
+        kwargs = call.kwargs if names is None else {k: v for k, v in call.kwargs.items() if k in names}
+        normalized = {k: normalize_query(v) if isinstance(v, str) else v for k, v in kwargs.items()}
+        return make_cache_key(call.name, normalized)
+
+
+class PrefetchSession:
+    """
+    一次智能体运行内的预取状态，可作为上下文管理器使用 (退出时调用 close)。
+    用 execute / aexecute 代替 ToolExecutor.execute / aexecute 执行模型提交的调用。
+    """
+
+    def __init__(self, prefetcher: ToolPrefetcher, question: str):
+        self.prefetcher = prefetcher
+        self.question = question
+        self.history: List[ToolCall] = []
+        self.launched = 0
+        self.hits = 0
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._schedule()
+
+    def __enter__(self) -> "PrefetchSession":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _schedule(self) -> None:
+        executor = self.prefetcher.executor
+        for rule in self.prefetcher.rules:
+            try:
+                calls = list(rule(self.question, list(self.history)))
+            except Exception as e:
+                logger.debug("预取规则执行失败: %s", e)
+                continue
+            for call in calls:
+                key = self.prefetcher.key(call)
+                with self._lock:
+                    inflight = sum(1 for f in self._futures.values() if not f.done())
+                    if key in self._futures or inflight >= self.prefetcher.max_inflight or not executor.has(call.name):
+                        continue
+                    self._futures[key] = executor.submit(call.name, **call.kwargs)
+                    self.launched += 1
+                logger.debug("预取工具调用: %r", call)
+
+    def _take(self, call: ToolCall) -> Optional[Future]:
+        with self._lock:
+            future = self._futures.pop(self.prefetcher.key(call), None)
+        # 预取失败 (或被取消) 时按正常流程重新执行，不把推测的错误暴露给模型
+        if future is None or future.cancelled() or (future.done() and future.exception() is not None):
+            return None
+        return future
+
+    def _commit(self, call: ToolCall) -> None:
+        self.history.append(call)
+        self._schedule()
+
+    def execute(self, call: ToolCall) -> Any:
+        """
+        执行模型提交的调用: 命中预取时等待并返回预取结果，否则正常执行。
+        下一批预取在执行前就发起，与本次调用及模型的下一轮生成并行。
+        """
+        future = self._take(call)
+        self._commit(call)
+        if future is not None:
+            try:
+                value = future.result()
+                self.hits += 1
+                return value
+            except Exception:
+                pass
+        return self.prefetcher.executor.execute(call.name, **call.kwargs)
+
+    async def aexecute(self, call: ToolCall) -> Any:
+        """execute 的异步版本，等待预取结果时不阻塞事件循环。"""
+        future = self._take(call)
+        self._commit(call)
+        if future is not None:
+            try:
+                value = await asyncio.wrap_future(future)
+                self.hits += 1
+                return value
+            except Exception:
+                pass
+        return await self.prefetcher.executor.aexecute(call.name, **call.kwargs)
+
+    def observe(self, calls: Iterable[ToolCall]) -> None:
+        """记录已通过其他途径 (例如 execute_many) 执行的调用，用于后续预取。"""
+        for call in calls:
+            self._commit(call)
+
+    def close(self) -> None:
+        """丢弃没有用上的预取结果并取消尚未开始的预取，把命中情况记录到当前 span。"""
+        with self._lock:
+            futures, self._futures = list(self._futures.values()), {}
+        for future in futures:
+            future.cancel()
+        annotate(prefetch_launched=self.launched, prefetch_hits=self.hits, prefetch_wasted=len(futures))
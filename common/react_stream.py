@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from common.action_parser import ActionParser
+from travel_agent.llm_client import achat
+
+logger = logging.getLogger(__name__)
+
+_ACTION_PARSER = ActionParser()
+_OBSERVATION = "Observation:"
+_FINAL_ANSWER = "Final Answer:"
+
+
+class ReActStreamParser:
+    """
+    增量解析流式输出的 ReAct 回复。每收到一个分块调用 feed()，
+    一旦解析出完整的行动 ("Action:" 与 "Action Input:" 两行都已结束，或函数调用的括号已闭合)，
+    或模型开始编造 "Observation:"，done 即为 True，调用方可以立即取消生成并执行工具。
+    "Final Answer:" 需要完整内容，因此会一直读到流结束。
+    """
+
+    def __init__(self) -> None:
+        self._chunks = []
+        self._text = ""
+        self.done = False
+        self.stopped_early = False
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self._chunks.append(chunk)
+        # 只有新分块带来换行、冒号或右括号时才需要重新检查，避免每个 token 都扫描全文
+        if "\n" not in chunk and ":" not in chunk and ")" not in chunk:
+            return False
+        self._text = "".join(self._chunks)
+        observation_at = self._text.find(_OBSERVATION)
+        if observation_at != -1:
+            self._text = self._text[:observation_at].rstrip()
+            self._chunks = [self._text]
+            self.done = self.stopped_early = True
+        elif _FINAL_ANSWER not in self._text and "Action" in self._text:
+            parsed = _ACTION_PARSER.parse(self._text, final=False)
+            if parsed.calls:
+                # 丢弃第一个完整行动之后已经生成的多余内容
+                self._text = self._text[:parsed.end]
+                self._chunks = [self._text]
+                self.done = self.stopped_early = True
+        return self.done
+
+    @property
+    def text(self) -> str:
+        if not self.done:
+            self._text = "".join(self._chunks)
+        return self._text
+
+
+def consume_react_stream(chunks: Iterator[str], cancel_event: Optional[threading.Event] = None) -> str:
+    """
+    读取流式回复直到出现可执行的 Action 或流结束；提前结束时关闭生成器以取消服务端生成。
+    cancel_event 被设置时也立即停止读取 (返回已收到的部分)。
+    """
+    parser = ReActStreamParser()
+    try:
+        for chunk in chunks:
+            if parser.feed(chunk) or (cancel_event is not None and cancel_event.is_set()):
+                break
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    if parser.stopped_early:
+        logger.debug("检测到完整的 Action，已提前结束生成。")
+    return parser.text
+
+
+async def aconsume_react_stream(chunks: AsyncIterator[str]) -> str:
+    """consume_react_stream 的异步版本。"""
+    parser = ReActStreamParser()
+    try:
+        async for chunk in chunks:
+            if parser.feed(chunk):
+                break
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    if parser.stopped_early:
+        logger.debug("检测到完整的 Action，已提前结束生成。")
+    return parser.text
+
+
+def react_completion(
+    llm: Any,
+    messages: List[Dict[str, str]],
+    stream: bool = False,
+    cancel_event: Optional[threading.Event] = None,
+    **kwargs: Any,
+) -> str:
+    """
+    执行一轮 ReAct 调用。stream=True 时边接收边解析，Action 完整后立即取消生成，
+    从而缩短到第一次工具调用的时间；cancel_event 被设置时同样立即取消生成。
+    """
+    if not stream:
+        return llm.chat(messages, stream=False, **kwargs)
+    return consume_react_stream(llm.chat(messages, stream=True, **kwargs), cancel_event)
+
+
+async def areact_completion(llm: Any, messages: List[Dict[str, str]], stream: bool = False, **kwargs: Any) -> str:
+    """react_completion 的异步版本，兼容同步与异步客户端。"""
+    if not stream:
+        return await achat(llm, messages, **kwargs)
+    chunks = await achat(llm, messages, stream=True, **kwargs)
+    if hasattr(chunks, "__aiter__"):
+        return await aconsume_react_stream(chunks)
+    # 同步客户端返回的是普通生成器，在线程中消费以免阻塞事件循环
+    return await asyncio.to_thread(consume_react_stream, chunks)
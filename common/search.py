@@ -1,7 +1,56 @@
 import os
-from typing import Any, Dict, List, Optional
+import re
+from typing import Any, Dict, List, Optional, Union
 
-from serpapi import GoogleSearch
+from common.cache import AsyncSingleFlight, SingleFlight, SQLiteCache, TTLCache, make_cache_key
+from common.http import aget
+from common.tracing import annotate
+
+SERPAPI_ENDPOINT = "https://serpapi.com/search.json"
+
+# 搜索结果缓存: 默认 15 分钟内的相同查询直接复用，可通过 configure_search_cache 替换为持久化缓存或关闭
+_search_cache: Optional[Union[TTLCache, SQLiteCache]] = TTLCache(max_entries=512, max_bytes=32 * 1024 * 1024, ttl=15 * 60)
+_search_flight = SingleFlight()
+_asearch_flight = AsyncSingleFlight()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?？.。!！]+$")
+
+
+def configure_search_cache(cache: Optional[Union[TTLCache, SQLiteCache]]) -> None:
+    """替换全局搜索缓存 (例如 SQLiteCache 以便跨进程复用)，传入 None 则关闭缓存。"""
+    global _search_cache
+    _search_cache = cache
+
+
+def get_search_cache() -> Optional[Union[TTLCache, SQLiteCache]]:
+    return _search_cache
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本: 合并空白、去掉结尾标点并统一大小写，使近似重复的查询命中同一缓存。"""
+    query = _WHITESPACE_RE.sub(" ", query).strip()
+    return _TRAILING_PUNCT_RE.sub("", query).casefold()
+
+
+def _google_search(params: Dict[str, Any]) -> Dict[str, Any]:
+    # serpapi SDK 在第一次真正搜索时才导入，只导入智能体模块不必付出这部分启动时间
+    from serpapi import GoogleSearch
+
+    return GoogleSearch(params).get_dict()
+
+
+async def _agoogle_search(params: Dict[str, Any]) -> Dict[str, Any]:
+    # 与 serpapi SDK 请求同一个接口，但使用共享的异步连接池；出错时同样返回 {"error": ...}
+    response = await aget(SERPAPI_ENDPOINT, params=params)
+    return response.json()
+
+
+def search_cache_key(params: Dict[str, Any]) -> str:
+    # api_key 不影响结果，不参与缓存键
+    normalized = {k: v for k, v in params.items() if k != "api_key"}
+    normalized["q"] = normalize_query(str(normalized.get("q", "")))
+    return make_cache_key("serpapi", normalized)
 
 
 def serpapi_search_raw(
@@ -15,7 +64,80 @@ def serpapi_search_raw(
     gl: Optional[str] = None,
     safe: Optional[str] = None,
     start: Optional[int] = None,
+    use_cache: bool = True,
     **extra_params: Any,
+) -> Dict[str, Any]:
+    """
+    调用 SerpApi 并返回原始结果字典。
+    use_cache=True 时先查搜索缓存；并发的相同查询只会发起一次上游请求并共享结果。
+    """
+    params = _build_params(query, api_key, engine, num_results, location, hl, gl, safe, start, extra_params)
+    cache = _search_cache if use_cache else None
+    if cache is None:
+        return _google_search(params)
+
+    cache_key = search_cache_key(params)
+    cached = cache.get(cache_key)
+    annotate(search_cache_hit=cached is not None)
+    if cached is not None:
+        return cached
+
+    def fetch() -> Dict[str, Any]:
+        payload = _google_search(params)
+        # SerpApi 出错时返回 {"error": ...}，不缓存错误结果
+        if not payload.get("error"):
+            cache.set(cache_key, payload)
+        return payload
+
+    return _search_flight.do(cache_key, fetch)
+
+
+async def aserpapi_search_raw(
+    query: str,
+    *,
+    api_key: Optional[str] = None,
+    engine: str = "google",
+    num_results: int = 10,
+    location: Optional[str] = None,
+    hl: Optional[str] = None,
+    gl: Optional[str] = None,
+    safe: Optional[str] = None,
+    start: Optional[int] = None,
+    use_cache: bool = True,
+    **extra_params: Any,
+) -> Dict[str, Any]:
+    """serpapi_search_raw 的异步版本，与其共享搜索缓存；同一事件循环内并发的相同查询只请求一次。"""
+    params = _build_params(query, api_key, engine, num_results, location, hl, gl, safe, start, extra_params)
+    cache = _search_cache if use_cache else None
+    if cache is None:
+        return await _agoogle_search(params)
+
+    cache_key = search_cache_key(params)
+    cached = cache.get(cache_key)
+    annotate(search_cache_hit=cached is not None)
+    if cached is not None:
+        return cached
+
+    async def fetch() -> Dict[str, Any]:
+        payload = await _agoogle_search(params)
+        if not payload.get("error"):
+            cache.set(cache_key, payload)
+        return payload
+
+    return await _asearch_flight.do(cache_key, fetch)
+
+
+def _build_params(
+    query: str,
+    api_key: Optional[str],
+    engine: str,
+    num_results: Optional[int],
+    location: Optional[str],
+    hl: Optional[str],
+    gl: Optional[str],
+    safe: Optional[str],
+    start: Optional[int],
+    extra_params: Dict[str, Any],
 ) -> Dict[str, Any]:
     key = api_key or os.getenv("SERPAPI_API_KEY") or os.getenv("SERPAPI_KEY")
     if not key:
@@ -37,9 +159,7 @@ def serpapi_search_raw(
         params["start"] = int(start)
 
     params.update(extra_params)
-
-    search = GoogleSearch(params)
-    return search.get_dict()
+    return params
 
 
 def extract_organic_results(payload: Dict[str, Any], *, limit: int = 5) -> List[Dict[str, Any]]:
@@ -112,7 +232,69 @@ def serpapi_search_text(
         start=start,
         **extra_params,
     )
+    return format_search_text(payload, query, limit)
+
+
+async def aserpapi_search(
+    query: str,
+    *,
+    api_key: Optional[str] = None,
+    limit: int = 5,
+    engine: str = "google",
+    location: Optional[str] = None,
+    hl: Optional[str] = None,
+    gl: Optional[str] = None,
+    safe: Optional[str] = None,
+    start: Optional[int] = None,
+    **extra_params: Any,
+) -> List[Dict[str, Any]]:
+    """serpapi_search 的异步版本。"""
+    payload = await aserpapi_search_raw(
+        query,
+        api_key=api_key,
+        engine=engine,
+        num_results=max(int(limit), 1),
+        location=location,
+        hl=hl,
+        gl=gl,
+        safe=safe,
+        start=start,
+        **extra_params,
+    )
+    return extract_organic_results(payload, limit=limit)
+
+
+async def aserpapi_search_text(
+    query: str,
+    *,
+    api_key: Optional[str] = None,
+    limit: int = 5,
+    engine: str = "google",
+    location: Optional[str] = None,
+    hl: Optional[str] = None,
+    gl: Optional[str] = None,
+    safe: Optional[str] = None,
+    start: Optional[int] = None,
+    **extra_params: Any,
+) -> str:
+    """serpapi_search_text 的异步版本。"""
+    payload = await aserpapi_search_raw(
+        query,
+        api_key=api_key,
+        engine=engine,
+        num_results=max(int(limit), 1),
+        location=location,
+        hl=hl,
+        gl=gl,
+        safe=safe,
+        start=start,
+        **extra_params,
+    )
+    return format_search_text(payload, query, limit)
+
 
+def format_search_text(payload: Dict[str, Any], query: str, limit: int = 5) -> str:
+    """把 SerpApi 原始结果整理成适合放进提示词的文本: 优先使用答案框与知识图谱，否则列出自然搜索结果。"""
     answer_box_list = payload.get("answer_box_list")
     if isinstance(answer_box_list, list) and answer_box_list:
         items = [str(x).strip() for x in answer_box_list if str(x).strip()]
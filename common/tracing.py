@@ -0,0 +1,267 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 当前线程 / 协程中正在进行的 span；asyncio 任务与 asyncio.to_thread 会自动继承
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    一次被追踪的操作 (LLM 调用、解析、工具执行、反思轮次等)，
+    记录起止时间、耗时、属性 (token 数、是否命中缓存等) 与错误。
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: Any) -> None:
+        self.error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def end(self) -> None:
+        if self.end_time is None:
+            self.duration_ms = self.elapsed_ms()
+            self.end_time = self.start_time + self.duration_ms / 1000
+
+    @property
+    def status(self) -> str:
+        return "error" if self.error else "ok"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def __repr__(self) -> str:
+        return f"Span({self.name!r}, duration_ms={self.duration_ms}, status={self.status!r})"
+
+
+class JSONLSpanExporter:
+    """把结束的 span 逐行追加写入本地 JSONL 文件，可多线程共享。"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class OpenTelemetrySpanExporter:
+    """
+    把 span 转发给 OpenTelemetry (可选依赖: opentelemetry-sdk，导出到 OTLP collector 还需
+    opentelemetry-exporter-otlp-proto-http)。span 在开始时即创建对应的 OTel span，
+    因此父子关系在 collector 中保持不变。
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, service_name: str = "ai-agents-exp", tracer_provider: Any = None):
+        try:
+            from opentelemetry import trace
+            from opentelemetry.trace import Status, StatusCode
+        except ImportError as e:
+            raise ImportError("导出到 OpenTelemetry 需要安装 opentelemetry-sdk。") from e
+
+        self._trace = trace
+        self._status = Status
+        self._status_code = StatusCode
+        self._owns_provider = tracer_provider is None
+        if tracer_provider is None:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+
+            tracer_provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+            if endpoint:
+                try:
+                    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                except ImportError as e:
+                    raise ImportError("导出到 OTLP collector 需要安装 opentelemetry-exporter-otlp-proto-http。") from e
+                tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self._provider = tracer_provider
+        self._tracer = tracer_provider.get_tracer("ai-agents-exp")
+        self._open: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span) -> None:
+        with self._lock:
+            parent = self._open.get(span.parent_id) if span.parent_id else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        otel_span = self._tracer.start_span(span.name, context=context, start_time=int(span.start_time * 1e9))
+        with self._lock:
+            self._open[span.span_id] = otel_span
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            otel_span = self._open.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            # OTel 属性只接受基本类型
+            if value is not None:
+                otel_span.set_attribute(key, value if isinstance(value, (bool, int, float, str)) else str(value))
+        if span.error:
+            otel_span.set_status(self._status(self._status_code.ERROR, span.error))
+        otel_span.end(end_time=int(span.end_time * 1e9))
+
+    def shutdown(self) -> None:
+        if self._owns_provider:
+            self._provider.shutdown()
+
+
+class Tracer:
+    """
+    创建 span 并在结束时交给各个 exporter。没有 exporter 时 span 仍然会创建
+    (调用方可以照常设置属性)，但不会产生任何 I/O。
+    """
+
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        self.exporters: List[Any] = list(exporters or [])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter: Any) -> None:
+        self.exporters.append(exporter)
+
+    def start_span(self, name: str, **attributes: Any) -> Span:
+        """
+        创建一个以当前 span 为父节点的 span，但不把它设为当前 span。
+        适用于跨越多次 yield 的流式生成，结束时需调用 end_span。
+        """
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else None,
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        for exporter in self.exporters:
+            on_start = getattr(exporter, "on_start", None)
+            if on_start is not None:
+                try:
+                    on_start(span)
+                except Exception as e:
+                    logger.warning("span 导出失败: %s", e)
+        return span
+
+    def end_span(self, span: Span) -> None:
+        if span.end_time is not None:
+            return
+        span.end()
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning("span 导出失败: %s", e)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """在 with 块内追踪一次操作，块内创建的 span 自动成为其子节点；异常会记录到 span 后继续抛出。"""
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def shutdown(self) -> None:
+        for exporter in self.exporters:
+            shutdown = getattr(exporter, "shutdown", None)
+            if shutdown is not None:
+                shutdown()
+        self.exporters = []
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, **attributes: Any):
+    """get_tracer().span 的简写。"""
+    return _tracer.span(name, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def annotate(**attributes: Any) -> None:
+    """给当前 span (如果有) 附加属性，例如工具内部的缓存命中情况。"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attributes(**attributes)
+
+
+def configure_tracing(
+    jsonl_path: Optional[str] = None,
+    otlp_endpoint: Optional[str] = None,
+    service_name: str = "ai-agents-exp",
+) -> Tracer:
+    """
+    为全局 tracer 配置 exporter。参数未提供时从环境变量读取:
+    - jsonl_path -> AGENT_TRACE_FILE
+    - otlp_endpoint -> OTEL_EXPORTER_OTLP_TRACES_ENDPOINT / OTEL_EXPORTER_OTLP_ENDPOINT
+    两者都为空时不做任何事，追踪保持关闭。
+    """
+    jsonl_path = jsonl_path or os.getenv("AGENT_TRACE_FILE")
+    otlp_endpoint = otlp_endpoint or os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if jsonl_path:
+        _tracer.add_exporter(JSONLSpanExporter(jsonl_path))
+    if otlp_endpoint:
+        if not otlp_endpoint.rstrip("/").endswith("/v1/traces"):
+            otlp_endpoint = otlp_endpoint.rstrip("/") + "/v1/traces"
+        _tracer.add_exporter(OpenTelemetrySpanExporter(otlp_endpoint, service_name=service_name))
+    return _tracer
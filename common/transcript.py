@@ -0,0 +1,108 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# 每条 chat 消息除正文外的固定开销 (role、分隔符等)，与 OpenAI 的计数方式一致
+MESSAGE_TOKEN_OVERHEAD = 4
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str) -> Optional[Any]:
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        # tiktoken 未安装或编码文件无法下载 (离线环境) 时退回到估算
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """
+    统计文本的 token 数。优先使用 tiktoken；不可用时按 "每个中日韩字符 1 个 token，
+    其余字符约 4 个 1 个 token" 估算，足以用于预算控制。
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(encoding_name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class Transcript:
+    """
+    增量构建的对话记录，用于替代每轮把完整历史重新拼接成一个大字符串。
+
+    - 每条消息只在追加时统计一次 token，token_count 为 O(1)。
+    - to_messages() 输出 chat 消息列表；前缀 (系统提示词 + 模板 + 先前轮次) 在轮次之间
+      保持不变，服务端的前缀缓存 (prompt caching) 因此可以生效。
+    - 连续的同角色消息会被合并，保证 user/assistant 严格交替。
+    """
+
+    def __init__(self, system_prompt: str, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._messages: List[Dict[str, str]] = []
+        self._token_counts: List[int] = []
+        self._total_tokens = 0
+        self.append("system", system_prompt)
+
+    def append(self, role: str, content: str) -> None:
+        if self._messages and self._messages[-1]["role"] == role and role != "system":
+            # 合并到上一条消息，只需统计新增部分
+            last = self._messages[-1]
+            addition = content if last["content"].endswith("\n") else "\n" + content
+            last["content"] += addition
+            tokens = count_tokens(addition, self.encoding_name)
+            self._token_counts[-1] += tokens
+            self._total_tokens += tokens
+            return
+        tokens = count_tokens(content, self.encoding_name) + MESSAGE_TOKEN_OVERHEAD
+        self._messages.append({"role": role, "content": content})
+        self._token_counts.append(tokens)
+        self._total_tokens += tokens
+
+    def add_user(self, content: str) -> None:
+        self.append("user", content)
+
+    def add_assistant(self, content: str) -> None:
+        self.append("assistant", content)
+
+    def to_messages(self, extra_user: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        返回可直接传给 chat 接口的消息列表 (浅拷贝)。
+        extra_user 为只在本次请求中附加、不写入记录的用户提示。
+        """
+        messages = [dict(m) for m in self._messages]
+        if extra_user:
+            if messages[-1]["role"] == "user":
+                messages[-1]["content"] += extra_user
+            else:
+                messages.append({"role": "user", "content": extra_user})
+        return messages
+
+    def replace_range(self, start: int, end: int, role: str, content: str) -> int:
+        """
+        用一条消息替换 [start, end) 范围内的消息 (用于把旧轮次折叠为摘要)，
+        返回减少的 token 数。
+        """
+        removed = sum(self._token_counts[start:end])
+        tokens = count_tokens(content, self.encoding_name) + MESSAGE_TOKEN_OVERHEAD
+        self._messages[start:end] = [{"role": role, "content": content}]
+        self._token_counts[start:end] = [tokens]
+        self._total_tokens += tokens - removed
+        return removed - tokens
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        return self._messages
+
+    @property
+    def token_count(self) -> int:
+        return self._total_tokens
+
+    def __len__(self) -> int:
+        return len(self._messages)
@@ -1,37 +1,47 @@
+import argparse
 import os
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
-def download_model():
-    # 模型名称
-    model_id = "Qwen/Qwen1.5-0.5B-Chat"
-    
+def download_model(model_id: str = "Qwen/Qwen1.5-0.5B-Chat", save_directory: str = None, safe_serialization: bool = True):
+    """
+    下载模型并保存到本地。
+    safe_serialization 为 True 时保存为 safetensors 格式: 加载时权重通过 mmap 直接映射进内存，
+    不需要像 pickle 格式 (pytorch_model.bin) 那样先完整反序列化一遍，冷启动明显更快。
+    """
     # 本地保存路径
-    save_directory = os.path.join(os.getcwd(), "models", "Qwen1.5-0.5B-Chat")
-    
+    if save_directory is None:
+        save_directory = os.path.join(os.getcwd(), "models", "Qwen1.5-0.5B-Chat")
+
     print(f"准备下载模型: {model_id}")
     print(f"保存路径: {save_directory}")
-    
+    print(f"保存格式: {'safetensors' if safe_serialization else 'pytorch_model.bin'}")
+
     # 创建保存目录
     if not os.path.exists(save_directory):
         os.makedirs(save_directory)
-    
+
     try:
         # 下载并加载分词器
         print("正在下载分词器 (Tokenizer)...")
         tokenizer = AutoTokenizer.from_pretrained(model_id)
         tokenizer.save_pretrained(save_directory)
         print("分词器下载并保存完成。")
-        
+
         # 下载并加载模型
         print("正在下载模型 (Model)... 这可能需要一些时间。")
         model = AutoModelForCausalLM.from_pretrained(model_id)
-        model.save_pretrained(save_directory)
+        model.save_pretrained(save_directory, safe_serialization=safe_serialization)
         print("模型下载并保存完成。")
-        
+
         print(f"\n✅ 成功！模型已保存至: {save_directory}")
-        
+
     except Exception as e:
         print(f"\n❌ 下载过程中发生错误: {e}")
 
 if __name__ == "__main__":
-    download_model()
+    parser = argparse.ArgumentParser(description="下载模型并保存到本地目录。")
+    parser.add_argument("--model-id", default="Qwen/Qwen1.5-0.5B-Chat", help="Hugging Face 模型 ID")
+    parser.add_argument("--output", help="保存目录 (默认 ./models/Qwen1.5-0.5B-Chat)")
+    parser.add_argument("--format", choices=["safetensors", "bin"], default="safetensors", help="权重格式，safetensors 可 mmap 加载")
+    args = parser.parse_args()
+    download_model(args.model_id, args.output, safe_serialization=args.format == "safetensors")
@@ -1,18 +1,108 @@
+import logging
 import os
-import re
+from contextlib import nullcontext
+from typing import List, Optional
 from dotenv import load_dotenv
 
 # 使用绝对导入，从 travel_agent 包中导入我们需要的模块和变量
 from travel_agent.llm_client import OpenAICompatibleClient
-from travel_agent.tools import tool_executor
+from common.action_parser import ActionParser
+from common.available_tools import ToolCall, ToolExecutor
+from common.prefetch import PrefetchSession, ToolPrefetcher
+from common.tracing import configure_tracing, span
+from travel_agent.tools import create_travel_prefetcher, tool_executor
 from travel_agent.prompt import AGENT_SYSTEM_PROMPT
 
+logger = logging.getLogger(__name__)
+
+def run_travel_agent(
+    llm: OpenAICompatibleClient,
+    user_prompt: str,
+    executor: ToolExecutor = tool_executor,
+    max_turns: int = 5,
+    prefetcher: Optional[ToolPrefetcher] = None,
+) -> Optional[str]:
+    """
+    运行旅行规划智能体的 Thought-Action 循环，返回最终答案；达到最大轮次时返回 None。
+    传入 prefetcher (见 create_travel_prefetcher) 时，预测的下一个工具调用会在模型生成期间提前执行。
+    """
+    with span("travel.run", question=user_prompt) as run_span, (prefetcher.start(user_prompt) if prefetcher else nullcontext()) as prefetch:
+        logger.info("用户问题: %s", user_prompt)
+
+        current_prompt = user_prompt
+        parser = ActionParser({name: executor.get(name) for name in executor.list()}, finish_tool="finish")
+
+        for i in range(max_turns):
+            logger.info("\n--- 第 %d 轮 ---", i + 1)
+            run_span.set_attribute("turns", i + 1)
+        
+            # 1. 调用大语言模型生成思考和行动
+            response_text = llm.generate(current_prompt, AGENT_SYSTEM_PROMPT)
+            logger.info("LLM响应: %s", response_text)
+
+            # 2. 单遍解析: finish(answer="...") 即最终答案，其余行动解析为带参数的工具调用
+            parsed = parser.parse(response_text)
+            if parsed.final_answer is not None:
+                logger.info("\n✅ 最终答案: %s", parsed.final_answer)
+                return parsed.final_answer
+
+            # 3. 执行工具调用
+            if parsed.calls:
+                current_prompt = _execute_calls(executor, parsed.calls, prefetch)
+            elif parsed.error:
+                logger.warning("❌ 错误: 无法解析行动: %s", parsed.error)
+                current_prompt = f"错误: 我无法解析你上一个响应中的行动: {parsed.error}"
+            else:
+                logger.warning("⚠️ 警告: 未找到有效的 'Action:'，智能体可能已偏离轨道。正在使用原始响应重试。")
+                current_prompt = response_text # 将不规范的输出直接作为下一轮的输入，给模型一个修正的机会
+
+        logger.warning("\n⚠️ 已达到最大对话轮次，程序终止。")
+        run_span.set_attribute("max_turns_reached", True)
+        return None
+
+def _execute_calls(executor: ToolExecutor, calls: List[ToolCall], prefetch: Optional[PrefetchSession] = None) -> str:
+    """执行本轮解析出的工具调用，返回作为下一轮输入的提示；多个调用并发执行，单个调用优先使用预取结果。"""
+    if len(calls) > 1:
+        results = executor.execute_many(calls)
+        if prefetch is not None:
+            prefetch.observe(calls)
+        parts = []
+        for result in results:
+            if result.ok:
+                logger.info("工具 '%s' 已执行，结果: %s", result.name, result.value)
+                parts.append(f"{result.name}: {result.value}")
+            elif not executor.has(result.name):
+                logger.warning("❌ 错误: 尝试调用不存在的工具 '%s'", result.name)
+                parts.append(f"{result.name}: 错误: 你尝试调用的工具 '{result.name}' 不存在。")
+            else:
+                logger.error("❌ 错误: 执行工具 '%s' 时出错: %s", result.name, result.error)
+                parts.append(f"{result.name}: 错误: 执行工具时出错: {result.error}")
+        return "这是上次工具调用的结果:\n" + "\n".join(parts)
+
+    call = calls[0]
+    if not executor.has(call.name):
+        logger.warning("❌ 错误: 尝试调用不存在的工具 '%s'", call.name)
+        return f"错误: 你尝试调用的工具 '{call.name}' 不存在。"
+    try:
+        if prefetch is not None:
+            tool_result = prefetch.execute(call)
+        else:
+            tool_result = executor.execute(call.name, **call.kwargs)
+        logger.info("工具 '%s' 已执行，结果: %s", call.name, tool_result)
+        return f"这是上次工具调用的结果: {tool_result}"
+    except Exception as e:
+        logger.error("❌ 错误: 执行工具 '%s' 时出错: %s", call.name, e)
+        return f"错误: 执行工具 '{call.name}' 时出错: {e}"
+
 def main():
     """
     旅行规划智能体的主函数。
     """
     # 加载环境变量
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # 设置了 AGENT_TRACE_FILE 或 OTEL_EXPORTER_OTLP_ENDPOINT 时导出追踪数据
+    configure_tracing()
 
     # 从环境变量获取 API Keys 和模型配置
     API_KEY = os.getenv("SILICONFLOW_API_KEY")
@@ -34,75 +124,8 @@ def main():
 
     # 定义用户的初始问题
     user_prompt = "我下周想去北京玩，请帮我推荐一些适合的景点"
-    print(f"用户问题: {user_prompt}")
-
-    current_prompt = user_prompt
-    max_turns = 5  # 设置最大对话轮次，防止无限循环
-
-    for i in range(max_turns):
-        print(f"\n--- 第 {i+1} 轮 ---")
-        
-        # 1. 调用大语言模型生成思考和行动
-        response_text = llm.generate(current_prompt, AGENT_SYSTEM_PROMPT)
-        print(f"LLM响应: {response_text}")
-
-        # 2. 检查是否需要终止循环
-        if "finish(" in response_text:
-            final_answer_match = re.search(r'finish\(answer="(.*)"\)', response_text, re.DOTALL)
-            if final_answer_match:
-                final_answer = final_answer_match.group(1)
-                print(f"\n✅ 最终答案: {final_answer}")
-                break
-        
-        # 3. 解析并执行工具调用
-        action_match = re.search(r'Action: (.*)', response_text, re.DOTALL)
-        if action_match:
-            action_str = action_match.group(1).strip()
-            
-            # 解析工具名称和参数
-            tool_name_match = re.match(r'(\w+)\(', action_str)
-            if not tool_name_match:
-                print("❌ 错误: 无法解析工具名称。")
-                current_prompt = "错误: 我无法解析你上一个响应中的工具名称。"
-                continue
-
-            tool_name = tool_name_match.group(1)
-            
-            # 提取参数字符串
-            arg_str_match = re.search(r'\((.*)\)', action_str)
-            if not arg_str_match:
-                print("❌ 错误: 无法解析工具参数。")
-                current_prompt = "错误: 我无法解析你上一个响应中的工具参数。"
-                continue
-            
-            arg_str = arg_str_match.group(1)
-            
-            try:
-                # 解析参数
-                args = dict(re.findall(r'(\w+)="([^"]*)"', arg_str))
-            except Exception:
-                print(f"❌ 错误: 解析参数 '{arg_str}' 失败。")
-                current_prompt = f"错误: 我无法解析你上一个响应中的参数 '{arg_str}'。"
-                continue
-
-            # 4. 执行工具
-            if tool_executor.has(tool_name):
-                try:
-                    tool_result = tool_executor.execute(tool_name, **args)
-                    print(f"工具 '{tool_name}' 已执行，结果: {tool_result}")
-                    current_prompt = f"这是上次工具调用的结果: {tool_result}"
-                except Exception as e:
-                    print(f"❌ 错误: 执行工具 '{tool_name}' 时出错: {e}")
-                    current_prompt = f"错误: 执行工具 '{tool_name}' 时出错: {e}"
-            else:
-                print(f"❌ 错误: 尝试调用不存在的工具 '{tool_name}'")
-                current_prompt = f"错误: 你尝试调用的工具 '{tool_name}' 不存在。"
-        else:
-            print("⚠️ 警告: 未找到有效的 'Action:'，智能体可能已偏离轨道。正在使用原始响应重试。")
-            current_prompt = response_text # 将不规范的输出直接作为下一轮的输入，给模型一个修正的机会
-
-    else:
-        print("\n⚠️ 已达到最大对话轮次，程序终止。")
+    # 查询天气的同时预取景点，景点搜索与模型的下一轮生成并行
+    run_travel_agent(llm, user_prompt, prefetcher=create_travel_prefetcher())
 
 if __name__ == "__main__":
     main()
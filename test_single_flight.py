@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+
+# Ensure we can import common
+sys.path.append(os.getcwd())
+
+from common.cache import AsyncSingleFlight
+
+
+async def check_leader_cancel() -> None:
+    """执行者被取消后，同一个 key 的等待者应重新调用并拿到结果，而不是收到 CancelledError。"""
+    flight = AsyncSingleFlight()
+    calls = 0
+
+    async def search() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    leader = asyncio.create_task(flight.do("q", search))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(flight.do("q", search)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    results = await asyncio.gather(*followers)
+    assert leader.cancelled(), "执行者应被取消"
+    assert results == ["result"] * 3, results
+    assert calls == 2, f"等待者应只重新调用一次，实际调用 {calls} 次"
+
+
+async def check_follower_cancel() -> None:
+    """等待者被取消不影响执行者。"""
+    flight = AsyncSingleFlight()
+
+    async def search() -> str:
+        await asyncio.sleep(0.05)
+        return "result"
+
+    leader = asyncio.create_task(flight.do("q", search))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("q", search))
+    await asyncio.sleep(0)
+    follower.cancel()
+    assert await leader == "result"
+
+
+def test_single_flight() -> None:
+    asyncio.run(check_leader_cancel())
+    asyncio.run(check_follower_cancel())
+
+
+if __name__ == "__main__":
+    test_single_flight()
+    print("AsyncSingleFlight checks passed.")
@@ -1,24 +1,91 @@
+import asyncio
 import os
-from tavily import TavilyClient
+import threading
+import weakref
+from typing import Any, Dict
 
-def get_attraction(city: str, weather: str) -> str:
+from .get_weather import aweather_description, weather_description
+
+# api_key -> TavilyClient；客户端可在线程间共享，没有必要每次调用都重新创建
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+# 事件循环 -> {api_key: AsyncTavilyClient}；异步客户端的连接绑定在创建它的事件循环上
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+# 单次 Tavily 搜索的超时 (秒)
+TAVILY_TIMEOUT = 20
+
+
+def get_tavily_client(api_key: str) -> Any:
+    """返回该 api_key 对应的共享 TavilyClient (首次调用时创建)。"""
+    client = _clients.get(api_key)
+    if client is None:
+        # tavily SDK 在第一次调用时才导入
+        from tavily import TavilyClient
+
+        with _clients_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                client = _clients[api_key] = TavilyClient(api_key=api_key)
+    return client
+
+
+def get_async_tavily_client(api_key: str) -> Any:
+    """返回当前事件循环中该 api_key 对应的共享 AsyncTavilyClient (首次调用时创建)。"""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(api_key)
+    if client is None:
+        from tavily import AsyncTavilyClient
+
+        client = clients[api_key] = AsyncTavilyClient(api_key=api_key)
+    return client
+
+
+def _attraction_query(city: str, weather: str) -> str:
+    if weather:
+        return f"'{city}' 在'{weather}'天气下最值得去的旅游景点推荐及理由"
+    return f"'{city}' 最值得去的旅游景点推荐及理由"
+
+
+def _format_attractions(response: Dict[str, Any]) -> str:
+    if response.get("answer"):
+        return response["answer"]
+    formatted_results = []
+    for result in response.get("results", []):
+        formatted_results.append(f"- {result['title']}: {result['content']}")
+    if not formatted_results:
+         return "抱歉，没有找到相关的旅游景点推荐。"
+    return "根据搜索，为您找到以下信息:\n" + "\n".join(formatted_results)
+
+def get_attraction(city: str, weather: str = "") -> str:
     """
     根据城市和天气，使用Tavily Search API搜索并返回优化后的景点推荐。
+    未提供 weather 时使用该城市缓存的天气 (通常刚由 get_weather 查询过)。
+    """
+    api_key = os.environ.get("TAVILY_API_KEY")
+    if not api_key:
+        return "错误:未配置TAVILY_API_KEY环境变量。"
+    tavily = get_tavily_client(api_key)
+    query = _attraction_query(city, weather or weather_description(city))
+    try:
+        response = tavily.search(query=query, search_depth="basic", include_answer=True, timeout=TAVILY_TIMEOUT)
+        return _format_attractions(response)
+    except Exception as e:
+        return f"错误:执行Tavily搜索时出现问题 - {e}"
+
+
+async def aget_attraction(city: str, weather: str = "") -> str:
+    """
+    根据城市和天气，使用Tavily Search API搜索并返回优化后的景点推荐 (get_attraction 的异步版本)。
+    未提供 weather 时使用该城市缓存的天气。
     """
     api_key = os.environ.get("TAVILY_API_KEY")
     if not api_key:
         return "错误:未配置TAVILY_API_KEY环境变量。"
-    tavily = TavilyClient(api_key=api_key)
-    query = f"'{city}' 在'{weather}'天气下最值得去的旅游景点推荐及理由"
+    tavily = get_async_tavily_client(api_key)
+    query = _attraction_query(city, weather or await aweather_description(city))
     try:
-        response = tavily.search(query=query, search_depth="basic", include_answer=True)
-        if response.get("answer"):
-            return response["answer"]
-        formatted_results = []
-        for result in response.get("results", []):
-            formatted_results.append(f"- {result['title']}: {result['content']}")
-        if not formatted_results:
-             return "抱歉，没有找到相关的旅游景点推荐。"
-        return "根据搜索，为您找到以下信息:\n" + "\n".join(formatted_results)
+        response = await tavily.search(query=query, search_depth="basic", include_answer=True, timeout=TAVILY_TIMEOUT)
+        return _format_attractions(response)
     except Exception as e:
         return f"错误:执行Tavily搜索时出现问题 - {e}"
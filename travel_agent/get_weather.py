@@ -1,20 +1,245 @@
-import requests
-import json
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Set, Union
+
+from common.cache import AsyncSingleFlight, SingleFlight, SQLiteCache, TTLCache
+from common.http import DEFAULT_TIMEOUT, aget, get_session
+from common.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+# 天气在数十分钟内变化不大: max_age 内的结果直接使用；超过 max_age 但未超过 max_stale 的结果
+# 先返回给调用方，同时在后台刷新 (stale-while-revalidate)；更旧的结果视为不存在
+WEATHER_MAX_AGE = 30 * 60
+WEATHER_MAX_STALE = 3 * 60 * 60
+DEFAULT_WEATHER_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ai-agents-exp", "weather.sqlite3")
+
+_UNSET = object()
+_weather_cache: Any = _UNSET
+_weather_cache_lock = threading.Lock()
+_max_age: float = WEATHER_MAX_AGE
+_max_stale: float = WEATHER_MAX_STALE
+_weather_flight = SingleFlight()
+_aweather_flight = AsyncSingleFlight()
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+# 后台刷新任务的强引用，防止任务在完成前被垃圾回收
+_refresh_tasks: Set["asyncio.Task"] = set()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def configure_weather_cache(
+    cache: Optional[Union[TTLCache, SQLiteCache]],
+    max_age: Optional[float] = None,
+    max_stale: Optional[float] = None,
+) -> None:
+    """替换天气缓存 (传入 None 则关闭缓存)，并可调整新鲜期 max_age 与可容忍的过期时长 max_stale (秒)。"""
+    global _weather_cache, _max_age, _max_stale
+    with _weather_cache_lock:
+        _weather_cache = cache
+        if max_age is not None:
+            _max_age = max_age
+        if max_stale is not None:
+            _max_stale = max_stale
+
+
+def get_weather_cache() -> Optional[Union[TTLCache, SQLiteCache]]:
+    """
+    返回天气缓存，首次调用时创建: 默认持久化到 SQLite (路径可通过环境变量 WEATHER_CACHE_PATH 修改，
+    设为空字符串则只缓存在内存中)，进程重启后依然有效。
+    """
+    global _weather_cache
+    if _weather_cache is _UNSET:
+        with _weather_cache_lock:
+            if _weather_cache is _UNSET:
+                path = os.getenv("WEATHER_CACHE_PATH", DEFAULT_WEATHER_CACHE_PATH)
+                cache: Union[TTLCache, SQLiteCache, None] = None
+                if path:
+                    try:
+                        cache = SQLiteCache(path, max_entries=1000, ttl=_max_stale, table="weather")
+                    except (sqlite3.Error, OSError) as e:
+                        logger.warning("无法打开天气缓存 %s，改用内存缓存: %s", path, e)
+                _weather_cache = cache if cache is not None else TTLCache(max_entries=256, ttl=_max_stale)
+    return _weather_cache
+
+
+def normalize_city(city: str) -> str:
+    """规范化城市名: 去掉空白、统一大小写，并去掉 "北京市" 这类结尾的 "市"，使同一城市命中同一缓存。"""
+    city = _WHITESPACE_RE.sub(" ", city).strip().casefold()
+    if len(city) > 2 and city.endswith("市"):
+        city = city[:-1]
+    return city
+
+
+def _weather_url(city: str) -> str:
+    return f"https://wttr.in/{city}?format=j1"
+
+
+def _parse_weather(data: Dict[str, Any]) -> Dict[str, Any]:
+    current_condition = data['current_condition'][0]
+    return {
+        "description": current_condition['weatherDesc'][0]['value'],
+        "temp_c": current_condition['temp_C'],
+        "fetched_at": time.time(),
+    }
+
+
+def _fetch_weather(city: str) -> Dict[str, Any]:
+    """请求 wttr.in 并解析当前天气；网络错误或数据格式不对时抛出异常。"""
+    # 共享的 Session 复用与 wttr.in 的 TLS 连接，超时与失败重试见 common.http
+    response = get_session().get(_weather_url(city), timeout=DEFAULT_TIMEOUT)
+    response.raise_for_status()
+    return _parse_weather(response.json())
+
+
+async def _afetch_weather(city: str) -> Dict[str, Any]:
+    response = await aget(_weather_url(city))
+    response.raise_for_status()
+    return _parse_weather(response.json())
+
+
+def _refresh(key: str, city: str, cache: Union[TTLCache, SQLiteCache]) -> Dict[str, Any]:
+    entry = _fetch_weather(city)
+    cache.set(key, entry)
+    return entry
+
+
+def _refresh_in_background(key: str, city: str, cache: Union[TTLCache, SQLiteCache]) -> None:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run() -> None:
+        try:
+            _weather_flight.do(key, lambda: _refresh(key, city, cache))
+        except Exception as e:
+            # 刷新失败时保留旧结果，下次查询再试
+            logger.warning("后台刷新 %s 的天气失败: %s", city, e)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name="weather-refresh", daemon=True).start()
+
+
+async def _arefresh(key: str, city: str, cache: Union[TTLCache, SQLiteCache]) -> Dict[str, Any]:
+    entry = await _afetch_weather(city)
+    cache.set(key, entry)
+    return entry
+
+
+def _arefresh_in_background(key: str, city: str, cache: Union[TTLCache, SQLiteCache]) -> None:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    async def run() -> None:
+        try:
+            await _aweather_flight.do(key, lambda: _arefresh(key, city, cache))
+        except Exception as e:
+            logger.warning("后台刷新 %s 的天气失败: %s", city, e)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    task = asyncio.get_running_loop().create_task(run())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+def lookup_weather(city: str) -> Dict[str, Any]:
+    """
+    查询城市当前天气，返回 {"description", "temp_c", "fetched_at"}，优先使用缓存:
+    新鲜的缓存直接返回；过期不久的缓存直接返回并在后台刷新；否则同步请求 (并发的相同城市只请求一次)。
+    """
+    cache = get_weather_cache()
+    if cache is None:
+        return _fetch_weather(city)
+    key = f"weather:{normalize_city(city)}"
+    entry = cache.get(key)
+    age = time.time() - entry["fetched_at"] if entry is not None else None
+    if age is not None and age < _max_age:
+        annotate(weather_cache="fresh")
+        return entry
+    if age is not None and age < _max_stale:
+        annotate(weather_cache="stale")
+        _refresh_in_background(key, city, cache)
+        return entry
+    annotate(weather_cache="miss")
+    return _weather_flight.do(key, lambda: _refresh(key, city, cache))
+
+
+async def alookup_weather(city: str) -> Dict[str, Any]:
+    """lookup_weather 的异步版本，共享同一个缓存；过期不久的缓存在事件循环中后台刷新。"""
+    cache = get_weather_cache()
+    if cache is None:
+        return await _afetch_weather(city)
+    key = f"weather:{normalize_city(city)}"
+    entry = cache.get(key)
+    age = time.time() - entry["fetched_at"] if entry is not None else None
+    if age is not None and age < _max_age:
+        annotate(weather_cache="fresh")
+        return entry
+    if age is not None and age < _max_stale:
+        annotate(weather_cache="stale")
+        _arefresh_in_background(key, city, cache)
+        return entry
+    annotate(weather_cache="miss")
+    return await _aweather_flight.do(key, lambda: _arefresh(key, city, cache))
+
+
+def weather_description(city: str) -> Optional[str]:
+    """返回城市当前的天气描述 (优先使用缓存)，查询失败时返回 None。"""
+    try:
+        return lookup_weather(city)["description"]
+    except Exception as e:
+        logger.warning("查询 %s 的天气失败: %s", city, e)
+        return None
+
+
+async def aweather_description(city: str) -> Optional[str]:
+    """weather_description 的异步版本。"""
+    try:
+        return (await alookup_weather(city))["description"]
+    except Exception as e:
+        logger.warning("查询 %s 的天气失败: %s", city, e)
+        return None
+
 
 def get_weather(city: str) -> str:
     """
     通过调用 wttr.in API 查询真实的天气信息。
     """
-    url = f"https://wttr.in/{city}?format=j1"
+    # requests 在第一次调用时才导入，只导入工具列表不必付出这部分启动时间
+    import requests
+
     try:
-        response = requests.get(url)
-        response.raise_for_status() 
-        data = response.json()
-        current_condition = data['current_condition'][0]
-        weather_desc = current_condition['weatherDesc'][0]['value']
-        temp_c = current_condition['temp_C']
-        return f"{city}当前天气:{weather_desc}，气温{temp_c}摄氏度"
+        entry = lookup_weather(city)
+        return f"{city}当前天气:{entry['description']}，气温{entry['temp_c']}摄氏度"
     except requests.exceptions.RequestException as e:
         return f"错误:查询天气时遇到网络问题 - {e}"
     except (KeyError, IndexError) as e:
         return f"错误:解析天气数据失败，可能是城市名称无效 - {e}"
+
+
+async def aget_weather(city: str) -> str:
+    """
+    通过调用 wttr.in API 查询真实的天气信息 (get_weather 的异步版本)。
+    """
+    import httpx
+
+    try:
+        entry = await alookup_weather(city)
+        return f"{city}当前天气:{entry['description']}，气温{entry['temp_c']}摄氏度"
+    except httpx.HTTPError as e:
+        return f"错误:查询天气时遇到网络问题 - {e}"
+    except (KeyError, IndexError, ValueError) as e:
+        return f"错误:解析天气数据失败，可能是城市名称无效 - {e}"
@@ -1,13 +1,71 @@
+import asyncio
+import logging
 import os
-from typing import Union, Generator, Optional
-from openai import OpenAI
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, List, Union, Generator, Optional
+from urllib.parse import urlsplit
+
+from common.cache import SQLiteCache, TTLCache, make_cache_key
+from common.tracing import Span, get_tracer
+from common.transcript import count_tokens
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+def _is_sampled_request(kwargs: Dict[str, Any]) -> bool:
+    """温度 > 0、top_p < 1 或 n > 1 的请求每次结果都可能不同；未显式指定温度时按确定性请求处理。"""
+    temperature = kwargs.get("temperature")
+    top_p = kwargs.get("top_p")
+    return (
+        (temperature is not None and temperature > 0)
+        or (top_p is not None and top_p < 1)
+        or (kwargs.get("n") or 1) > 1
+    )
+
+
+def response_cache_key(model: str, messages: list, kwargs: Dict[str, Any], cache_sampled: bool = False) -> Optional[str]:
+    """
+    计算一次 LLM 请求的缓存键 (model + messages + 采样参数等的规范化哈希)。
+    对非确定性的采样请求返回 None 表示绕过缓存，除非 cache_sampled=True。
+    """
+    if not cache_sampled and _is_sampled_request(kwargs):
+        return None
+    return make_cache_key(model, messages, kwargs)
+
+
+def _record_usage(span: Span, response: Any) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        span.set_attributes(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+
+def _record_stream_end(span: Span, full_content: List[str], finished: bool) -> None:
+    span.set_attribute("chunks", len(full_content))
+    if not finished and span.error is None:
+        # 调用方在流结束前关闭了生成器 (例如已解析出完整的 Action)
+        span.set_attribute("cancelled", True)
+    if get_tracer().enabled:
+        # 流式响应不返回 usage，只在开启追踪时估算输出 token 数
+        span.set_attribute("completion_tokens", count_tokens("".join(full_content)))
+
 
 class OpenAICompatibleClient:
     """
     一个用于调用任何兼容OpenAI接口的LLM服务的客户端。
     支持流式 (Streaming) 和非流式响应。
     """
-    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        cache: Optional[Union[TTLCache, SQLiteCache]] = None,
+        cache_sampled: bool = False,
+    ):
         """
         初始化客户端。优先使用传入参数，如果未提供，则从环境变量加载。
         
@@ -15,6 +73,9 @@ class OpenAICompatibleClient:
         - api_key -> SILICONFLOW_API_KEY
         - base_url -> SILICONFLOW_BASE_URL (默认: https://api.siliconflow.cn/v1)
         - model -> MODEL_ID (默认: deepseek-ai/DeepSeek-R1-0528-Qwen3-8B)
+
+        cache: 可选的响应缓存 (common.cache.TTLCache 或 SQLiteCache)，相同请求直接返回缓存结果。
+        cache_sampled: 为 True 时连 temperature > 0 等非确定性请求也缓存，默认绕过。
         """
         self.api_key = api_key or os.getenv("SILICONFLOW_API_KEY")
         self.base_url = base_url or os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1")
@@ -23,7 +84,21 @@ class OpenAICompatibleClient:
         if not self.api_key:
             raise ValueError("API Key 未提供。请在构造函数中传入或设置 SILICONFLOW_API_KEY 环境变量。")
 
+        # openai SDK 导入较慢 (约 0.5 秒)，只在真正创建 API 客户端时导入
+        from openai import OpenAI
+
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.cache = cache
+        self.cache_sampled = cache_sampled
+        self.cache_bypasses = 0
+
+    def _cache_key(self, messages: list, kwargs: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None:
+            return None
+        key = response_cache_key(self.model, messages, kwargs, self.cache_sampled)
+        if key is None:
+            self.cache_bypasses += 1
+        return key
 
     def generate(self, prompt: str, system_prompt: str, stream: bool = False, **kwargs) -> Union[str, Generator[str, None, None]]:
         """
@@ -39,13 +114,33 @@ class OpenAICompatibleClient:
             如果 stream=False，返回完整的响应字符串。
             如果 stream=True，返回一个生成器，逐块产生响应内容。
         """
-        print(f"正在调用大语言模型 (Stream={stream})...")
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ]
+        return self.chat(messages, stream=stream, **kwargs)
+
+    def chat(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs) -> Union[str, Generator[str, None, None]]:
+        """
+        以完整的 chat 消息列表调用LLM API (例如 common.transcript.Transcript.to_messages() 的输出)。
+        多轮对话按消息追加而不是拼接成一个大字符串，服务端的前缀缓存可以复用之前轮次。
+        返回值同 generate。
+        """
+        tracer = get_tracer()
+        # 流式调用的 span 要覆盖整个流的消费过程，因此手动结束而不是用 with
+        span = tracer.start_span("llm.call", model=self.model, stream=stream, messages=len(messages))
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug("命中LLM响应缓存 (Stream=%s)。", stream)
+                span.set_attribute("cache_hit", True)
+                tracer.end_span(span)
+                return iter([cached]) if stream else cached
+        span.set_attribute("cache_hit", False)
+
+        logger.debug("正在调用大语言模型 (Stream=%s)...", stream)
         try:
-            messages = [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': prompt}
-            ]
-            
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
@@ -54,26 +149,284 @@ class OpenAICompatibleClient:
             )
 
             if stream:
-                return self._handle_stream(response)
+                return self._handle_stream(response, cache_key, span)
             else:
                 answer = response.choices[0].message.content
-                print("大语言模型响应成功。")
+                logger.debug("大语言模型响应成功。")
+                _record_usage(span, response)
+                tracer.end_span(span)
+                if cache_key is not None and answer is not None:
+                    self.cache.set(cache_key, answer)
                 return answer
                 
         except Exception as e:
-            print(f"调用LLM API时发生错误: {e}")
+            logger.error("调用LLM API时发生错误: %s", e)
+            span.record_error(e)
+            tracer.end_span(span)
             return "错误:调用语言模型服务时出错。"
 
-    def _handle_stream(self, response) -> Generator[str, None, None]:
-        """处理流式响应的辅助方法"""
+    def _handle_stream(self, response, cache_key: Optional[str] = None, span: Optional[Span] = None) -> Generator[str, None, None]:
+        """处理流式响应的辅助方法。流完整结束后才写入缓存。"""
+        tracer = get_tracer()
+        span = span if span is not None else tracer.start_span("llm.call", model=self.model, stream=True)
         full_content = []
+        finished = False
         try:
             for chunk in response:
                 if chunk.choices and chunk.choices[0].delta.content:
                     content = chunk.choices[0].delta.content
+                    if not full_content:
+                        span.set_attribute("ttft_ms", span.elapsed_ms())
                     full_content.append(content)
                     yield content
-            print("\n大语言模型流式响应结束。")
+            finished = True
+            logger.debug("大语言模型流式响应结束。")
+            if cache_key is not None:
+                self.cache.set(cache_key, "".join(full_content))
         except Exception as e:
-            print(f"流式处理过程中出错: {e}")
+            logger.error("流式处理过程中出错: %s", e)
+            span.record_error(e)
             yield f"[Error: {e}]"
+        finally:
+            # 调用方提前关闭生成器 (如检测到完整 Action) 时断开连接，取消服务端继续生成
+            response.close()
+            _record_stream_end(span, full_content, finished)
+            tracer.end_span(span)
+
+
+class AsyncOpenAICompatibleClient:
+    """
+    OpenAICompatibleClient 的 asyncio 版本，接口与同步客户端保持一致 (agenerate 对应 generate)。
+
+    同一事件循环内、指向同一 base_url 的所有实例共享一个有界的 httpx 连接池，
+    连接在请求之间保持 keep-alive 复用；同时按主机限制在途请求数，
+    使单个事件循环可以同时承载大量智能体会话而不会压垮服务端。
+    """
+
+    # 事件循环 -> {base_url: httpx.AsyncClient}; 连接池与信号量都绑定在创建它们的事件循环上
+    _shared_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+    _host_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_concurrency_per_host: int = 32,
+        timeout: float = 60.0,
+        cache: Optional[Union[TTLCache, SQLiteCache]] = None,
+        cache_sampled: bool = False,
+    ):
+        """
+        初始化客户端。api_key / base_url / model 的环境变量映射以及 cache / cache_sampled
+        的含义与 OpenAICompatibleClient 相同。
+
+        连接池参数 (max_connections 等) 只在该事件循环内第一次为某个 base_url 建池时生效，
+        之后的实例直接复用已有的连接池。
+        """
+        self.api_key = api_key or os.getenv("SILICONFLOW_API_KEY")
+        self.base_url = base_url or os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1")
+        self.model = model or os.getenv("MODEL_ID", "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B")
+
+        if not self.api_key:
+            raise ValueError("API Key 未提供。请在构造函数中传入或设置 SILICONFLOW_API_KEY 环境变量。")
+
+        import httpx
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.timeout = timeout
+        self.host = urlsplit(self.base_url).netloc
+        self.cache = cache
+        self.cache_sampled = cache_sampled
+        self.cache_bypasses = 0
+        # AsyncOpenAI 依赖于所在事件循环的连接池，按事件循环懒加载
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+    def _cache_key(self, messages: list, kwargs: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None:
+            return None
+        key = response_cache_key(self.model, messages, kwargs, self.cache_sampled)
+        if key is None:
+            self.cache_bypasses += 1
+        return key
+
+    def _get_http_client(self, loop: asyncio.AbstractEventLoop) -> "httpx.AsyncClient":
+        import httpx
+
+        pools = self._shared_http_clients.setdefault(loop, {})
+        http_client = pools.get(self.base_url)
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            pools[self.base_url] = http_client
+        return http_client
+
+    def _get_host_semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        semaphores = self._host_semaphores.setdefault(loop, {})
+        if self.host not in semaphores:
+            semaphores[self.host] = asyncio.Semaphore(self.max_concurrency_per_host)
+        return semaphores[self.host]
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=self._get_http_client(loop))
+            self._clients[loop] = client
+        return client
+
+    async def agenerate(self, prompt: str, system_prompt: str, stream: bool = False, **kwargs) -> Union[str, AsyncGenerator[str, None]]:
+        """
+        异步调用LLM API来生成回应。参数与返回值同 OpenAICompatibleClient.generate，
+        区别在于 stream=True 时返回异步生成器。
+        """
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ]
+        return await self.achat(messages, stream=stream, **kwargs)
+
+    async def achat(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs) -> Union[str, AsyncGenerator[str, None]]:
+        """以完整的 chat 消息列表异步调用LLM API，参见 OpenAICompatibleClient.chat。"""
+        tracer = get_tracer()
+        span = tracer.start_span("llm.call", model=self.model, stream=stream, messages=len(messages))
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug("命中LLM响应缓存 (Stream=%s)。", stream)
+                span.set_attribute("cache_hit", True)
+                tracer.end_span(span)
+                return self._replay(cached) if stream else cached
+        span.set_attribute("cache_hit", False)
+
+        logger.debug("正在异步调用大语言模型 (Stream=%s)...", stream)
+        if stream:
+            return self._handle_stream(messages, cache_key, span, **kwargs)
+
+        try:
+            async with self._get_host_semaphore(asyncio.get_running_loop()):
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    **kwargs
+                )
+            answer = response.choices[0].message.content
+            logger.debug("大语言模型响应成功。")
+            _record_usage(span, response)
+            if cache_key is not None and answer is not None:
+                self.cache.set(cache_key, answer)
+            return answer
+        except Exception as e:
+            logger.error("调用LLM API时发生错误: %s", e)
+            span.record_error(e)
+            return "错误:调用语言模型服务时出错。"
+        finally:
+            tracer.end_span(span)
+
+    @staticmethod
+    async def _replay(content: str) -> AsyncGenerator[str, None]:
+        yield content
+
+    async def _handle_stream(self, messages, cache_key: Optional[str] = None, span: Optional[Span] = None, **kwargs) -> AsyncGenerator[str, None]:
+        """处理流式响应的辅助方法。在整个流消费期间占用该主机的一个并发名额。"""
+        tracer = get_tracer()
+        span = span if span is not None else tracer.start_span("llm.call", model=self.model, stream=True)
+        full_content = []
+        finished = False
+        try:
+            async with self._get_host_semaphore(asyncio.get_running_loop()):
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        stream=True,
+                        **kwargs
+                    )
+                    try:
+                        async for chunk in response:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                content = chunk.choices[0].delta.content
+                                if not full_content:
+                                    span.set_attribute("ttft_ms", span.elapsed_ms())
+                                full_content.append(content)
+                                yield content
+                    finally:
+                        await response.close()
+                    finished = True
+                    logger.debug("大语言模型流式响应结束。")
+                    if cache_key is not None:
+                        self.cache.set(cache_key, "".join(full_content))
+                except Exception as e:
+                    logger.error("流式处理过程中出错: %s", e)
+                    span.record_error(e)
+                    yield f"[Error: {e}]"
+        finally:
+            _record_stream_end(span, full_content, finished)
+            tracer.end_span(span)
+
+    @classmethod
+    async def aclose_shared(cls) -> None:
+        """关闭当前事件循环中所有共享的连接池，一般在事件循环退出前调用。"""
+        loop = asyncio.get_running_loop()
+        for http_client in cls._shared_http_clients.pop(loop, {}).values():
+            await http_client.aclose()
+        cls._host_semaphores.pop(loop, None)
+
+
+def create_client(backend: Optional[str] = None, **kwargs) -> Any:
+    """
+    按后端创建同步客户端: "api" 为 OpenAICompatibleClient (默认)，"local" 为
+    travel_agent.local_llm.LocalLLMClient (本地 transformers 模型，可离线运行)，
+    "server" 为 travel_agent.model_server.RemoteLLMClient (连接常驻的本地模型服务，省去每次加载模型)。
+    backend 未提供时读取环境变量 LLM_BACKEND；kwargs 原样传给对应客户端的构造函数。
+    """
+    backend = backend or os.getenv("LLM_BACKEND", "api")
+    if backend == "local":
+        from travel_agent.local_llm import LocalLLMClient
+
+        return LocalLLMClient(**kwargs)
+    if backend == "server":
+        from travel_agent.model_server import RemoteLLMClient
+
+        return RemoteLLMClient(**kwargs)
+    if backend == "api":
+        return OpenAICompatibleClient(**kwargs)
+    raise ValueError(f"未知的 LLM 后端: {backend}")
+
+
+def require_sync_client(llm: Any, caller: str) -> None:
+    """
+    同步的 run() 只能使用同步客户端 (提供 chat / generate)；传入 AsyncOpenAICompatibleClient 时
+    给出明确的 TypeError，而不是在第一次调用模型时才抛出 AttributeError。
+    """
+    if not (callable(getattr(llm, "chat", None)) and callable(getattr(llm, "generate", None))):
+        raise TypeError(f"{caller} 需要同步客户端，{type(llm).__name__} 只支持异步调用，请改用对应的 arun() / 异步方法。")
+
+
+async def agenerate(llm: Any, prompt: str, system_prompt: str, **kwargs) -> str:
+    """
+    以异步方式调用任意客户端的非流式生成:
+    异步客户端直接 await agenerate，同步客户端则放到线程中执行 generate，
+    这样智能体的 arun 可以同时接受两种客户端。
+    """
+    if hasattr(llm, "agenerate"):
+        return await llm.agenerate(prompt, system_prompt, **kwargs)
+    return await asyncio.to_thread(llm.generate, prompt, system_prompt, **kwargs)
+
+
+async def achat(llm: Any, messages: List[Dict[str, str]], **kwargs) -> str:
+    """agenerate 的 chat 消息列表版本，同样兼容同步与异步客户端。"""
+    if hasattr(llm, "achat"):
+        return await llm.achat(messages, **kwargs)
+    return await asyncio.to_thread(llm.chat, messages, **kwargs)
@@ -0,0 +1,589 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Tuple, Union
+
+from common.tracing import Span, get_tracer
+from travel_agent.prefix_cache import PrefixCache
+
+logger = logging.getLogger(__name__)
+
+# download_model.py 的默认保存位置，以及本地不存在时回退的 Hugging Face 模型 ID
+DEFAULT_LOCAL_MODEL_PATH = os.path.join("models", "Qwen1.5-0.5B-Chat")
+DEFAULT_LOCAL_MODEL_ID = "Qwen/Qwen1.5-0.5B-Chat"
+
+
+def select_device(device: Optional[str] = None) -> str:
+    """未指定设备时依次尝试 cuda、mps，最后使用 cpu (与 test_local_model.py 的逻辑一致)。"""
+    if device:
+        return device
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+class LocalModel:
+    """
+    已加载到内存中的分词器与模型。
+    同一模型上的 generate 调用通过 lock 串行执行: CPU 上并发生成只会互相争抢算力。
+    """
+
+    def __init__(self, model_path: str, tokenizer: Any, model: Any, device: str, quantize: Optional[str] = None):
+        self.model_path = model_path
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.quantize = quantize
+        self.lock = threading.Lock()
+        self.scheduler: Optional["BatchScheduler"] = None
+        self.prefix_cache: Optional[PrefixCache] = None
+        # 部分模型没有 pad_token，批量或采样生成时用 eos 代替以避免警告
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+
+_models: Dict[Tuple[str, str, Optional[str]], LocalModel] = {}
+_models_lock = threading.Lock()
+
+QUANTIZE_CHOICES = ["int8"]
+
+
+def _quantize_int8(model: Any, device: str) -> Any:
+    """对 Linear 层做动态 int8 量化: 权重体积约减为 1/4，CPU 上矩阵乘法更快，精度略有损失。"""
+    if device != "cpu":
+        logger.warning("int8 动态量化只支持 CPU，已忽略 (当前设备: %s)", device)
+        return model
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_local_model(model_path: Optional[str] = None, device: Optional[str] = None, quantize: Optional[str] = None) -> LocalModel:
+    """
+    加载本地模型。相同 (路径, 设备, 量化方式) 的模型在进程内只加载一次，所有客户端实例共享。
+
+    model_path 未提供时依次使用环境变量 LOCAL_MODEL_PATH、download_model.py 的保存目录，
+    都不存在时从 Hugging Face 在线加载 Qwen/Qwen1.5-0.5B-Chat。
+    quantize 未提供时读取环境变量 LOCAL_MODEL_QUANTIZE；目前支持 "int8" (仅 CPU)。
+
+    safetensors 格式的权重 (download_model.py 默认保存的格式) 通过 mmap 直接映射进内存，
+    并跳过参数的随机初始化，加载时间主要取决于磁盘读取。
+    若需在多次命令行调用之间复用已加载的模型，参见 travel_agent.model_server。
+    """
+    if model_path is None:
+        model_path = os.getenv("LOCAL_MODEL_PATH") or DEFAULT_LOCAL_MODEL_PATH
+        if not os.path.exists(model_path):
+            logger.warning("本地路径不存在: %s，将尝试从 Hugging Face 在线加载: %s", model_path, DEFAULT_LOCAL_MODEL_ID)
+            model_path = DEFAULT_LOCAL_MODEL_ID
+    device = select_device(device)
+    quantize = quantize or os.getenv("LOCAL_MODEL_QUANTIZE") or None
+    if quantize is not None and quantize not in QUANTIZE_CHOICES:
+        raise ValueError(f"不支持的量化方式: {quantize}")
+
+    key = (model_path, device, quantize)
+    with _models_lock:
+        if key not in _models:
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            logger.info("正在加载本地模型: %s (%s)", model_path, device)
+            started = time.perf_counter()
+            tokenizer = AutoTokenizer.from_pretrained(model_path)
+            model = AutoModelForCausalLM.from_pretrained(model_path, low_cpu_mem_usage=True).to(device)
+            model.eval()
+            if quantize == "int8":
+                model = _quantize_int8(model, device)
+            logger.info("本地模型加载完成，耗时 %.1f 秒。", time.perf_counter() - started)
+            _models[key] = LocalModel(model_path, tokenizer, model, device, quantize)
+        return _models[key]
+
+
+def _normalize_stop(stop: Union[str, List[str], None]) -> List[str]:
+    if not stop:
+        return []
+    return [stop] if isinstance(stop, str) else [s for s in stop if s]
+
+
+def _truncate_at_stop(text: str, stop: List[str]) -> str:
+    positions = [text.find(s) for s in stop if s in text]
+    return text[:min(positions)] if positions else text
+
+
+class _StopFilter:
+    """流式输出时扣住可能是停止词开头的尾部文本；出现停止词时截断并标记 stopped。"""
+
+    def __init__(self, stop: List[str]):
+        self.stop = stop
+        self.hold = max((len(s) for s in stop), default=1) - 1
+        self.buffer = ""
+        self.stopped = False
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        positions = [self.buffer.find(s) for s in self.stop if s in self.buffer]
+        if positions:
+            out = self.buffer[:min(positions)]
+            self.buffer = ""
+            self.stopped = True
+            return out
+        split = max(0, len(self.buffer) - self.hold)
+        out, self.buffer = self.buffer[:split], self.buffer[split:]
+        return out
+
+    def flush(self) -> str:
+        out, self.buffer = self.buffer, ""
+        return out
+
+
+def _cancel_criteria(cancelled: threading.Event) -> Any:
+    """调用方提前关闭流式生成器时，让 model.generate 在下一个 token 处停止。"""
+    import torch
+    from transformers import StoppingCriteria
+
+    class _Cancelled(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return _Cancelled()
+
+
+class BatchRequest:
+    """提交给 BatchScheduler 的一次生成请求。迭代它即可按顺序取得生成的文本块。"""
+
+    def __init__(self, prompt: str, gen_kwargs: Dict[str, Any], stop: List[str]):
+        self.prompt = prompt
+        self.max_new_tokens = gen_kwargs.pop("max_new_tokens")
+        self.gen_kwargs = gen_kwargs
+        # 采样参数相同的请求才能放进同一个批次
+        self.batch_key = tuple(sorted((k, v) for k, v in gen_kwargs.items() if k != "pad_token_id"))
+        self.stop_filter = _StopFilter(stop)
+        self.cancelled = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.batch_size = 0
+        self._chunks: "queue.Queue[Optional[str]]" = queue.Queue()
+
+    def put(self, text: str) -> None:
+        if text:
+            self._chunks.put(text)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        self._chunks.put(None)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            text = self._chunks.get()
+            if text is None:
+                break
+            yield text
+        if self.error is not None:
+            raise self.error
+
+
+class _BatchStreamer:
+    """
+    model.generate 的 streamer: 每一步收到整个批次的新 token，按行增量解码，
+    套用各自的停止词，并把文本块分发给对应的请求。
+    """
+
+    def __init__(self, tokenizer: Any, requests: List[BatchRequest], eos_token_ids: List[int]):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.eos_token_ids = set(eos_token_ids)
+        self.ids: List[List[int]] = [[] for _ in requests]
+        self.emitted = [0] * len(requests)
+        self.done = [False] * len(requests)
+        self._prompt_seen = False
+
+    def put(self, value: Any) -> None:
+        # 第一次调用传入的是 prompt
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for row, token in enumerate(value.tolist()):
+            if self.done[row]:
+                continue
+            request = self.requests[row]
+            if token in self.eos_token_ids:
+                self._finish(row)
+                continue
+            self.ids[row].append(token)
+            request.completion_tokens += 1
+            text = self.tokenizer.decode(self.ids[row], skip_special_tokens=True)
+            # 多字节字符尚未完整时先不输出
+            if not text.endswith("\ufffd"):
+                request.put(request.stop_filter.feed(text[self.emitted[row]:]))
+                self.emitted[row] = len(text)
+            if request.stop_filter.stopped or len(self.ids[row]) >= request.max_new_tokens or request.cancelled.is_set():
+                self._finish(row)
+
+    def _finish(self, row: int) -> None:
+        self.done[row] = True
+        request = self.requests[row]
+        if not request.stop_filter.stopped:
+            request.put(request.stop_filter.flush())
+        request.finish()
+
+    def end(self) -> None:
+        for row in range(len(self.requests)):
+            if not self.done[row]:
+                self._finish(row)
+
+    def rows_done(self) -> List[bool]:
+        return [done or request.cancelled.is_set() for done, request in zip(self.done, self.requests)]
+
+
+def _rows_done_criteria(streamer: _BatchStreamer) -> Any:
+    """逐行判断是否结束 (停止词、各自的 max_new_tokens、被取消)；全部结束时整个批次提前停止。"""
+    import torch
+    from transformers import StoppingCriteria
+
+    class _RowsDone(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.tensor(streamer.rows_done(), dtype=torch.bool, device=input_ids.device)
+
+    return _RowsDone()
+
+
+class BatchScheduler:
+    """
+    动态批处理: 在 batch_window 秒内收集并发到达的生成请求 (最多 max_batch_size 个)，
+    左侧补齐后作为一个批次执行一次 model.generate，再把各行的结果与流式文本分发回调用方。
+    CPU 上一次处理多条序列的矩阵运算远比逐条处理高效，并发会话越多，总 tokens/秒越高。
+
+    批次内所有行一起解码，直到最长的一行结束；已结束的行不再输出。
+    """
+
+    def __init__(self, local_model: LocalModel, max_batch_size: int = 8, batch_window: float = 0.005):
+        self.local_model = local_model
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.batches = 0
+        self.requests = 0
+        tokenizer = local_model.tokenizer
+        # 自回归生成要求左侧补齐，新 token 才能紧接在每行 prompt 之后
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        eos = getattr(local_model.model.generation_config, "eos_token_id", None)
+        eos = eos if isinstance(eos, list) else [eos]
+        self.eos_token_ids = [t for t in eos + [tokenizer.eos_token_id] if t is not None]
+        self._queue: "queue.Queue[BatchRequest]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+    def submit(self, prompt: str, gen_kwargs: Dict[str, Any], stop: List[str]) -> BatchRequest:
+        request = BatchRequest(prompt, dict(gen_kwargs), stop)
+        self._queue.put(request)
+        return request
+
+    def _collect(self) -> List[BatchRequest]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            groups: Dict[Tuple, List[BatchRequest]] = {}
+            for request in self._collect():
+                if request.cancelled.is_set():
+                    request.finish()
+                else:
+                    groups.setdefault(request.batch_key, []).append(request)
+            for group in groups.values():
+                self._run_batch(group)
+
+    def _run_batch(self, group: List[BatchRequest]) -> None:
+        import torch
+        from transformers import StoppingCriteriaList
+
+        tokenizer = self.local_model.tokenizer
+        streamer = _BatchStreamer(tokenizer, group, self.eos_token_ids)
+        try:
+            inputs = tokenizer([r.prompt for r in group], return_tensors="pt", padding=True).to(self.local_model.device)
+            for request, mask in zip(group, inputs["attention_mask"]):
+                request.prompt_tokens = int(mask.sum())
+                request.batch_size = len(group)
+            with self.local_model.lock, torch.inference_mode():
+                self.local_model.model.generate(
+                    **inputs,
+                    **group[0].gen_kwargs,
+                    max_new_tokens=max(r.max_new_tokens for r in group),
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_rows_done_criteria(streamer)]),
+                )
+            self.batches += 1
+            self.requests += len(group)
+        except Exception as e:
+            logger.error("本地模型批量生成时发生错误: %s", e)
+            for row, request in enumerate(group):
+                if not streamer.done[row]:
+                    streamer.done[row] = True
+                    request.finish(e)
+        finally:
+            streamer.end()
+
+
+def get_batch_scheduler(local_model: LocalModel, max_batch_size: int = 8, batch_window: float = 0.005) -> BatchScheduler:
+    """每个已加载的模型共享一个调度器；参数以第一次创建时为准。"""
+    with _models_lock:
+        if local_model.scheduler is None:
+            local_model.scheduler = BatchScheduler(local_model, max_batch_size, batch_window)
+        return local_model.scheduler
+
+
+def get_prefix_cache(local_model: LocalModel, max_bytes: int) -> PrefixCache:
+    """每个已加载的模型共享一个 KV 前缀缓存；容量以第一次创建时为准。"""
+    with _models_lock:
+        if local_model.prefix_cache is None:
+            local_model.prefix_cache = PrefixCache(max_bytes)
+        return local_model.prefix_cache
+
+
+class LocalLLMClient:
+    """
+    使用本地 transformers 模型的客户端 (默认为 download_model.py 下载的 Qwen1.5-0.5B-Chat)，
+    接口与 OpenAICompatibleClient 相同: generate / chat，支持 stop 停止词与流式输出，
+    因此所有智能体都可以离线运行，规划、评审等简单步骤也省去了网络往返。
+    """
+
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        device: Optional[str] = None,
+        max_new_tokens: int = 512,
+        max_batch_size: int = 1,
+        batch_window: float = 0.005,
+        prefix_cache_mb: int = 512,
+        quantize: Optional[str] = None,
+    ):
+        """
+        model_path / device / quantize: 参见 load_local_model；模型在首次创建客户端时加载，之后的实例直接复用。
+        max_new_tokens: 未通过 max_tokens 指定时的最大生成长度。
+        max_batch_size: 大于 1 时通过该模型共享的 BatchScheduler 与其他并发请求合并成批次执行，
+            batch_window 为收集同批请求的等待时间 (秒)。适合多个会话并发使用同一个本地模型。
+        prefix_cache_mb: 非批处理模式下 KV 前缀缓存的容量 (MB)，为 0 时关闭。ReAct 每轮、Solver 每步
+            都会重复发送相同的系统提示词与模板，命中缓存后只需计算新增的 token。
+            批处理模式下各行前缀不同，不使用前缀缓存。
+        """
+        self.local_model = load_local_model(model_path, device, quantize)
+        self.model = self.local_model.model_path
+        self.max_new_tokens = max_new_tokens
+        self.scheduler = get_batch_scheduler(self.local_model, max_batch_size, batch_window) if max_batch_size > 1 else None
+        use_prefix_cache = self.scheduler is None and prefix_cache_mb > 0
+        self.prefix_cache = get_prefix_cache(self.local_model, prefix_cache_mb * 1024 * 1024) if use_prefix_cache else None
+
+    def generate(self, prompt: str, system_prompt: str, stream: bool = False, **kwargs) -> Union[str, Generator[str, None, None]]:
+        """参数与返回值同 OpenAICompatibleClient.generate。"""
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ]
+        return self.chat(messages, stream=stream, **kwargs)
+
+    def _prompt(self, messages: List[Dict[str, str]]) -> str:
+        return self.local_model.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def _generation_kwargs(self, kwargs: Dict[str, Any], stop: List[str]) -> Dict[str, Any]:
+        """把 OpenAI 风格的参数 (temperature、top_p、max_tokens) 转换为 model.generate 的参数。"""
+        gen_kwargs: Dict[str, Any] = {
+            "max_new_tokens": kwargs.get("max_tokens") or self.max_new_tokens,
+            "pad_token_id": self.local_model.pad_token_id,
+        }
+        temperature = kwargs.get("temperature")
+        if temperature:
+            gen_kwargs.update(do_sample=True, temperature=temperature)
+            if kwargs.get("top_p") is not None:
+                gen_kwargs["top_p"] = kwargs["top_p"]
+        else:
+            # 未指定温度或温度为 0 时使用贪心解码，结果可复现
+            gen_kwargs["do_sample"] = False
+        if stop:
+            # 遇到停止词即结束生成；生成结果中的停止词本身另行截掉
+            gen_kwargs.update(stop_strings=stop, tokenizer=self.local_model.tokenizer)
+        return gen_kwargs
+
+    def chat(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs) -> Union[str, Generator[str, None, None]]:
+        """以完整的 chat 消息列表在本地模型上生成，返回值同 generate。"""
+        tracer = get_tracer()
+        span = tracer.start_span("llm.call", model=self.model, backend="local", stream=stream, messages=len(messages))
+        stop = _normalize_stop(kwargs.get("stop"))
+        try:
+            prompt = self._prompt(messages)
+            # 批处理时停止词由调度器逐行处理
+            gen_kwargs = self._generation_kwargs(kwargs, [] if self.scheduler is not None else stop)
+            if self.scheduler is None:
+                inputs = self.local_model.tokenizer([prompt], return_tensors="pt").to(self.local_model.device)
+                span.set_attribute("prompt_tokens", int(inputs["input_ids"].shape[1]))
+        except Exception as e:
+            logger.error("本地模型编码输入时发生错误: %s", e)
+            span.record_error(e)
+            tracer.end_span(span)
+            return iter([f"[Error: {e}]"]) if stream else "错误:调用本地语言模型时出错。"
+
+        if self.scheduler is not None:
+            request = self.scheduler.submit(prompt, gen_kwargs, stop)
+            if stream:
+                return self._relay(request, request.cancel, span, request)
+            try:
+                return "".join(request)
+            except Exception as e:
+                logger.error("本地模型生成时发生错误: %s", e)
+                span.record_error(e)
+                return "错误:调用本地语言模型时出错。"
+            finally:
+                self._record_request(span, request)
+                tracer.end_span(span)
+
+        if stream:
+            return self._handle_stream(inputs, gen_kwargs, stop, span)
+
+        import torch
+
+        try:
+            with self.local_model.lock, torch.inference_mode():
+                output = self._generate(inputs, gen_kwargs, span)
+            new_ids = output[0][inputs["input_ids"].shape[1]:]
+            span.set_attribute("completion_tokens", int(new_ids.shape[0]))
+            answer = self.local_model.tokenizer.decode(new_ids, skip_special_tokens=True)
+            return _truncate_at_stop(answer, stop)
+        except Exception as e:
+            logger.error("本地模型生成时发生错误: %s", e)
+            span.record_error(e)
+            return "错误:调用本地语言模型时出错。"
+        finally:
+            tracer.end_span(span)
+
+    def choice_probabilities(self, messages: List[Dict[str, str]], choices: List[str]) -> Dict[str, float]:
+        """
+        只做一次前向计算，按各选项第一个 token 在下一位置的 logits 做 softmax，返回 {选项: 概率}。
+        用于 YES/NO 之类的分类打分 (例如反思智能体的本地初筛评审)，不需要逐 token 生成。
+        各选项的第一个 token 必须互不相同。
+        """
+        import torch
+
+        tokenizer = self.local_model.tokenizer
+        token_ids = [tokenizer.encode(choice, add_special_tokens=False)[0] for choice in choices]
+        if len(set(token_ids)) != len(token_ids):
+            raise ValueError(f"选项的第一个 token 相同，无法区分: {choices}")
+        tracer = get_tracer()
+        span = tracer.start_span("llm.score", model=self.model, backend="local", choices=len(choices))
+        try:
+            inputs = tokenizer([self._prompt(messages)], return_tensors="pt").to(self.local_model.device)
+            span.set_attribute("prompt_tokens", int(inputs["input_ids"].shape[1]))
+            with self.local_model.lock, torch.inference_mode():
+                logits = self.local_model.model(**inputs).logits[0, -1]
+            probs = torch.softmax(logits[token_ids].float(), dim=-1).tolist()
+            return dict(zip(choices, probs))
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            tracer.end_span(span)
+
+    def _generate(self, inputs: Any, gen_kwargs: Dict[str, Any], span: Span, **extra: Any) -> Any:
+        """
+        执行 model.generate (调用方需持有模型锁)，返回包含 prompt 的完整序列。
+        启用前缀缓存时从最长的已缓存前缀继续生成，并把本次的 KV 存回缓存供下一轮复用。
+        """
+        model = self.local_model.model
+        if self.prefix_cache is None:
+            return model.generate(**inputs, **gen_kwargs, **extra)
+        past_key_values, reused = self.prefix_cache.lookup(inputs["input_ids"][0].tolist())
+        span.set_attribute("prefix_cache_tokens", reused)
+        if past_key_values is not None:
+            extra["past_key_values"] = past_key_values
+        output = model.generate(**inputs, **gen_kwargs, **extra, return_dict_in_generate=True)
+        self.prefix_cache.store(output.sequences[0].tolist(), output.past_key_values)
+        return output.sequences
+
+    @staticmethod
+    def _record_request(span: Span, request: BatchRequest) -> None:
+        span.set_attributes(prompt_tokens=request.prompt_tokens, completion_tokens=request.completion_tokens, batch_size=request.batch_size)
+
+    def _handle_stream(self, inputs: Any, gen_kwargs: Dict[str, Any], stop: List[str], span: Span) -> Generator[str, None, None]:
+        """
+        在后台线程中运行 model.generate，通过 TextIteratorStreamer 逐块产出文本。
+        调用方提前关闭生成器 (如已解析出完整 Action) 时，生成会在下一个 token 处停止。
+        """
+        import torch
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(self.local_model.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        cancelled = threading.Event()
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            try:
+                with self.local_model.lock, torch.inference_mode():
+                    self._generate(
+                        inputs,
+                        gen_kwargs,
+                        span,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_cancel_criteria(cancelled)]),
+                    )
+            except Exception as e:
+                errors.append(e)
+                # 保证消费端的迭代能够结束
+                streamer.end()
+
+        def pieces() -> Iterator[str]:
+            stop_filter = _StopFilter(stop)
+            for text in streamer:
+                yield stop_filter.feed(text)
+                if stop_filter.stopped:
+                    return
+            yield stop_filter.flush()
+            if errors:
+                raise errors[0]
+
+        threading.Thread(target=run, daemon=True).start()
+        return self._relay(pieces(), cancelled.set, span)
+
+    def _relay(self, pieces: Iterable[str], cancel: Callable[[], None], span: Span, request: Optional[BatchRequest] = None) -> Generator[str, None, None]:
+        """把生成的文本块转交给调用方；调用方提前关闭生成器时通过 cancel 停止生成。"""
+        tracer = get_tracer()
+        chunks = 0
+        finished = False
+        try:
+            for text in pieces:
+                if not text:
+                    continue
+                if not chunks:
+                    span.set_attribute("ttft_ms", span.elapsed_ms())
+                chunks += 1
+                yield text
+            finished = True
+            logger.debug("本地模型流式响应结束。")
+        except Exception as e:
+            logger.error("本地模型流式生成时出错: %s", e)
+            span.record_error(e)
+            yield f"[Error: {e}]"
+        finally:
+            cancel()
+            span.set_attribute("chunks", chunks)
+            if request is not None:
+                self._record_request(span, request)
+            if not finished and span.error is None:
+                span.set_attribute("cancelled", True)
+            tracer.end_span(span)
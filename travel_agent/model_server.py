@@ -0,0 +1,377 @@
+"""
+常驻的本地模型服务进程。
+
+每次运行命令行脚本都重新加载分词器与模型权重，短问题的耗时几乎全花在启动上。
+模型服务进程只加载一次模型，之后的调用通过 multiprocessing.connection 连接到它:
+
+    python -m travel_agent.model_server --quantize int8      # 前台启动
+    LLM_BACKEND=server python ReAct/ReAct_agent.py           # 连接服务 (未启动时自动在后台拉起)
+    python -m travel_agent.model_server --stop               # 关闭服务
+
+连接口令默认是首次使用时随机生成的、只有当前用户可读的密钥文件 (见 DEFAULT_KEY_FILE)；
+请求与响应以 JSON 传输，服务端不会反序列化 (unpickle) 客户端发来的任意对象。
+"""
+import json
+import logging
+import os
+import secrets
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, Generator, List, Optional, Tuple, Union
+
+# 以脚本方式运行时也能导入项目内的模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.tracing import Span, get_tracer
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_ADDRESS = ("127.0.0.1", 6001)
+SERVER_LOG_FILE = os.path.join(tempfile.gettempdir(), "ai-agents-exp-model-server.log")
+DEFAULT_KEY_FILE = os.path.join(os.path.expanduser("~"), ".ai-agents-exp", "model_server.key")
+# 单条消息的上限，防止异常的客户端让服务端分配过大的内存
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def parse_address(address: Optional[str] = None) -> Tuple[str, int]:
+    """把 "host:port" 解析为地址元组；未提供时读取环境变量 LOCAL_MODEL_SERVER，默认 127.0.0.1:6001。"""
+    address = address or os.getenv("LOCAL_MODEL_SERVER")
+    if not address:
+        return DEFAULT_ADDRESS
+    host, _, port = address.rpartition(":")
+    return host or DEFAULT_ADDRESS[0], int(port)
+
+
+def _read_key_file(path: str) -> str:
+    info = os.stat(path)
+    if info.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise PermissionError(f"模型服务密钥文件的权限过宽 (应为 0600): {path}")
+    with open(path, encoding="utf-8") as f:
+        key = f.read().strip()
+    if not key:
+        raise ValueError(f"模型服务密钥文件为空: {path}")
+    return key
+
+
+def _load_or_create_key(path: str = DEFAULT_KEY_FILE) -> str:
+    """读取当前用户的密钥文件；不存在时生成随机密钥并以 0600 权限写入 (目录为 0700)。"""
+    if os.path.exists(path):
+        return _read_key_file(path)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    key = secrets.token_hex(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # 服务端与客户端同时首次启动，另一方已经写入
+        time.sleep(0.05)
+        return _read_key_file(path)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key)
+    return key
+
+
+def _authkey(authkey: Optional[str] = None) -> bytes:
+    """
+    连接口令，服务端与客户端必须一致。依次使用参数、环境变量 LOCAL_MODEL_SERVER_KEY、
+    当前用户的密钥文件 DEFAULT_KEY_FILE (首次使用时随机生成)。
+    """
+    return (authkey or os.getenv("LOCAL_MODEL_SERVER_KEY") or _load_or_create_key()).encode("utf-8")
+
+
+def _send(conn: Any, message: Dict[str, Any]) -> None:
+    conn.send_bytes(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+
+def _recv(conn: Any) -> Dict[str, Any]:
+    """接收一条 JSON 消息；Connection.recv 会 unpickle 收到的数据，因此两端都只用 send_bytes / recv_bytes。"""
+    message = json.loads(conn.recv_bytes(MAX_MESSAGE_BYTES).decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("消息必须是 JSON 对象")
+    return message
+
+
+class ModelServer:
+    """
+    在 address 上监听，每个连接由一个线程处理一次请求:
+    - {"op": "ping"} -> {"ok": True, "model": ..., "pid": ...}
+    - {"op": "chat", "messages": [...], "stream": bool, "kwargs": {...}}
+      非流式返回 {"text": ...}；流式逐块返回 {"chunk": ...}，最后返回 {"done": True}
+    - {"op": "shutdown"} -> {"ok": True}，随后服务退出
+
+    流式生成时客户端提前断开连接，服务端会在下一次发送失败时取消这次生成。
+    """
+
+    def __init__(self, llm: Any, address: Tuple[str, int] = DEFAULT_ADDRESS, authkey: Optional[str] = None, idle_timeout: float = 0):
+        """
+        llm: 实际执行生成的客户端 (通常是 LocalLLMClient)。
+        idle_timeout: 连续这么多秒没有请求时自动退出，为 0 时一直运行。
+        """
+        self.llm = llm
+        self.address = address
+        self.authkey = _authkey(authkey)
+        self.idle_timeout = idle_timeout
+        self._last_request = time.monotonic()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def serve_forever(self) -> None:
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logger.info("本地模型服务已启动: %s:%s (pid %s)", *self.address, os.getpid())
+            if self.idle_timeout:
+                threading.Thread(target=self._watch_idle, daemon=True).start()
+            while not self._stopped.is_set():
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    if not self._stopped.is_set():
+                        logger.warning("接受连接失败: %s", e)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        logger.info("本地模型服务已退出。")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        # accept() 会一直阻塞，连接一次自己把它唤醒
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+
+    def _watch_idle(self) -> None:
+        while not self._stopped.wait(min(self.idle_timeout, 60)):
+            if not self._active and time.monotonic() - self._last_request > self.idle_timeout:
+                logger.info("超过 %s 秒没有请求，自动退出。", self.idle_timeout)
+                self.stop()
+
+    def _handle(self, conn: Any) -> None:
+        with conn:
+            try:
+                request = _recv(conn)
+            except (EOFError, OSError, ValueError) as e:
+                logger.warning("无法解析请求: %s", e)
+                return
+            with self._lock:
+                self._active += 1
+            op = request.get("op")
+            try:
+                if op == "ping":
+                    _send(conn, {"ok": True, "model": self.llm.model, "pid": os.getpid()})
+                elif op == "shutdown":
+                    _send(conn, {"ok": True})
+                    self.stop()
+                elif op == "chat" and request.get("stream"):
+                    self._stream(conn, request)
+                elif op == "chat":
+                    _send(conn, {"text": self.llm.chat(request["messages"], **request.get("kwargs", {}))})
+                else:
+                    _send(conn, {"error": f"未知的请求: {op}"})
+            except (EOFError, OSError):
+                # 客户端已断开
+                pass
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._last_request = time.monotonic()
+
+    def _stream(self, conn: Any, request: Dict[str, Any]) -> None:
+        pieces = self.llm.chat(request["messages"], stream=True, **request.get("kwargs", {}))
+        try:
+            for text in pieces:
+                _send(conn, {"chunk": text})
+            _send(conn, {"done": True})
+        finally:
+            # 客户端提前断开时关闭生成器，本地模型随之停止生成
+            pieces.close()
+
+
+def spawn_server(
+    address: Tuple[str, int] = DEFAULT_ADDRESS,
+    idle_timeout: float = 1800,
+    model_path: Optional[str] = None,
+    device: Optional[str] = None,
+    quantize: Optional[str] = None,
+    max_batch_size: int = 1,
+    prefix_cache_mb: int = 512,
+) -> subprocess.Popen:
+    """在后台启动一个与当前终端脱离的模型服务进程，日志写入 SERVER_LOG_FILE。"""
+    cmd = [
+        sys.executable, "-m", "travel_agent.model_server",
+        "--address", f"{address[0]}:{address[1]}",
+        "--idle-timeout", str(idle_timeout),
+        "--max-batch-size", str(max_batch_size),
+        "--prefix-cache-mb", str(prefix_cache_mb),
+    ]
+    if model_path:
+        cmd += ["--model-path", model_path]
+    if device:
+        cmd += ["--device", device]
+    if quantize:
+        cmd += ["--quantize", quantize]
+    logger.info("正在后台启动本地模型服务，日志: %s", SERVER_LOG_FILE)
+    with open(SERVER_LOG_FILE, "ab") as log:
+        return subprocess.Popen(cmd, cwd=PROJECT_ROOT, stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+
+
+class RemoteLLMClient:
+    """
+    连接常驻模型服务的客户端，接口与 OpenAICompatibleClient / LocalLLMClient 相同。
+    创建时若服务尚未运行且 spawn 为 True，则在后台启动服务并等待模型加载完成；
+    之后的命令行调用直接复用已加载的模型。
+    """
+
+    def __init__(
+        self,
+        address: Optional[str] = None,
+        authkey: Optional[str] = None,
+        spawn: bool = True,
+        spawn_timeout: float = 300,
+        idle_timeout: float = 1800,
+        **server_kwargs: Any,
+    ):
+        """
+        address / authkey: 参见 parse_address 与 _authkey。
+        spawn_timeout: 等待后台服务加载模型的最长时间 (秒)。
+        idle_timeout: 自动启动的服务连续空闲多久后退出 (秒)。
+        server_kwargs: 自动启动服务时的模型参数 (model_path、device、quantize、max_batch_size、prefix_cache_mb)。
+        """
+        self.address = parse_address(address)
+        self.authkey = _authkey(authkey)
+        info = self.ping()
+        if info is None:
+            if not spawn:
+                raise ConnectionError(f"无法连接本地模型服务: {self.address[0]}:{self.address[1]}")
+            info = self._spawn_and_wait(spawn_timeout, idle_timeout, server_kwargs)
+        self.model = info["model"]
+
+    def _connect(self) -> Any:
+        return Client(self.address, authkey=self.authkey)
+
+    def ping(self) -> Optional[Dict[str, Any]]:
+        """服务正在运行时返回其信息，否则返回 None。"""
+        try:
+            with self._connect() as conn:
+                _send(conn, {"op": "ping"})
+                return _recv(conn)
+        except AuthenticationError as e:
+            raise ConnectionError(f"本地模型服务拒绝连接，请检查 LOCAL_MODEL_SERVER_KEY 或密钥文件 {DEFAULT_KEY_FILE}: {e}") from e
+        except (OSError, EOFError):
+            return None
+
+    def _spawn_and_wait(self, timeout: float, idle_timeout: float, server_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        process = spawn_server(self.address, idle_timeout, **server_kwargs)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            info = self.ping()
+            if info is not None:
+                return info
+            if process.poll() is not None:
+                raise RuntimeError(f"本地模型服务启动失败，详见日志: {SERVER_LOG_FILE}")
+            time.sleep(0.2)
+        raise TimeoutError(f"等待本地模型服务启动超时 ({timeout} 秒)，详见日志: {SERVER_LOG_FILE}")
+
+    def generate(self, prompt: str, system_prompt: str, stream: bool = False, **kwargs) -> Union[str, Generator[str, None, None]]:
+        """参数与返回值同 OpenAICompatibleClient.generate。"""
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ]
+        return self.chat(messages, stream=stream, **kwargs)
+
+    def chat(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs) -> Union[str, Generator[str, None, None]]:
+        """把完整的 chat 消息列表交给模型服务生成，返回值同 generate。"""
+        tracer = get_tracer()
+        span = tracer.start_span("llm.call", model=self.model, backend="server", stream=stream, messages=len(messages))
+        request = {"op": "chat", "messages": messages, "stream": stream, "kwargs": kwargs}
+        if stream:
+            return self._handle_stream(request, span)
+        try:
+            with self._connect() as conn:
+                _send(conn, request)
+                return _recv(conn)["text"]
+        except (OSError, EOFError) as e:
+            logger.error("调用本地模型服务时发生错误: %s", e)
+            span.record_error(e)
+            return "错误:调用本地语言模型时出错。"
+        finally:
+            tracer.end_span(span)
+
+    def _handle_stream(self, request: Dict[str, Any], span: Span) -> Generator[str, None, None]:
+        """逐块转交服务端的流式输出；调用方提前关闭生成器时断开连接，服务端随之停止生成。"""
+        tracer = get_tracer()
+        chunks = 0
+        finished = False
+        try:
+            with self._connect() as conn:
+                _send(conn, request)
+                while True:
+                    reply = _recv(conn)
+                    if reply.get("done"):
+                        break
+                    if not chunks:
+                        span.set_attribute("ttft_ms", span.elapsed_ms())
+                    chunks += 1
+                    yield reply["chunk"]
+            finished = True
+        except (OSError, EOFError) as e:
+            logger.error("本地模型服务流式生成时出错: %s", e)
+            span.record_error(e)
+            yield f"[Error: {e}]"
+        finally:
+            span.set_attribute("chunks", chunks)
+            if not finished and span.error is None:
+                span.set_attribute("cancelled", True)
+            tracer.end_span(span)
+
+
+def main() -> int:
+    import argparse
+
+    from travel_agent.local_llm import QUANTIZE_CHOICES, LocalLLMClient
+
+    parser = argparse.ArgumentParser(description="常驻的本地模型服务，命令行脚本通过 LLM_BACKEND=server 连接。")
+    parser.add_argument("--address", help="监听地址 host:port (默认读取 LOCAL_MODEL_SERVER，或 127.0.0.1:6001)")
+    parser.add_argument("--model-path", help="模型目录或 Hugging Face 模型 ID (默认同 load_local_model)")
+    parser.add_argument("--device", help="cuda / mps / cpu (默认自动选择)")
+    parser.add_argument("--quantize", choices=QUANTIZE_CHOICES, help="对 CPU 上的模型做动态量化")
+    parser.add_argument("--max-batch-size", type=int, default=1, help="大于 1 时合并并发请求成批次生成")
+    parser.add_argument("--prefix-cache-mb", type=int, default=512, help="KV 前缀缓存容量，0 为关闭")
+    parser.add_argument("--idle-timeout", type=float, default=0, help="空闲多少秒后自动退出，0 为一直运行")
+    parser.add_argument("--stop", action="store_true", help="关闭正在运行的服务")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+    address = parse_address(args.address)
+
+    if args.stop:
+        try:
+            with Client(address, authkey=_authkey()) as conn:
+                _send(conn, {"op": "shutdown"})
+                _recv(conn)
+        except (OSError, EOFError):
+            logger.error("没有正在运行的本地模型服务: %s:%s", *address)
+            return 1
+        logger.info("本地模型服务已关闭。")
+        return 0
+
+    llm = LocalLLMClient(
+        model_path=args.model_path,
+        device=args.device,
+        quantize=args.quantize,
+        max_batch_size=args.max_batch_size,
+        prefix_cache_mb=args.prefix_cache_mb,
+    )
+    ModelServer(llm, address, idle_timeout=args.idle_timeout).serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+def _common_prefix_len(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+def kv_cache_nbytes(cache: Any) -> int:
+    """统计 past_key_values 占用的字节数，兼容新版 Cache.layers、旧版 key_cache/value_cache 以及元组格式。"""
+    if hasattr(cache, "layers"):
+        tensors = [t for layer in cache.layers for t in (layer.keys, layer.values) if t is not None]
+    elif hasattr(cache, "key_cache"):
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    else:
+        tensors = [t for layer in cache for t in layer]
+    return sum(t.element_size() * t.nelement() for t in tensors)
+
+
+class PrefixCache:
+    """
+    本地模型的 KV 前缀缓存: 保存已计算过的 token 序列对应的 past_key_values (DynamicCache)，
+    新请求从与之最长公共前缀处继续计算，而不是重新对系统提示词、ReAct 模板和之前的轮次做注意力计算。
+
+    - 每次生成结束后保存 "prompt + 已生成内容" 的缓存；下一轮的 prompt 正好以它为前缀。
+    - 取出时深拷贝并 crop 到公共前缀长度，因为 generate 会原地追加缓存。
+    - 总占用超过 max_bytes 时按 LRU 淘汰；被新条目完全包含的旧前缀直接删除。
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, min_prefix_tokens: int = 16):
+        """
+        max_bytes: 所有缓存条目的总字节上限。
+        min_prefix_tokens: 公共前缀短于该值时不复用 (拷贝缓存的开销可能超过节省的计算)。
+        """
+        self.max_bytes = max_bytes
+        self.min_prefix_tokens = min_prefix_tokens
+        self._entries: "OrderedDict[Tuple[int, ...], Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.evictions = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, input_ids: List[int]) -> Tuple[Optional[Any], int]:
+        """
+        返回 (past_key_values, 复用的 token 数)。至少保留最后一个 token 给模型计算，
+        没有足够长的公共前缀时返回 (None, 0)。
+        """
+        best_key, best_len = None, 0
+        with self._lock:
+            for key in self._entries:
+                n = _common_prefix_len(key, input_ids)
+                if n > best_len:
+                    best_key, best_len = key, n
+            reuse = min(best_len, len(input_ids) - 1)
+            if best_key is None or reuse < self.min_prefix_tokens:
+                self.misses += 1
+                return None, 0
+            self._entries.move_to_end(best_key)
+            cached = self._entries[best_key][0]
+            self.hits += 1
+            self.reused_tokens += reuse
+        # 在锁外拷贝: 即使该条目此时被淘汰，我们持有的引用仍然有效
+        past_key_values = copy.deepcopy(cached)
+        past_key_values.crop(reuse)
+        return past_key_values, reuse
+
+    def store(self, token_ids: List[int], past_key_values: Any) -> None:
+        """保存一次生成后的缓存；token_ids 为完整序列，只取缓存实际覆盖的长度作为键。"""
+        length = past_key_values.get_seq_length()
+        key = tuple(token_ids[:length])
+        nbytes = kv_cache_nbytes(past_key_values)
+        if length < self.min_prefix_tokens or nbytes > self.max_bytes:
+            return
+        with self._lock:
+            for existing in list(self._entries):
+                if len(existing) <= len(key) and key[:len(existing)] == existing:
+                    self._bytes -= self._entries.pop(existing)[1]
+            self._entries[key] = (past_key_values, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -3,7 +3,7 @@ AGENT_SYSTEM_PROMPT = """
 
 # 可用工具:
 - `get_weather(city: str)`: 查询指定城市的实时天气。
-- `get_attraction(city: str, weather: str)`: 根据城市和天气搜索推荐的旅游景点。
+- `get_attraction(city: str, weather: str = "")`: 根据城市和天气搜索推荐的旅游景点；省略 weather 时自动使用该城市最近查询到的天气。
 
 # 行动格式:
 你的回答必须严格遵循以下格式。首先是你的思考过程，然后是你要执行的具体行动，每次回复只输出一对Thought-Action：
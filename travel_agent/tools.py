@@ -1,12 +1,30 @@
 from common.available_tools import ToolExecutor
+from common.prefetch import ToolPrefetcher, follow_up
 
-from .get_attraction import get_attraction
-from .get_weather import get_weather
+from .get_attraction import aget_attraction, get_attraction
+from .get_weather import aget_weather, get_weather
 
 available_tools = {
     "get_weather": get_weather,
     "get_attraction": get_attraction,
 }
 
-tool_executor = ToolExecutor(available_tools)
+# 异步实现: 在事件循环中通过 aexecute 调用时使用，不占用线程
+async_tools = {
+    "get_weather": aget_weather,
+    "get_attraction": aget_attraction,
+}
+
+tool_executor = ToolExecutor(available_tools, default_timeout=30, async_tools=async_tools)
+
 
+def create_travel_prefetcher(executor: ToolExecutor = tool_executor) -> ToolPrefetcher:
+    """
+    旅行智能体的预取器: 模型查询某城市天气时，同时预取该城市的景点。
+    预取的景点搜索不带 weather 参数，会复用同一次天气查询的结果，因此只按 city 匹配。
+    """
+    return ToolPrefetcher(
+        executor,
+        [follow_up("get_weather", "get_attraction", {"city": "city"})],
+        match_args={"get_attraction": ("city",)},
+    )